@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import mmap
+import multiprocessing
+import os
+import platform
+import resource
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from synth_pcap import ensure_capture, parse_count
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DATA_DIR = os.path.join(ROOT, 'benchmarks', 'data')
+DEFAULT_SIZES = ['10k', '1M', '10M']
+# Synthetic captures are little-endian microsecond pcap over Ethernet
+PCAP_RECORD = struct.Struct('<IIII')
+ETHERNET_HEADER_LEN = 14
+# Records handed to CaptureStats at once, about what one ring block holds
+RING_BATCH = 1024
+
+
+def analyse_native(pcap_file):
+    from analyse import parse_pcap
+    parse_pcap(pcap_file, backend='native')
+
+
+def analyse_cached(pcap_file):
+    from analyse import parse_pcap
+    parse_pcap(pcap_file, backend='native', cache_options={'use_cache': True})
+
+
+def analyse_sharded(pcap_file):
+    from analyse import parse_pcap
+    parse_pcap(pcap_file, backend='native', cache_options={'use_cache': True}, workers=os.cpu_count())
+
+
+def analyse_pyshark(pcap_file):
+    from analyse import parse_pcap
+    parse_pcap(pcap_file, backend='pyshark')
+
+
+def columns_decode(pcap_file):
+    from pcap_columns import read_tcp_columns
+    read_tcp_columns(pcap_file, with_window_scales=True)
+
+
+def columns_parallel(pcap_file):
+    from pcap_columns import read_tcp_columns
+    read_tcp_columns(pcap_file, with_window_scales=True, workers=os.cpu_count())
+
+
+def sequence_tracking(pcap_file):
+    from pcap_columns import read_tcp_columns
+    from seq_tracker import track_segments
+    track_segments(read_tcp_columns(pcap_file))
+
+
+def plot_graphs(pcap_file):
+    import matplotlib
+    matplotlib.use('Agg')
+    from plot_graphs import render_capture
+    with tempfile.TemporaryDirectory() as outdir:
+        render_capture(pcap_file, outdir, [5001, 5002, 5003], 1.0, {'use_cache': False})
+
+
+def tcp_conn_pyshark(pcap_file):
+    import pyshark
+    from tcp_conn import CaptureStats, evaluate_capture, TSHARK_PREFS
+    stats = CaptureStats()
+    capture = pyshark.FileCapture(pcap_file, override_prefs=TSHARK_PREFS)
+    try:
+        for pkt in capture:
+            stats.update(pkt)
+    finally:
+        capture.close()
+    evaluate_capture(stats)
+
+
+def tcp_conn_native(pcap_file):
+    # What the ring capture does with each block: decode the headers,
+    # count them with CaptureStats.record_batch, evaluate at the end.
+    from ring_capture import RingCapture
+    from tcp_conn import CaptureStats, evaluate_capture
+    stats = CaptureStats()
+    with open(pcap_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        records = []
+        pos = 24
+        while pos + PCAP_RECORD.size <= len(data):
+            sec, usec, caplen, _ = PCAP_RECORD.unpack_from(data, pos)
+            pos += PCAP_RECORD.size
+            records.append(RingCapture.decode(data, pos + ETHERNET_HEADER_LEN, caplen - ETHERNET_HEADER_LEN,
+                                              sec + usec / 1e6))
+            pos += caplen
+            if len(records) == RING_BATCH:
+                stats.record_batch(records)
+                records = []
+        if records:
+            stats.record_batch(records)
+    evaluate_capture(stats)
+
+
+# name -> (function, source directory, profiles it runs on, warm-up run first, on by default)
+BACKENDS = {
+    'analyse_native': (analyse_native, 'problem2', ['synflood'], False, True),
+    'analyse_cached': (analyse_cached, 'problem2', ['synflood'], True, True),
+    'analyse_sharded': (analyse_sharded, 'problem2', ['synflood'], True, True),
+    'analyse_pyshark': (analyse_pyshark, 'problem2', ['synflood'], False, False),
+    'columns_decode': (columns_decode, 'problem1', ['bulk'], False, True),
+    'columns_parallel': (columns_parallel, 'problem1', ['bulk'], False, True),
+    'sequence_tracking': (sequence_tracking, 'problem1', ['bulk'], False, True),
+    'plot_graphs': (plot_graphs, 'problem1', ['bulk'], False, True),
+    'tcp_conn_native': (tcp_conn_native, 'problem3', ['nagle'], False, True),
+    'tcp_conn_pyshark': (tcp_conn_pyshark, 'problem3', ['nagle'], False, False),
+}
+
+
+def run_case(backend, pcap_file):
+    # Runs in a fresh process: problem1 and problem2 both have a
+    # capture_cache module, and peak RSS must not carry over between cases.
+    function, source_dir, _, warm_up, _ = BACKENDS[backend]
+    sys.path.insert(0, os.path.join(ROOT, source_dir))
+    try:
+        if warm_up:
+            function(pcap_file)
+        start = time.perf_counter()
+        function(pcap_file)
+        elapsed = time.perf_counter() - start
+    except ImportError as err:
+        return {'skipped': f'missing dependency: {err.name}'}
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {'seconds': elapsed, 'peak_rss_mb': max(own, children) / 1024}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def previous_result(history, case):
+    for run in reversed(history):
+        for result in run['results']:
+            if all(result.get(k) == case[k] for k in ('backend', 'profile', 'packets')) and 'seconds' in result:
+                return run, result
+    return None, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the capture analysis pipelines on synthetic captures")
+    parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES,
+                        help='Capture sizes in packets, e.g. 10k 1M 10M.')
+    parser.add_argument('--backends', nargs='+', choices=sorted(BACKENDS), default=None,
+                        help='Backends to run (default: all that need no pyshark/tshark).')
+    parser.add_argument('--profiles', nargs='+', default=None,
+                        help='Restrict to these traffic profiles (synflood, bulk, nagle).')
+    parser.add_argument('--data_dir', default=DEFAULT_DATA_DIR,
+                        help='Where generated captures are kept between runs.')
+    parser.add_argument('--history', default=None,
+                        help='JSON file that each run is appended to (default: history.json in --data_dir).')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--label', default='',
+                        help='Free-form note stored with this run.')
+    args = parser.parse_args()
+    # Kept beside the captures it was measured on, outside version control
+    if args.history is None:
+        args.history = os.path.join(args.data_dir, 'history.json')
+
+    backends = args.backends or [name for name, spec in BACKENDS.items() if spec[4]]
+    sizes = [parse_count(size) for size in args.sizes]
+    history = load_history(args.history)
+    results = []
+    spawn = multiprocessing.get_context('spawn')
+
+    for packets in sizes:
+        for backend in backends:
+            for profile in BACKENDS[backend][2]:
+                if args.profiles and profile not in args.profiles:
+                    continue
+                pcap_file = ensure_capture(args.data_dir, profile, packets, args.seed)
+                with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+                    outcome = pool.submit(run_case, backend, pcap_file).result()
+                case = dict(backend=backend, profile=profile, packets=packets, **outcome)
+                if 'seconds' in outcome:
+                    case['packets_per_s'] = packets / outcome['seconds']
+                    run, before = previous_result(history, case)
+                    change = ''
+                    if before:
+                        change = f" ({(outcome['seconds'] / before['seconds'] - 1) * 100:+.1f}% vs {run['revision']})"
+                    print(f"{backend:18} {profile:9} {packets:>10} {outcome['seconds']:9.3f}s "
+                          f"{case['packets_per_s']:>12.0f} pkt/s {outcome['peak_rss_mb']:8.1f} MB{change}")
+                else:
+                    print(f"{backend:18} {profile:9} {packets:>10} skipped: {outcome['skipped']}")
+                results.append(case)
+
+    history.append({
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'revision': git_revision(),
+        'label': args.label,
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'results': results,
+    })
+    os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+    with open(args.history, 'w') as f:
+        json.dump(history, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
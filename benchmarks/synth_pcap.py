@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+
+import argparse
+import os
+import struct
+
+import numpy as np
+
+# Every record is Ethernet + IPv4 + a 24-byte TCP header (NOP padding, or
+# NOP + window scale on SYNs), captured with a snaplen that stops at the TCP
+# header. Lengths in the IP header still describe the full segment, which is
+# all the analysis reads, and the fixed record size lets a chunk of packets be
+# written as one structured array.
+SNAPLEN = 14 + 20 + 24
+PCAP_HEADER = struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, SNAPLEN, 1)
+
+RECORD_DTYPE = np.dtype([
+    ('ts_sec', '<u4'), ('ts_usec', '<u4'), ('caplen', '<u4'), ('wirelen', '<u4'),
+    ('eth_dst', 'V6'), ('eth_src', 'V6'), ('ethertype', '>u2'),
+    ('ver_ihl', 'u1'), ('tos', 'u1'), ('tot_len', '>u2'), ('ip_id', '>u2'), ('frag', '>u2'),
+    ('ttl', 'u1'), ('proto', 'u1'), ('ip_csum', '>u2'), ('src', '>u4'), ('dst', '>u4'),
+    ('sport', '>u2'), ('dport', '>u2'), ('seq', '>u4'), ('ack', '>u4'),
+    ('data_off', 'u1'), ('flags', 'u1'), ('window', '>u2'), ('tcp_csum', '>u2'), ('urgent', '>u2'),
+    ('options', '>u4'),
+])
+
+FIN, SYN, RST, PSH, ACK = 0x01, 0x02, 0x04, 0x08, 0x10
+OPT_NOP = 0x01010101
+OPT_WSCALE_7 = 0x01030307
+
+CHUNK_PACKETS = 1 << 20
+
+
+def ip(a, b, c, d):
+    return (a << 24) | (b << 16) | (c << 8) | d
+
+
+def packets_array(fields):
+    n = len(fields['ts'])
+    rec = np.zeros(n, dtype=RECORD_DTYPE)
+    ts_us = np.round(fields['ts'] * 1e6).astype(np.int64)
+    rec['ts_sec'] = ts_us // 1000000
+    rec['ts_usec'] = ts_us % 1000000
+    rec['caplen'] = SNAPLEN
+    rec['wirelen'] = 14 + 20 + 24 + fields['payload']
+    rec['ethertype'] = 0x0800
+    rec['ver_ihl'] = 0x45
+    rec['tot_len'] = 20 + 24 + fields['payload']
+    rec['ttl'] = 64
+    rec['proto'] = 6
+    for name in ('src', 'dst', 'sport', 'dport', 'seq', 'ack', 'flags', 'window'):
+        rec[name] = fields[name]
+    rec['data_off'] = 6 << 4
+    rec['options'] = np.where((fields['flags'] & SYN) != 0, OPT_WSCALE_7, OPT_NOP)
+    return rec
+
+
+def assemble(slots, units):
+    # `slots` lists the packets of one unit, each a dict of per-unit arrays
+    # (or scalars). Packets are interleaved unit by unit and then ordered by
+    # time within the chunk.
+    fields = {}
+    for name in ('ts', 'src', 'dst', 'sport', 'dport', 'seq', 'ack', 'flags', 'window', 'payload'):
+        columns = [np.broadcast_to(np.asarray(slot[name]), (units,)) for slot in slots]
+        fields[name] = np.stack(columns, axis=1).ravel()
+    order = np.argsort(fields['ts'], kind='stable')
+    return {name: values[order] for name, values in fields.items()}
+
+
+def synflood_chunk(rng, first, units):
+    # One unit = one legitimate client.py session (handshake, "Hello",
+    # server reply, FIN exchange) started every 50 ms, plus six spoofed SYNs
+    # answered by the server's SYN-ACK.
+    server, port = ip(172, 21, 124, 53), 12345
+    start = (first + np.arange(units)) * 0.05
+    client = rng.integers(ip(11, 0, 0, 1), ip(223, 255, 255, 254), units, dtype=np.uint32)
+    sport = rng.integers(1024, 65536, units, dtype=np.uint32)
+    iss = rng.integers(0, 1 << 32, units, dtype=np.uint64)
+    rtt = rng.uniform(0.0005, 0.002, units)
+    c_seq, s_seq = 1000, iss
+
+    slots = [
+        dict(ts=start, src=client, dst=server, sport=sport, dport=port, seq=c_seq, ack=0,
+             flags=SYN, window=8192, payload=0),
+        dict(ts=start + rtt / 2, src=server, dst=client, sport=port, dport=sport, seq=s_seq, ack=c_seq + 1,
+             flags=SYN | ACK, window=65160, payload=0),
+        dict(ts=start + rtt, src=client, dst=server, sport=sport, dport=port, seq=c_seq + 1, ack=s_seq + 1,
+             flags=ACK, window=8192, payload=0),
+        dict(ts=start + rtt + 1e-5, src=client, dst=server, sport=sport, dport=port, seq=c_seq + 1,
+             ack=s_seq + 1, flags=PSH | ACK, window=8192, payload=5),
+        dict(ts=start + 1.5 * rtt, src=server, dst=client, sport=port, dport=sport, seq=s_seq + 1,
+             ack=c_seq + 6, flags=PSH | ACK, window=65160, payload=18),
+        dict(ts=start + 1.5 * rtt + 1e-5, src=server, dst=client, sport=port, dport=sport, seq=s_seq + 19,
+             ack=c_seq + 6, flags=FIN | ACK, window=65160, payload=0),
+        dict(ts=start + 2 * rtt, src=client, dst=server, sport=sport, dport=port, seq=c_seq + 6,
+             ack=s_seq + 20, flags=FIN | ACK, window=8192, payload=0),
+        dict(ts=start + 2.5 * rtt, src=server, dst=client, sport=port, dport=sport, seq=s_seq + 20,
+             ack=c_seq + 7, flags=ACK, window=65160, payload=0),
+    ]
+    for _ in range(6):
+        at = start + rng.uniform(0, 0.0499, units)
+        spoofed = rng.integers(ip(11, 0, 0, 1), ip(223, 255, 255, 254), units, dtype=np.uint32)
+        spoofed_port = rng.integers(1024, 65536, units, dtype=np.uint32)
+        synack_seq = rng.integers(0, 1 << 32, units, dtype=np.uint64)
+        slots.append(dict(ts=at, src=spoofed, dst=server, sport=spoofed_port, dport=port, seq=1000, ack=0,
+                          flags=SYN, window=8192, payload=0))
+        slots.append(dict(ts=at + 2e-5, src=server, dst=spoofed, sport=port, dport=spoofed_port,
+                          seq=synack_seq, ack=1001, flags=SYN | ACK, window=65160, payload=0))
+    return assemble(slots, units)
+
+
+def bulk_chunk(rng, first, units):
+    # One unit = one round of 30 iperf3 streams (h1, h3, h4 x 10 parallel, as
+    # in ccComparisons.py option b) each sending two 1448-byte segments and
+    # getting one ACK back; about 1% of rounds resend an earlier segment.
+    server = ip(10, 0, 0, 7)
+    senders = np.repeat([ip(10, 0, 0, 1), ip(10, 0, 0, 3), ip(10, 0, 0, 4)], 10).astype(np.uint32)
+    ports = np.repeat([5001, 5002, 5003], 10).astype(np.uint32)
+    sports = (40000 + np.arange(30)).astype(np.uint32)
+    mss = 1448
+    flows = len(senders)
+
+    rounds = first + np.arange(units)
+    # 30 flows x 2 segments x 1448 B per 9.3 ms is about 75 Mbit/s
+    start = np.repeat(rounds * 0.0093, flows) + np.tile(np.arange(flows) * 0.0002, units)
+    src = np.tile(senders, units)
+    dport = np.tile(ports, units)
+    sport = np.tile(sports, units)
+    seq = 1 + np.repeat(rounds, flows).astype(np.uint64) * (2 * mss)
+    resend = rng.random(units * flows) < 0.01
+    seq2 = np.where(resend & (seq > 2 * mss), seq - 2 * mss, seq + mss)
+    jitter = rng.uniform(0, 0.0002, units * flows)
+
+    slots = [
+        dict(ts=start, src=src, dst=server, sport=sport, dport=dport, seq=seq, ack=1,
+             flags=ACK, window=502, payload=mss),
+        dict(ts=start + 1e-4, src=src, dst=server, sport=sport, dport=dport, seq=seq2, ack=1,
+             flags=PSH | ACK, window=502, payload=mss),
+        dict(ts=start + 1e-4 + jitter + 0.002, src=server, dst=src, sport=dport, dport=sport, seq=1,
+             ack=seq + 2 * mss, flags=ACK, window=3000, payload=0),
+    ]
+    fields = assemble(slots, units * flows)
+    if first == 0:
+        fields = prepend_handshakes(fields, senders, server, sports, ports)
+    return fields
+
+
+def prepend_handshakes(fields, senders, server, sports, ports):
+    n = len(senders)
+    syn_ts = -0.01 + np.arange(n) * 1e-5
+    hand = {
+        'ts': np.concatenate([syn_ts, syn_ts + 0.002, syn_ts + 0.004]),
+        'src': np.concatenate([senders, np.full(n, server), senders]),
+        'dst': np.concatenate([np.full(n, server), senders, np.full(n, server)]),
+        'sport': np.concatenate([sports, ports, sports]),
+        'dport': np.concatenate([ports, sports, ports]),
+        'seq': np.concatenate([np.zeros(n), np.zeros(n), np.ones(n)]).astype(np.uint64),
+        'ack': np.concatenate([np.zeros(n), np.ones(n), np.ones(n)]).astype(np.uint64),
+        'flags': np.concatenate([np.full(n, SYN), np.full(n, SYN | ACK), np.full(n, ACK)]),
+        'window': np.concatenate([np.full(n, 64240), np.full(n, 65160), np.full(n, 502)]),
+        'payload': np.zeros(3 * n, dtype=np.int64),
+    }
+    order = np.argsort(hand['ts'], kind='stable')
+    return {name: np.concatenate([hand[name][order], fields[name]]) for name in fields}
+
+
+def nagle_chunk(rng, first, units):
+    # One unit = two 40-byte writes from the tcp_conn.py client on loopback
+    # and a single delayed ACK covering both.
+    host, port, sport = ip(127, 0, 0, 1), 12345, 50000
+    writes = first + np.arange(units)
+    start = writes * 0.04
+    seq = 1 + writes.astype(np.uint64) * 80
+    slots = [
+        dict(ts=start, src=host, dst=host, sport=sport, dport=port, seq=seq, ack=1,
+             flags=PSH | ACK, window=512, payload=40),
+        dict(ts=start + 0.0001, src=host, dst=host, sport=sport, dport=port, seq=seq + 40, ack=1,
+             flags=PSH | ACK, window=512, payload=40),
+        dict(ts=start + 0.0001 + rng.uniform(0.0001, 0.039, units), src=host, dst=host, sport=port,
+             dport=sport, seq=1, ack=seq + 80, flags=ACK, window=512, payload=0),
+    ]
+    return assemble(slots, units)
+
+
+# Generator and packets produced per unit
+PROFILES = {
+    'synflood': (synflood_chunk, 20),
+    'bulk': (bulk_chunk, 90),
+    'nagle': (nagle_chunk, 3),
+}
+
+
+def write_capture(path, profile, packets, seed=0):
+    generate, per_unit = PROFILES[profile]
+    units_needed = -(-packets // per_unit)
+    chunk_units = max(1, CHUNK_PACKETS // per_unit)
+    written = 0
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(PCAP_HEADER)
+        first = 0
+        while written < packets:
+            units = min(chunk_units, units_needed - first)
+            # Seeding per chunk keeps a capture identical however it is chunked
+            rng = np.random.default_rng([seed, first])
+            fields = generate(rng, first, units)
+            for name in ('seq', 'ack'):
+                fields[name] = (fields[name].astype(np.uint64) & 0xffffffff)
+            fields['ts'] = fields['ts'] + 1.7e9
+            records = packets_array(fields)[:packets - written]
+            records.tofile(f)
+            written += len(records)
+            first += units
+    os.replace(tmp_path, path)
+    return written
+
+
+def capture_path(data_dir, profile, packets, seed=0):
+    return os.path.join(data_dir, f'{profile}_{packets}_s{seed}.pcap')
+
+
+def ensure_capture(data_dir, profile, packets, seed=0):
+    path = capture_path(data_dir, profile, packets, seed)
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        write_capture(path, profile, packets, seed)
+    return path
+
+
+def parse_count(text):
+    suffixes = {'k': 10 ** 3, 'M': 10 ** 6, 'G': 10 ** 9}
+    if text[-1] in suffixes:
+        return int(float(text[:-1]) * suffixes[text[-1]])
+    return int(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a deterministic synthetic TCP capture")
+    parser.add_argument('profile', choices=sorted(PROFILES))
+    parser.add_argument('packets', type=parse_count, help='Packet count, e.g. 10k, 1M, 10M.')
+    parser.add_argument('--output', default=None,
+                        help='Output file (default: <profile>_<packets>_s<seed>.pcap in the current directory).')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    path = args.output or capture_path('.', args.profile, args.packets, args.seed)
+    count = write_capture(path, args.profile, args.packets, args.seed)
+    print(f"Wrote {count} packets to {path}")
+
+
+if __name__ == '__main__':
+    main()
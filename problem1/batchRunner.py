@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+
+from scenarios import demand_mbit, load_scenarios
+
+# Rough CPU cost of one emulated topology: OVS datapath plus iperf3/tcpdump
+CORES_PER_RUN = 2
+BASE_CONTROLLER_PORT = 6653
+POLL_INTERVAL = 1.0
+
+
+def load_matrix(path):
+    with open(path) as f:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                sys.exit("PyYAML is required for YAML matrices; use a .json file instead.")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def expand_matrix(matrix):
+    runs = []
+    for option, cc in itertools.product(matrix['options'], matrix['cc']):
+        # Loss only changes the topology for option (d)
+        losses = matrix.get('loss', [0.0]) if option.startswith('d') else [0.0]
+        for loss in losses:
+            runs.append({'option': option, 'cc': cc, 'loss': float(loss)})
+    return runs
+
+
+def option_demands(extra_args):
+    # Offered load of each option in Mbit/s, from its iperf3 rates and stream
+    # counts; a --scenario_file handed through to ccComparisons.py adds its
+    # scenarios here as well.
+    scenario_parser = argparse.ArgumentParser(add_help=False)
+    scenario_parser.add_argument('--scenario_file', default=None)
+    scenario_file = scenario_parser.parse_known_args(extra_args)[0].scenario_file
+    return {name: demand_mbit(scenario) for name, scenario in load_scenarios(scenario_file).items()}
+
+
+def run_name(run):
+    name = f"{run['option'].replace('.', '')}_{run['cc']}"
+    if run['option'].startswith('d'):
+        name += f"_{run['loss']:g}"
+    return name
+
+
+def start_run(run, index, outdir, extra_args):
+    run_dir = os.path.join(outdir, run_name(run))
+    os.makedirs(run_dir, exist_ok=True)
+    cmd = [
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ccComparisons.py'),
+        '--option', run['option'],
+        '--cc', run['cc'],
+        '--loss', str(run['loss']),
+        '--outdir', run_dir,
+        '--prefix', f'r{index}',
+        # Standalone runs use run index 0, so matrix runs start at 1
+        '--run_index', str(index + 1),
+        '--controller_port', str(BASE_CONTROLLER_PORT + index),
+        '--no_cli',
+    ] + extra_args
+    log = open(os.path.join(run_dir, 'run.log'), 'w')
+    proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL)
+    print(f"[+] r{index} {run_name(run)} started (pid {proc.pid})")
+    return proc, log
+
+
+def run_matrix(runs, outdir, max_parallel, bandwidth_budget, demands, extra_args):
+    pending = list(enumerate(runs))
+    running = {}
+    results = []
+    while pending or running:
+        load = sum(demands[run['option']] for run, _, _, _ in running.values())
+        # Keep launching while cores and emulated bandwidth allow; an idle
+        # runner always takes the next run so an oversized one cannot stall.
+        while pending and len(running) < max_parallel:
+            index, run = pending[0]
+            demand = demands[run['option']]
+            if running and load + demand > bandwidth_budget:
+                break
+            pending.pop(0)
+            proc, log = start_run(run, index, outdir, extra_args)
+            running[index] = (run, proc, log, time.monotonic())
+            load += demand
+
+        time.sleep(POLL_INTERVAL)
+        for index, (run, proc, log, started) in list(running.items()):
+            if proc.poll() is None:
+                continue
+            log.close()
+            del running[index]
+            elapsed = time.monotonic() - started
+            status = 'ok' if proc.returncode == 0 else f'failed ({proc.returncode})'
+            print(f"[-] r{index} {run_name(run)} {status} after {elapsed:.0f}s")
+            results.append(dict(run, name=run_name(run), returncode=proc.returncode, elapsed=elapsed,
+                                **run_validity(os.path.join(outdir, run_name(run)))))
+            if results[-1]['problems']:
+                print(f"    r{index} flagged invalid: {', '.join(results[-1]['problems'])}")
+    return results
+
+
+def run_validity(run_dir):
+    # ccComparisons.py flags runs the emulation host did not keep up with;
+    # concurrent runs share its CPUs, so this is where it shows first.
+    try:
+        with open(os.path.join(run_dir, 'run_metrics.json')) as f:
+            metrics = json.load(f)
+    except (OSError, ValueError):
+        return {'valid': None, 'problems': []}
+    return {'valid': metrics['valid'], 'problems': metrics['problems']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a matrix of ccComparisons.py experiments concurrently")
+    parser.add_argument('matrix', help='JSON or YAML file with options, cc and loss lists.')
+    parser.add_argument('--outdir', type=str, default=None,
+                        help='Root directory for per-run captures and logs (overrides the matrix file).')
+    parser.add_argument('--max_parallel', type=int, default=None,
+                        help=f'Concurrent experiments (default: cores / {CORES_PER_RUN}).')
+    parser.add_argument('--bandwidth_budget', type=float, default=None,
+                        help='Total offered load in Mbit/s that concurrent runs may add up to.')
+    args, extra_args = parser.parse_known_args()
+
+    matrix = load_matrix(args.matrix)
+    outdir = args.outdir or matrix.get('outdir', '/tmp/cc_matrix')
+    max_parallel = args.max_parallel or matrix.get('max_parallel') or max(1, os.cpu_count() // CORES_PER_RUN)
+    bandwidth_budget = args.bandwidth_budget or matrix.get('bandwidth_budget', 1000)
+
+    runs = expand_matrix(matrix)
+    try:
+        demands = option_demands(extra_args)
+    except (OSError, ValueError, KeyError) as err:
+        parser.error(f"cannot load the scenarios: {err}")
+    unknown = sorted({run['option'] for run in runs} - set(demands))
+    if unknown:
+        parser.error(f"unknown option(s) {', '.join(unknown)}; add them with --scenario_file")
+    print(f"*** {len(runs)} experiments, up to {max_parallel} at a time, {bandwidth_budget:g} Mbit/s budget")
+    os.makedirs(outdir, exist_ok=True)
+    results = run_matrix(runs, outdir, max_parallel, bandwidth_budget, demands, extra_args)
+
+    with open(os.path.join(outdir, 'summary.json'), 'w') as f:
+        json.dump(results, f, indent=2)
+    failed = [r['name'] for r in results if r['returncode'] != 0]
+    invalid = [r['name'] for r in results if r['valid'] is False]
+    print(f"*** {len(results) - len(failed)} succeeded, {len(failed)} failed {failed if failed else ''}")
+    if invalid:
+        print(f"*** {len(invalid)} flagged invalid by the emulation host checks: {invalid}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
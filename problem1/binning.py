@@ -0,0 +1,59 @@
+import numpy as np
+
+from seq_tracker import flow_ids, track_segments
+
+BASE_WIDTH = 0.01
+LEVEL_FACTORS = (10, 10, 10)
+
+
+class RatePyramid:
+    # Per-flow byte sums at BASE_WIDTH and at each coarser level, so any bin
+    # width that is a multiple of BASE_WIDTH is a reduceat over existing bins
+    # instead of another pass over the packets.
+
+    def __init__(self, t0, flows, levels):
+        self.t0 = t0
+        self.flows = flows
+        self.levels = levels
+
+    @classmethod
+    def build(cls, packets, base_width=BASE_WIDTH, factors=LEVEL_FACTORS):
+        flows, ids = flow_ids(packets)
+        t0 = packets['ts'].min()
+        bins = int((packets['ts'].max() - t0) / base_width) + 1
+        cells = ids.astype(np.int64) * bins + ((packets['ts'] - t0) / base_width).astype(np.int64)
+        # Goodput counts each payload byte once, when the capture first sees it
+        goodput_bytes = track_segments(packets)['new_bytes']
+
+        base = {
+            'ip_len': np.bincount(cells, weights=packets['ip_len'], minlength=len(flows) * bins),
+            'payload': np.bincount(cells, weights=goodput_bytes, minlength=len(flows) * bins),
+        }
+        levels = [(base_width, {m: v.reshape(len(flows), bins) for m, v in base.items()})]
+        for factor in factors:
+            width, sums = levels[-1]
+            levels.append((width * factor, {m: coarsen(v, factor) for m, v in sums.items()}))
+        return cls(t0, flows, levels)
+
+    def level_for(self, width):
+        # Coarsest stored level whose bin width divides the requested one
+        for level_width, sums in reversed(self.levels):
+            ratio = width / level_width
+            if ratio >= 1 and abs(ratio - round(ratio)) < 1e-6:
+                return level_width, int(round(ratio)), sums
+        raise ValueError(f"Bin width {width}s is not a multiple of {self.levels[0][0]}s")
+
+    def series(self, width, metric, flow_mask=None):
+        level_width, ratio, sums = self.level_for(width)
+        values = sums[metric] if flow_mask is None else sums[metric][flow_mask]
+        if ratio > 1:
+            values = np.add.reduceat(values, np.arange(0, values.shape[1], ratio), axis=1)
+        times = np.arange(values.shape[1]) * width
+        return times, values * 8 / width / 1e6
+
+
+def coarsen(values, factor):
+    flows, bins = values.shape
+    padded = np.zeros((flows, -(-bins // factor) * factor))
+    padded[:, :bins] = values
+    return padded.reshape(flows, -1, factor).sum(axis=2)
@@ -0,0 +1,113 @@
+import hashlib
+import os
+
+import numpy as np
+
+from pcap_columns import capture_parts, read_tcp_columns, EXTRACTOR_VERSION, PACKET_DTYPE
+
+CACHE_DIR_NAME = '.pcap_cache'
+DEFAULT_CACHE_MAX_BYTES = 2 << 30
+SAMPLE_BLOCK = 1 << 20
+SAMPLE_COUNT = 16
+
+
+def content_digest(pcap_file, size):
+    # Hashing a handful of evenly spaced blocks keeps the key cheap for
+    # multi-gigabyte captures while still catching rewritten files.
+    h = hashlib.blake2b(digest_size=16)
+    with open(pcap_file, 'rb') as f:
+        if size <= SAMPLE_BLOCK * SAMPLE_COUNT:
+            h.update(f.read())
+        else:
+            step = (size - SAMPLE_BLOCK) // (SAMPLE_COUNT - 1)
+            for i in range(SAMPLE_COUNT):
+                f.seek(i * step)
+                h.update(f.read(SAMPLE_BLOCK))
+    return h.hexdigest()
+
+
+def cache_key(pcap_file):
+    st = os.stat(pcap_file)
+    h = hashlib.blake2b(digest_size=10)
+    h.update(f"v{EXTRACTOR_VERSION}:{st.st_size}:{st.st_mtime_ns}:".encode())
+    h.update(content_digest(pcap_file, st.st_size).encode())
+    return h.hexdigest()
+
+
+def cache_path(pcap_file):
+    directory = os.path.join(os.path.dirname(os.path.abspath(pcap_file)), CACHE_DIR_NAME)
+    stem = os.path.basename(pcap_file)
+    return os.path.join(directory, f"{stem}.{cache_key(pcap_file)}.npz")
+
+
+def evict_lru(directory, max_bytes, keep=None):
+    entries = []
+    for name in os.listdir(directory):
+        if name.endswith('.npz'):
+            path = os.path.join(directory, name)
+            st = os.stat(path)
+            entries.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        os.remove(path)
+        total -= size
+
+
+def save_columns(path, packets, scales):
+    keys = np.array(list(scales.keys()), dtype=np.uint32).reshape(-1, 2)
+    values = np.array(list(scales.values()), dtype=np.uint8)
+    tmp_path = path + '.tmp.npz'
+    np.savez_compressed(tmp_path, packets=packets, scale_keys=keys, scale_values=values)
+    os.replace(tmp_path, path)
+
+
+def load_columns(path):
+    with np.load(path) as cached:
+        packets = cached['packets']
+        scales = {(int(ip), int(port)): int(shift)
+                  for (ip, port), shift in zip(cached['scale_keys'], cached['scale_values'])}
+    # Touch on every hit so eviction order follows last use
+    os.utime(path)
+    return packets, scales
+
+
+def load_tcp_columns(pcap_file, use_cache=True, rebuild=False, max_bytes=DEFAULT_CACHE_MAX_BYTES, workers=1):
+    if not use_cache:
+        return read_tcp_columns(pcap_file, with_window_scales=True, workers=workers)
+
+    path = cache_path(pcap_file)
+    if not rebuild and os.path.exists(path):
+        return load_columns(path)
+
+    packets, scales = read_tcp_columns(pcap_file, with_window_scales=True, workers=workers)
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        save_columns(path, packets, scales)
+        # Extractions of earlier versions of this capture can never hit again
+        prefix = os.path.basename(pcap_file) + '.'
+        for name in os.listdir(directory):
+            stale = os.path.join(directory, name)
+            if name.startswith(prefix) and name.count('.') == prefix.count('.') + 1 and stale != path:
+                os.remove(stale)
+        evict_lru(directory, max_bytes, keep=path)
+    except OSError as err:
+        print(f"Could not write capture cache {path}: {err}")
+    return packets, scales
+
+
+def load_capture_columns(pcap_file, **options):
+    # Rotated captures are decoded (and cached) part by part and joined in
+    # capture order.
+    packets = []
+    scales = {}
+    for part in capture_parts(pcap_file):
+        part_packets, part_scales = load_tcp_columns(part, **options)
+        packets.append(part_packets)
+        scales.update(part_scales)
+    packets = np.concatenate(packets) if packets else np.empty(0, dtype=PACKET_DTYPE)
+    return packets, scales
@@ -1,8 +1,13 @@
 #!/usr/bin/env python
 
 import argparse
+import glob
+import json
 import time
 import os
+import re
+import sys
+from functools import partial
 
 from mininet.net import Mininet
 from mininet.node import OVSController
@@ -11,24 +16,67 @@ from mininet.topo import Topo
 from mininet.cli import CLI
 from mininet.log import setLogLevel, info
 
+from run_metrics import CommandTimes, RunMetrics, read_capture_stats
+from scenarios import (SWITCH_LINKS, flow_ports, flow_spec, load_scenarios, parse_link_params, port_filter,
+                       sender_hosts, server_host)
+
+# Seconds the capture keeps running after the last iperf3 client exits
+DRAIN_SECONDS = 2.0
+# Upper bound on any single experiment's traffic phase
+CLIENT_TIMEOUT = 600.0
+POLL_INTERVAL = 0.5
+# How often, and how long, to wait for iperf3 servers and the capture to come up
+READY_POLL = 0.05
+READY_TIMEOUT = 5.0
+
+IPERF_INTERVAL = 0.1
+# Commands a finished run must not leave behind on any host
+LEFTOVER_COMMANDS = {'iperf3', 'tcpdump', 'dumpcap'}
+QDISC_STATS = re.compile(r'Sent (\d+) bytes (\d+) pkt \(dropped (\d+), overlimits (\d+) requeues (\d+)\)\s+'
+                         r'backlog (\d+)b (\d+)p')
+SAMPLER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cwnd_sampler.py')
+QDISC_SAMPLER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'qdisc_sampler.py')
+QDISC_INTERVAL_MS = 5.0
+
+# Link header (SLL2 is the largest at 20 bytes) + IPv4 and TCP headers with
+# maximal options; the analysis reads lengths from the IP header, so payload
+# bytes never need to reach the disk.
+CAPTURE_SNAPLEN = 160
+ROTATE_FILE_MB = 100
+# 0 keeps every rotated file; a ring overwrites its oldest file once full
+ROTATE_FILES = 0
+
+# TCLink parameters that make TCIntf.config install a qdisc at all
+SHAPING_PARAMS = ('bw', 'delay', 'jitter', 'loss', 'max_queue_size')
+
+
+def switch_dpid(run_index, number):
+    return '%016x' % (run_index << 8 | number)
+
 
 class CustomTopo(Topo):
 
-    def build(self, enable_all_links=False, option='a', suboption=None, loss = 0):
-        # Create switches
-        s1 = self.addSwitch('s1')
-        s2 = self.addSwitch('s2')
-        s3 = self.addSwitch('s3')
-        s4 = self.addSwitch('s4')
+    def build(self, enable_all_links=False, links=None, prefix='', run_index=0):
+        # Node names carry an optional prefix so several instances can share
+        # the root namespace (switch ports, veth pairs) without clashing.
+        self.prefix = prefix
+
+        # Create switches. Mininet would derive the dpid from the first number
+        # in the name, which is the run's, not the switch's, once prefixed;
+        # run_index keeps datapath IDs unique across concurrent runs.
+        s1 = self.addSwitch(prefix + 's1', dpid=switch_dpid(run_index, 1))
+        s2 = self.addSwitch(prefix + 's2', dpid=switch_dpid(run_index, 2))
+        s3 = self.addSwitch(prefix + 's3', dpid=switch_dpid(run_index, 3))
+        s4 = self.addSwitch(prefix + 's4', dpid=switch_dpid(run_index, 4))
 
         # Create hosts
-        h1 = self.addHost('h1')
-        h2 = self.addHost('h2')
-        h3 = self.addHost('h3')
-        h4 = self.addHost('h4')
-        h5 = self.addHost('h5')
-        h6 = self.addHost('h6')
-        h7 = self.addHost('h7')
+        h1 = self.addHost(prefix + 'h1')
+        h2 = self.addHost(prefix + 'h2')
+        h3 = self.addHost(prefix + 'h3')
+        h4 = self.addHost(prefix + 'h4')
+        h5 = self.addHost(prefix + 'h5')
+        h6 = self.addHost(prefix + 'h6')
+        h7 = self.addHost(prefix + 'h7')
 
         # Host-to-switch links (no special params by default)
         self.addLink(h1, s1)
@@ -39,29 +87,12 @@ class CustomTopo(Topo):
         self.addLink(h6, s4)
         self.addLink(h7, s4)
 
-        # Switch-to-switch links
-        #
-        # For parts (c) and (d), you can specify bandwidth, loss, etc.
-        # by passing bw=, loss=, etc. to the addLink(...) with cls=TCLink.
-        #
-        # Example default for demonstration: 100Mbps on all, 0% loss
-        match(option):
-            case 'a' | 'b':
-                self.addLink(s1, s2, cls=TCLink)
-                self.addLink(s2, s3, cls=TCLink)
-                self.addLink(s3, s4, cls=TCLink)
-            case 'c':
-                self.addLink(s1, s2, cls=TCLink, bw=100)
-                self.addLink(s2, s3, cls=TCLink, bw=50)
-                self.addLink(s3, s4, cls=TCLink, bw=100)
-            case 'd':
-                self.addLink(s1, s2, cls=TCLink, bw=100)
-                self.addLink(s2, s3, cls=TCLink, bw=50, loss=loss)
-                self.addLink(s3, s4, cls=TCLink, bw=100)
-            case _:
-                self.addLink(s1, s2, cls=TCLink)
-                self.addLink(s2, s3, cls=TCLink)
-                self.addLink(s3, s4, cls=TCLink)
+        # Switch-to-switch links, with TCLink parameters (bw, loss, delay)
+        # taken from the scenario's 'links'
+        links = links or {}
+        for name in SWITCH_LINKS:
+            a, b = name.split('-')
+            self.addLink(prefix + a, prefix + b, cls=TCLink, **links.get(name, {}))
 
         # Optionally add s4-s1 to make a square:
         if enable_all_links:
@@ -69,239 +100,417 @@ class CustomTopo(Topo):
             self.addLink(s2, s4, cls=TCLink, bw=50)  # If you want S2-S4 in certain scenarios
 
 
+def get_node(net, name):
+    return net.get(net.topo.prefix + name)
+
+
+def configure_link_status(net, src, dst, status):
+    net.configLinkStatus(net.topo.prefix + src, net.topo.prefix + dst, status)
+
+
+def start_background(host, command):
+    output = host.cmdPrint(f'{command} & echo $!')
+    return int(output.split()[-1])
+
+
+def remove_stale_log(path):
+    # iperf3 --logfile appends, so a log an earlier run left in the same
+    # outdir would end up in front of this run's JSON
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def capture_command(interface, pcap_file, opts):
+    snaplen = f' -s {opts.snaplen}' if opts.snaplen > 0 else ''
+    if opts.capture_format == 'pcapng':
+        # dumpcap writes pcapng; ring files are named <stem>_<n>_<time><ext>
+        command = f'dumpcap -q -i {interface}{snaplen} -w {pcap_file}'
+        if opts.rotate_mb > 0:
+            command += f' -b filesize:{opts.rotate_mb * 1000}'
+            if opts.rotate_files > 0:
+                command += f' -b files:{opts.rotate_files}'
+        if opts.capture_filter:
+            command += f" -f '{opts.capture_filter}'"
+        return command
+    # Rotated files are <name>00, <name>01, ...; -Z root keeps tcpdump able
+    # to open them after it would otherwise drop privileges.
+    command = f'tcpdump -i {interface}{snaplen} -w {pcap_file}'
+    if opts.rotate_mb > 0:
+        command += f' -C {opts.rotate_mb} -Z root'
+        if opts.rotate_files > 0:
+            command += f' -W {opts.rotate_files}'
+    if opts.capture_filter:
+        command += f" '{opts.capture_filter}'"
+    return command
+
+
+def capture_log(pcap_file):
+    # Outside both rotation patterns, so it is never taken for a capture part
+    return os.path.splitext(pcap_file)[0] + '.capture.log'
+
+
+def start_capture(host, interface, pcap_file, opts):
+    if opts.no_capture:
+        return None
+    # stderr is kept for the packet and drop counts printed on exit
+    command = f'{capture_command(interface, pcap_file, opts)} 2> {capture_log(pcap_file)}'
+    # Files older than this were left by an earlier run in the same outdir
+    since = time.time() - 1
+    return start_background(host, command), pcap_file, since
+
+
+def compress_capture(host, pcap_file):
+    stem, ext = os.path.splitext(pcap_file)
+    host.cmd(f'gzip -f {pcap_file} {pcap_file}[0-9]* {stem}_[0-9]*{ext} 2> /dev/null')
+
+
+def start_samplers(net, opts, scenario):
+    # One tcp_info sampler per sender host of the scenario, recording every
+    # socket towards its iperf3 server ports.
+    samplers = []
+    if opts.sample_interval_ms <= 0:
+        return samplers
+    ports = ' '.join(str(port) for port in flow_ports(scenario))
+    for name in sender_hosts(scenario):
+        host = get_node(net, name)
+        output = os.path.join(opts.outdir, f'{name}_cwnd.bin')
+        pid = start_background(host, f'{sys.executable} {SAMPLER_SCRIPT} --output {output} '
+                                     f'--ports {ports} --interval_ms {opts.sample_interval_ms}')
+        samplers.append((host, pid))
+    return samplers
+
+
+def start_qdisc_samplers(net, opts):
+    # One rtnetlink sampler per switch link, covering the qdiscs on both of
+    # its interfaces (each direction's egress queue). Switch interfaces live
+    # in the root namespace, so the sampler runs from the switch's shell.
+    samplers = []
+    if opts.qdisc_interval_ms <= 0:
+        return samplers
+    for name in opts.qdisc_links:
+        a, b = name.split('-')
+        interfaces = []
+        for link in net.linksBetween(get_node(net, a), get_node(net, b)):
+            for intf in (link.intf1, link.intf2):
+                bw = intf.params.get('bw')
+                interfaces.append(f'{intf.name}:{bw:g}' if bw else intf.name)
+        if not interfaces:
+            continue
+        switch = get_node(net, a)
+        output = os.path.join(opts.outdir, f'{name}_qdisc.bin')
+        pid = start_background(switch, f'{sys.executable} {QDISC_SAMPLER_SCRIPT} --output {output} '
+                                       f'--interfaces {" ".join(interfaces)} --interval_ms {opts.qdisc_interval_ms}')
+        samplers.append((switch, pid))
+    return samplers
+
+
+def stop_samplers(samplers):
+    for host, pid in samplers:
+        host.cmd(f'kill -INT {pid}')
+    for _, pid in samplers:
+        while pid_running(pid):
+            time.sleep(POLL_INTERVAL)
+
+
+def pid_running(pid):
+    # Mininet hosts share the root PID namespace; a reaped or zombie
+    # process counts as finished.
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except (FileNotFoundError, IndexError):
+        return False
+
+
+def sleep_until(deadline):
+    remaining = deadline - time.monotonic()
+    if remaining > 0:
+        time.sleep(remaining)
+
+
+def finish_run(server, capture, clients, opts, metrics, timeout=CLIENT_TIMEOUT):
+    # Returns once every iperf3 client has exited and the capture has been
+    # given `drain` seconds to see the final FIN/ACK exchange.
+    deadline = time.monotonic() + timeout
+    with metrics.phase('clients'):
+        while any(pid_running(pid) for _, pid in clients):
+            if time.monotonic() > deadline:
+                info("*** Timed out waiting for iperf3 clients, stopping them.\n")
+                metrics.invalidate('clients_timed_out')
+                for host, pid in clients:
+                    host.cmd(f'kill {pid}')
+                break
+            time.sleep(POLL_INTERVAL)
+    metrics.stop_cpu_sampling()
+    info("*** Data transmission complete.\n")
+
+    with metrics.phase('drain'):
+        time.sleep(opts.drain)
+    if capture is None:
+        return
+    # SIGINT lets tcpdump flush its buffer and write the final records
+    pid, pcap_file, since = capture
+    with metrics.phase('capture_flush'):
+        server.cmd(f'kill -INT {pid}')
+        while pid_running(pid):
+            time.sleep(POLL_INTERVAL)
+        if capture_ring_full(pcap_file, since, opts):
+            info(f"*** Capture filled all {opts.rotate_files} ring files, its start may have been overwritten.\n")
+            metrics.invalidate('capture_ring_full')
+        if opts.capture_compress:
+            compress_capture(server, pcap_file)
+    metrics.capture = read_capture_stats(capture_log(pcap_file))
+
+
 def configure_congestion_control(net, cc_algo):
     for i in range(1, 8):
-        host = net.get(f'h{i}')
+        host = get_node(net, f'h{i}')
         host.cmd(f'sysctl -w net.ipv4.tcp_congestion_control={cc_algo}')
 
 
-def run_option_a(net, cc_algo):
-    info("\n*** Running option (a): Single flow H1->H7\n")
-    server = net.get('h7')
-    client = net.get('h1')
-    server_ip = server.IP()
-    port = 5001
+def configure_intf(intf, params):
+    # TCIntf.config returns before touching tc when none of the shaping
+    # parameters is set, which would leave in place whatever qdisc an
+    # earlier event or run added; an unshaped interface gets its root
+    # qdisc deleted instead, i.e. the kernel default back.
+    intf.params = dict(params)
+    intf.config(**intf.params)
+    if not any(intf.params.get(key) for key in SHAPING_PARAMS):
+        intf.tc('%s qdisc del dev %s root')
+
+
+def reset_network(net, flush_flows=False):
+    # Puts a reused network back into its freshly built state: every link up
+    # with its build-time TCLink parameters on a new qdisc (so the counters
+    # start from zero), no cached TCP metrics (ssthresh/RTT would otherwise
+    # carry over into the next algorithm's run) and, optionally, empty flow
+    # tables so the controller relearns every path.
+    for link in net.links:
+        for intf in (link.intf1, link.intf2):
+            intf.ifconfig('up')
+            configure_intf(intf, intf.params)
+    for host in net.hosts:
+        host.cmd('ip tcp_metrics flush all')
+    if flush_flows:
+        for switch in net.switches:
+            switch.dpctl('del-flows')
+
+
+def leftover_processes(net):
+    # Background commands are children of their host's shell
+    shells = {host.pid: host for host in net.hosts}
+    found = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                head, rest = f.read().rsplit(')', 1)
+        except (FileNotFoundError, ProcessLookupError, ValueError):
+            continue
+        command = head.split('(', 1)[1]
+        state, ppid = rest.split()[:2]
+        if int(ppid) in shells and command in LEFTOVER_COMMANDS and state != 'Z':
+            found.append((shells[int(ppid)], int(entry), command))
+    return found
+
+
+def dirty_qdiscs(net):
+    # Packets sent may already tick from neighbour discovery; drops, overlimits
+    # and a backlog left from the previous run may not.
+    found = []
+    for link in net.links:
+        for intf in (link.intf1, link.intf2):
+            if not hasattr(intf, 'tc'):
+                continue
+            output = intf.tc('%s -s qdisc show dev %s')
+            for match in QDISC_STATS.finditer(output):
+                dropped, overlimits, backlog = (int(match.group(i)) for i in (3, 4, 6))
+                if dropped or overlimits or backlog:
+                    found.append(f'{intf.name}: dropped {dropped}, overlimits {overlimits}, backlog {backlog}b')
+    return found
+
+
+def check_isolation(net, opts):
+    # Leftovers are killed so they cannot disturb the run; either way the
+    # findings are kept next to the run's output.
+    leftovers = leftover_processes(net)
+    for host, pid, command in leftovers:
+        info(f"*** Killing leftover {command} (pid {pid}) on {host.name}\n")
+        host.cmd(f'kill {pid}')
+    qdiscs = dirty_qdiscs(net)
+    for problem in qdiscs:
+        info(f"*** Qdisc not reset: {problem}\n")
+    result = {
+        'cc': opts.cc,
+        'leftover_processes': [f'{host.name}:{command}:{pid}' for host, pid, command in leftovers],
+        'dirty_qdiscs': qdiscs,
+    }
+    with open(os.path.join(opts.outdir, 'isolation.json'), 'w') as f:
+        json.dump(result, f, indent=2)
+    return not leftovers and not qdiscs
+
+
+def wait_for(condition, timeout=READY_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(READY_POLL)
+    return True
+
+
+def server_listening(host, port):
+    return bool(host.cmd(f'ss -Hltn sport = :{port}').strip())
+
+
+def capture_files(pcap_file, since):
+    # The files a capture started at `since` has written so far
+    stem, ext = os.path.splitext(pcap_file)
+    parts = glob.glob(glob.escape(pcap_file) + '*') + glob.glob(glob.escape(stem) + '_*' + ext)
+    return [part for part in parts if os.path.getmtime(part) >= since]
+
+
+def capture_started(pcap_file, since):
+    # tcpdump/dumpcap create their (first) output file once the interface is open
+    return bool(capture_files(pcap_file, since))
+
+
+def capture_ring_full(pcap_file, since, opts):
+    # Once every file of the ring exists, anything captured after it filled
+    # overwrote the oldest data; the files alone cannot tell how much.
+    if opts.rotate_mb <= 0 or opts.rotate_files <= 0:
+        return False
+    return len(capture_files(pcap_file, since)) >= opts.rotate_files
+
+
+def link_params(net, src, dst):
+    return [[dict(intf.params) for intf in (link.intf1, link.intf2)]
+            for link in net.linksBetween(get_node(net, src), get_node(net, dst))]
+
+
+def set_link_params(net, src, dst, params):
+    # TCIntf.config rebuilds the qdiscs from its arguments alone, so a change
+    # is merged into the parameters the interface already has.
+    for link in net.linksBetween(get_node(net, src), get_node(net, dst)):
+        for intf in (link.intf1, link.intf2):
+            configure_intf(intf, dict(intf.params, **params))
+
+
+def apply_link_event(net, event, saved):
+    src, dst = event['link'].split('-')
+    if event['link'] not in saved:
+        saved[event['link']] = link_params(net, src, dst)
+    if 'status' in event:
+        info(f"*** Link {event['link']} {event['status']}\n")
+        configure_link_status(net, src, dst, event['status'])
+    params = {k: v for k, v in event.items() if k not in ('at', 'link', 'status')}
+    if params:
+        info(f"*** Link {event['link']} now {params}\n")
+        set_link_params(net, src, dst, params)
+
+
+def restore_links(net, saved):
+    for name, links in saved.items():
+        src, dst = name.split('-')
+        configure_link_status(net, src, dst, 'up')
+        for link, params in zip(net.linksBetween(get_node(net, src), get_node(net, dst)), links):
+            for intf, original in zip((link.intf1, link.intf2), params):
+                if intf.params != original:
+                    configure_intf(intf, original)
+
+
+def scenario_timeline(scenario):
+    # Link events sort before clients that start at the same offset, so a
+    # link taken down at t=0 is already down when the first SYN goes out.
+    actions = [(event['at'], 0, 'event', event) for event in scenario.get('events', [])]
+    actions += [(flow['start'], 1, 'flow', flow) for flow in map(flow_spec, scenario['flows'])]
+    return sorted(actions, key=lambda action: action[:2])
+
+
+def run_scenario(net, name, scenario, cc_algo, opts, metrics):
+    outdir = opts.outdir
+    info(f"\n*** Running scenario {name}\n")
+    flows = [flow_spec(flow) for flow in scenario['flows']]
+
+    # iperf3 serves one test at a time, so every port gets its own server.
+    # All of them start together; the timeline waits only until they listen.
+    # Servers log the receiver side (goodput) and clients the sender side
+    # (retransmits, snd_cwnd, rtt), each as <host>_<port>.json.
+    servers = []
+    with metrics.phase('servers_start'):
+        for server_name, port in dict.fromkeys((flow['server'], flow['port']) for flow in flows):
+            host = get_node(net, server_name)
+            log = f'{outdir}/{server_name}_{port}'
+            remove_stale_log(f'{log}.json')
+            servers.append((host, port, start_background(
+                host, f'iperf3 -s -p {port} --json --interval {opts.iperf_interval} --logfile {log}.json '
+                      f'2> {log}err.log')))
+        for host, port, _ in servers:
+            if not wait_for(partial(server_listening, host, port)):
+                info(f"*** iperf3 server on {host.name}:{port} is not listening yet, starting anyway.\n")
+
+    capture_host = get_node(net, server_host(scenario))
+    interface = scenario.get('capture_interface') or capture_host.defaultIntf()
+    pcap_file = f"{outdir}/{name.replace('.', '')}_capture_{cc_algo}.pcap"
+    with metrics.phase('capture_start'):
+        capture = start_capture(capture_host, interface, pcap_file, opts)
+        if capture is not None and not wait_for(partial(capture_started, pcap_file, capture[2])):
+            info("*** Capture has not opened its file yet, starting anyway.\n")
+
+    # Offsets are measured from one monotonic start so later actions do not
+    # drift with the time spent starting earlier ones.
+    clients = []
+    saved = {}
+    metrics.start_cpu_sampling()
+    start = time.monotonic()
+    with metrics.phase('timeline'):
+        for at, _, kind, action in scenario_timeline(scenario):
+            sleep_until(start + at)
+            if kind == 'event':
+                apply_link_event(net, action, saved)
+                continue
+            host = get_node(net, action['host'])
+            server_ip = get_node(net, action['server']).IP()
+            log = f"{outdir}/{action['host']}_{action['port']}"
+            remove_stale_log(f'{log}.json')
+            info(f"*** Starting iperf3 client on {action['host']} at t={at:g}\n")
+            clients.append((host, start_background(
+                host, f"iperf3 -c {server_ip} -p {action['port']} -b {action['rate']} -P {action['streams']} "
+                      f"-t {action['duration']:g} -C {cc_algo} --json --interval {opts.iperf_interval} "
+                      f"--logfile {log}.json 2> {log}err.log")))
+    finish_run(capture_host, capture, clients, opts, metrics)
+
+    with metrics.phase('teardown'):
+        for host, _, pid in servers:
+            host.cmd(f'kill {pid}')
+        restore_links(net, saved)
+
+
+def run_experiment(net, opts, scenario, metrics):
+    # Configure congestion control on all hosts
+    with metrics.phase('configure_cc'):
+        configure_congestion_control(net, opts.cc)
 
-    # Start iperf server in background
-    info("*** Starting iperf3 server on h7...\n")
-    server.cmdPrint(f'iperf3 -s -p {port} &')
-    server.cmdPrint(f'tcpdump -i h7-eth0 -w /tmp/a_capture_{cc_algo}.pcap &')
-    time.sleep(2)
+    with metrics.phase('samplers_start'):
+        samplers = start_samplers(net, opts, scenario) + start_qdisc_samplers(net, opts)
 
-    # Start iperf client
-    info("*** Starting iperf3 client on h1...\n")
-    client.cmdPrint(f'iperf3 -c {server_ip} -p {port} -b 10M -P 10 -t 150 -C {cc_algo} > /tmp/h1.log &')
-    time.sleep(160)
-    info("*** Data transmission complete.\n")
+    run_scenario(net, opts.option, scenario, opts.cc, opts, metrics)
+    with metrics.phase('samplers_stop'):
+        stop_samplers(samplers)
 
 
-def run_option_b(net, cc_algo):
-    info("\n*** Running option (b): Staggered flows H1,H3,H4->H7\n")
-    server = net.get('h7')
-    server_ip = server.IP()
-    port1 = 5001
-    port2 = 5002
-    port3 = 5003
-
-    h1 = net.get('h1')
-    h3 = net.get('h3')
-    h4 = net.get('h4')
-
-    # Start iperf server in background (can handle multiple clients)
-    server.cmdPrint(f'iperf3 -s -p {port1} > /tmp/h7.log 2> /tmp/h7err.log &')
-    server.cmdPrint(f'tcpdump -i h7-eth0 -w /tmp/b_capture_{cc_algo}.pcap &')
-    time.sleep(2)
-
-    info("*** Starting iperf client on h1 at t=0\n")
-    h1.cmdPrint(f'iperf3 -c {server_ip} -p {port1} -b 10M -P 10 -t 150 -C {cc_algo} > /tmp/h1.log 2> /tmp/h1err.log &')
-    time.sleep(13)
-    info("*** Starting iperf client on h3 at t=15\n")
-    server.cmdPrint(f'iperf3 -s -p {port2} > /tmp/h7.log 2> /tmp/h7err.log &')
-    time.sleep(2)
-    h3.cmdPrint(f'iperf3 -c {server_ip} -p {port2} -b 10M -P 10 -t 120 -C {cc_algo} > /tmp/h3.log 2> /tmp/h3err.log &')
-    time.sleep(13)
-    info("*** Starting iperf client on h4 at t=30\n")
-    server.cmdPrint(f'iperf3 -s -p {port3} > /tmp/h7.log 2> /tmp/h7err.log &')
-    h4.cmdPrint(f'iperf3 -c {server_ip} -p {port3} -b 10M -P 10 -t 90 -C {cc_algo} > /tmp/h4.log 2> /tmp/h4err.log &')
-    time.sleep(210)
-    info("*** All staggered flows completed.\n")
-
-
-def run_option_c(net, cc_algo, suboption = '1'):
-    info("\n*** Running option (c).\n")
-    if suboption == '1':
-        net.configLinkStatus('s1', 's2', 'down')
-        server = net.get('h7')
-        client = net.get('h3')
-        server_ip = server.IP()
-        port = 5001
-        server.cmdPrint(f'iperf3 -s -p {port} &')
-        server.cmdPrint(f'tcpdump -i any -w /tmp/c1_capture_{cc_algo}.pcap &')
-        time.sleep(2)
-
-        client.cmdPrint(f'iperf3 -c {server_ip} -p {port} -b 10M -P 10 -t 150 -C {cc_algo} > /tmp/h3.log 2> /tmp/h3err.log &')
-        time.sleep(160)
-        info("*** Data transmission complete.\n")
-        net.configLinkStatus('s1', 's2', 'up')
-
-    elif suboption.startswith('2'):
-        match(suboption[1:]):
-            case 'a':
-                server = net.get('h7')
-                server_ip = server.IP()
-                port1 = 5001
-                port2 = 5002
-
-                h1 = net.get('h1')
-                h2 = net.get('h2')
-
-                # Start iperf server in background (can handle multiple clients)
-                server.cmdPrint(f'iperf3 -s -p {port1} > /tmp/h7.log 2> /tmp/h7err.log &')
-                server.cmdPrint(f'iperf3 -s -p {port2} > /tmp/h7.log 2> /tmp/h7err.log &')
-                server.cmdPrint(f'tcpdump -i any -w /tmp/c2a_capture_{cc_algo}.pcap &')
-                time.sleep(2)
-
-                info("*** Starting iperf client on all clients\n")
-                h1.cmdPrint(f'iperf3 -c {server_ip} -p {port1} -b 10M -P 10 -t 150 -C {cc_algo} > /tmp/h1.log 2> /tmp/h1err.log &')
-                h2.cmdPrint(f'iperf3 -c {server_ip} -p {port2} -b 10M -P 10 -t 150 -C {cc_algo} > /tmp/h3.log 2> /tmp/h3err.log &')
-                time.sleep(300)
-                info("*** All flows completed.\n")
-            case 'b':
-                server = net.get('h7')
-                server_ip = server.IP()
-                port1 = 5001
-                port2 = 5002
-
-                h1 = net.get('h1')
-                h3 = net.get('h3')
-
-                # Start iperf server in background (can handle multiple clients)
-                server.cmdPrint(f'iperf3 -s -p {port1} > /tmp/h7.log 2> /tmp/h7err.log &')
-                server.cmdPrint(f'iperf3 -s -p {port2} > /tmp/h7.log 2> /tmp/h7err.log &')
-                server.cmdPrint(f'tcpdump -i any -w /tmp/c2b_capture_{cc_algo}.pcap &')
-                time.sleep(2)
-
-                info("*** Starting iperf client on all clients\n")
-                h1.cmdPrint(f'iperf3 -c {server_ip} -p {port1} -b 10M -P 10 -t 150 -C {cc_algo} > /tmp/h1.log 2> /tmp/h1err.log &')
-                h3.cmdPrint(f'iperf3 -c {server_ip} -p {port2} -b 10M -P 10 -t 150 -C {cc_algo} > /tmp/h3.log 2> /tmp/h3err.log &')
-                time.sleep(300)
-                info("*** All flows completed.\n")
-            case 'c':
-                server = net.get('h7')
-                server_ip = server.IP()
-                port1 = 5001
-                port2 = 5002
-                port3 = 5003
-
-                h1 = net.get('h1')
-                h3 = net.get('h3')
-                h4 = net.get('h4')
-
-                # Start iperf server in background (can handle multiple clients)
-                server.cmdPrint(f'iperf3 -s -p {port1} > /tmp/h7.log 2> /tmp/h7err.log &')
-                server.cmdPrint(f'iperf3 -s -p {port2} > /tmp/h7.log 2> /tmp/h7err.log &')
-                server.cmdPrint(f'iperf3 -s -p {port3} > /tmp/h7.log 2> /tmp/h7err.log &')
-                server.cmdPrint(f'tcpdump -i any -w /tmp/c2c_capture_{cc_algo}.pcap &')
-                time.sleep(2)
-
-                info("*** Starting iperf client on all clients\n")
-                h1.cmdPrint(f'iperf3 -c {server_ip} -p {port1} -b 10M -P 10 -t 150 -C {cc_algo} > /tmp/h1.log 2> /tmp/h1err.log &')
-                h3.cmdPrint(f'iperf3 -c {server_ip} -p {port2} -b 10M -P 10 -t 150 -C {cc_algo} > /tmp/h3.log 2> /tmp/h3err.log &')
-                h4.cmdPrint(f'iperf3 -c {server_ip} -p {port3} -b 10M -P 10 -t 150 -C {cc_algo} > /tmp/h4.log 2> /tmp/h4err.log &')
-                time.sleep(450)
-                info("*** All flows completed.\n")
-            case _:
-                info("*** Unknown option. Starting CLI for manual debugging...\n")        
-    else:
-        info("*** Unknown option. Starting CLI for manual debugging...\n")
-
-def run_option_d(net, cc_algo, suboption = '1'):
-    info("\n*** Running option (d).\n")
-    if suboption == '1':
-        net.configLinkStatus('s1', 's2', 'down')
-        server = net.get('h7')
-        client = net.get('h3')
-        server_ip = server.IP()
-        port = 5001
-        server.cmdPrint(f'iperf3 -s -p {port} &')
-        server.cmdPrint(f'tcpdump -i any -w /tmp/d1_capture_{cc_algo}.pcap &')
-        time.sleep(2)
-
-        client.cmdPrint(f'iperf3 -c {server_ip} -p {port} -b 10M -P 10 -t 150 -C {cc_algo} > /tmp/h3.log 2> /tmp/h3err.log &')
-        time.sleep(160)
-        info("*** Data transmission complete.\n")
-        net.configLinkStatus('s1', 's2', 'up')
-
-    elif suboption.startswith('2'):
-        match(suboption[1:]):
-            case 'a':
-                server = net.get('h7')
-                server_ip = server.IP()
-                port1 = 5001
-                port2 = 5002
-
-                h1 = net.get('h1')
-                h2 = net.get('h2')
-
-                # Start iperf server in background (can handle multiple clients)
-                server.cmdPrint(f'iperf3 -s -p {port1} > /tmp/h7.log 2> /tmp/h7err.log &')
-                server.cmdPrint(f'iperf3 -s -p {port2} > /tmp/h7.log 2> /tmp/h7err.log &')
-                server.cmdPrint(f'tcpdump -i any -w /tmp/d2a_capture_{cc_algo}.pcap &')
-                time.sleep(2)
-
-                info("*** Starting iperf client on all clients\n")
-                h1.cmdPrint(f'iperf3 -c {server_ip} -p {port1} -b 10M -P 10 -t 150 -C {cc_algo} > /tmp/h1.log 2> /tmp/h1err.log &')
-                h2.cmdPrint(f'iperf3 -c {server_ip} -p {port2} -b 10M -P 10 -t 150 -C {cc_algo} > /tmp/h3.log 2> /tmp/h3err.log &')
-                time.sleep(300)
-                info("*** All flows completed.\n")
-            case 'b':
-                server = net.get('h7')
-                server_ip = server.IP()
-                port1 = 5001
-                port2 = 5002
-
-                h1 = net.get('h1')
-                h3 = net.get('h3')
-
-                # Start iperf server in background (can handle multiple clients)
-                server.cmdPrint(f'iperf3 -s -p {port1} > /tmp/h7.log 2> /tmp/h7err.log &')
-                server.cmdPrint(f'iperf3 -s -p {port2} > /tmp/h7.log 2> /tmp/h7err.log &')
-                server.cmdPrint(f'tcpdump -i any -w /tmp/d2b_capture_{cc_algo}.pcap &')
-                time.sleep(2)
-
-                info("*** Starting iperf client on all clients\n")
-                h1.cmdPrint(f'iperf3 -c {server_ip} -p {port1} -b 10M -P 10 -t 150 -C {cc_algo} > /tmp/h1.log 2> /tmp/h1err.log &')
-                h3.cmdPrint(f'iperf3 -c {server_ip} -p {port2} -b 10M -P 10 -t 150 -C {cc_algo} > /tmp/h3.log 2> /tmp/h3err.log &')
-                time.sleep(300)
-                info("*** All flows completed.\n")
-            case 'c':
-                server = net.get('h7')
-                server_ip = server.IP()
-                port1 = 5001
-                port2 = 5002
-                port3 = 5003
-
-                h1 = net.get('h1')
-                h3 = net.get('h3')
-                h4 = net.get('h4')
-
-                # Start iperf server in background (can handle multiple clients)
-                server.cmdPrint(f'iperf3 -s -p {port1} > /tmp/h7.log 2> /tmp/h7err.log &')
-                server.cmdPrint(f'iperf3 -s -p {port2} > /tmp/h7.log 2> /tmp/h7err.log &')
-                server.cmdPrint(f'iperf3 -s -p {port3} > /tmp/h7.log 2> /tmp/h7err.log &')
-                server.cmdPrint(f'tcpdump -i any -w /tmp/d2c_capture_{cc_algo}.pcap &')
-                time.sleep(2)
-
-                info("*** Starting iperf client on all clients\n")
-                h1.cmdPrint(f'iperf3 -c {server_ip} -p {port1} -b 10M -P 10 -t 150 -C {cc_algo} > /tmp/h1.log 2> /tmp/h1err.log &')
-                h3.cmdPrint(f'iperf3 -c {server_ip} -p {port2} -b 10M -P 10 -t 150 -C {cc_algo} > /tmp/h3.log 2> /tmp/h3err.log &')
-                h4.cmdPrint(f'iperf3 -c {server_ip} -p {port3} -b 10M -P 10 -t 150 -C {cc_algo} > /tmp/h4.log 2> /tmp/h4err.log &')
-                time.sleep(450)
-                info("*** All flows completed.\n")
-            case _:
-                info("*** Unknown option. Starting CLI for manual debugging...\n")        
-    else:
-        info("*** Unknown option. Starting CLI for manual debugging...\n")
+def run_options(args, cc_algo):
+    # With several algorithms each run gets its own directory, since the
+    # iperf3 logs and tcp_info samples are not named after the algorithm.
+    opts = argparse.Namespace(**vars(args))
+    opts.cc = cc_algo
+    if len(args.cc) > 1:
+        opts.outdir = os.path.join(args.outdir, cc_algo)
+    os.makedirs(opts.outdir, exist_ok=True)
+    return opts
 
 
 def main():
@@ -309,52 +518,118 @@ def main():
 
     parser = argparse.ArgumentParser(description="Custom Mininet Topology for TCP Congestion Experiments")
     parser.add_argument('--option', '-o', type=str, default='a',
-                        help='Which experiment option to run: a, b, c, d, etc.')
-    parser.add_argument('--cc', type=str, default='yeah',
-                        help='TCP Congestion Control Algorithm (e.g., reno, cubic, bbr, etc.)')
+                        help='Scenario to run: a, b, c.1, c.2a, ... d.2c, or one from --scenario_file.')
+    parser.add_argument('--scenario_file', type=str, default=None,
+                        help='JSON object of extra scenarios (name -> spec, see scenarios.py).')
+    parser.add_argument('--cc', type=str, nargs='+', default=['yeah'],
+                        help='TCP Congestion Control Algorithm(s) (e.g., reno, cubic, bbr, etc.); several are '
+                             'run one after another on the same network.')
+    parser.add_argument('--flush_flows', action='store_true',
+                        help='Empty the switch flow tables between algorithms so paths are relearnt.')
     parser.add_argument('--loss', type=float, default=0.0,
                         help='Link loss percentage to apply on S2-S3 (e.g., 1.0 means 1%%)')
+    parser.add_argument('--link', action='append', default=[],
+                        help="Override a switch link's parameters, e.g. 's2-s3:bw=20,delay=5ms' (repeatable).")
     parser.add_argument('--enable_all_links', action='store_true',
                         help='Enable all possible switch-to-switch links (S4-S1, S2-S4) in the topology.')
+    parser.add_argument('--outdir', type=str, default='/tmp',
+                        help='Directory for captures and iperf3 logs of this run.')
+    parser.add_argument('--prefix', type=str, default='',
+                        help='Prefix for node names, so concurrent runs get unique interface names.')
+    parser.add_argument('--run_index', type=int, default=0,
+                        help='Distinguishes the datapath IDs of concurrent runs; must differ between them.')
+    parser.add_argument('--controller_port', type=int, default=6653,
+                        help='OpenFlow port of this run\'s controller; must differ between concurrent runs.')
+    parser.add_argument('--drain', type=float, default=DRAIN_SECONDS,
+                        help='Seconds to keep capturing after the last iperf3 client exits.')
+    parser.add_argument('--sample_interval_ms', type=float, default=20.0,
+                        help="Period of the tcp_info (cwnd/RTT) sampler on the scenario's sender hosts; "
+                             "0 disables it.")
+    parser.add_argument('--qdisc_interval_ms', type=float, default=QDISC_INTERVAL_MS,
+                        help='Period of the backlog/drop/overlimit sampler on the --qdisc_links qdiscs; 0 disables it.')
+    parser.add_argument('--qdisc_links', nargs='+', choices=SWITCH_LINKS, default=['s2-s3'],
+                        help='Switch links whose qdiscs are sampled (the s2-s3 bottleneck by default).')
+    parser.add_argument('--iperf_interval', type=float, default=IPERF_INTERVAL,
+                        help='Seconds between iperf3 JSON interval reports (0.1 at the finest).')
+    parser.add_argument('--no_capture', action='store_true',
+                        help='Skip tcpdump and rely on the tcp_info samples and iperf3 logs (for long runs).')
+    parser.add_argument('--snaplen', type=int, default=CAPTURE_SNAPLEN,
+                        help='Bytes captured per packet; the default keeps headers only, 0 captures whole packets.')
+    parser.add_argument('--capture_filter', type=str, default=None,
+                        help="BPF filter applied in the kernel (default: TCP on the scenario's iperf3 ports); "
+                             "an empty string captures everything.")
+    parser.add_argument('--rotate_mb', type=int, default=ROTATE_FILE_MB,
+                        help='Start a new capture file every this many MB (0 writes a single file).')
+    parser.add_argument('--rotate_files', type=int, default=ROTATE_FILES,
+                        help='Ring size: the oldest file is overwritten after this many (0 keeps them all).')
+    parser.add_argument('--capture_format', choices=['pcap', 'pcapng'], default='pcap',
+                        help='pcap via tcpdump, or pcapng via dumpcap.')
+    parser.add_argument('--capture_compress', action='store_true',
+                        help='gzip the capture files once the capture has stopped.')
+    parser.add_argument('--no_cli', action='store_true',
+                        help='Tear the network down after the experiment instead of dropping into the CLI.')
     args = parser.parse_args()
 
+    scenarios = load_scenarios(args.scenario_file)
+    if args.option not in scenarios:
+        parser.error(f"unknown option {args.option!r}, expected one of {', '.join(scenarios)}")
+    scenario = scenarios[args.option]
+    try:
+        server_host(scenario)
+    except ValueError as err:
+        parser.error(f"scenario {args.option!r}: {err}")
+    if args.capture_filter is None:
+        args.capture_filter = port_filter(flow_ports(scenario))
+
     # Build topology
-    option = args.option.split('.')
-    suboption = option[1] if len(option) > 1 else None
-    option = option[0]
-    topo = CustomTopo(enable_all_links=args.enable_all_links, option=option, suboption=suboption, loss=args.loss)
-    net = Mininet(topo=topo, controller=OVSController, link=TCLink, autoSetMacs=True)
-    net.start()
-
-    # If we have a nonzero loss, configure it on the S2-S3 link:
+    links = {name: dict(params) for name, params in scenario.get('links', {}).items()}
     if args.loss > 0:
-        link_s2_s3 = net.linksBetween(net.get('s2'), net.get('s3'))
-        if link_s2_s3:
-            # Typically there will be exactly 1 link in the list:
-            link_obj = link_s2_s3[0]
-            # We set loss on both interfaces:
-            link_obj.intf1.config(loss=args.loss)
-            link_obj.intf2.config(loss=args.loss)
-            info(f"*** Configured {args.loss}% loss on link s2-s3\n")
-
-    # Configure congestion control on all hosts
-    configure_congestion_control(net, args.cc)
-
-    # Dispatch to the requested experiment
-    if args.option.lower() == 'a':
-        run_option_a(net, args.cc)
-    elif args.option.lower() == 'b':
-        run_option_b(net, args.cc)
-    elif args.option.lower().startswith('c'):
-        run_option_c(net, args.cc, suboption)
-    elif args.option.lower().startswith('d'):
-        run_option_d(net, args.cc, suboption)
-    else:
-        info("*** Unknown option. Starting CLI for manual debugging...\n")
-
-    # Drop into CLI for any extra commands or debugging
-    CLI(net)
-    net.stop()
+        links.setdefault('s2-s3', {})['loss'] = args.loss
+    for text in args.link:
+        try:
+            name, params = parse_link_params(text)
+        except ValueError as err:
+            parser.error(str(err))
+        links.setdefault(name, {}).update(params)
+    # Building and starting the network are counted against the first run
+    metrics = RunMetrics({'scenario': args.option, 'cc': args.cc[0]})
+    command_times = CommandTimes()
+    topo = CustomTopo(enable_all_links=args.enable_all_links, links=links, prefix=args.prefix,
+                      run_index=args.run_index)
+    with metrics.phase('build'):
+        net = Mininet(topo=topo, controller=partial(OVSController, port=args.controller_port), link=TCLink,
+                      autoSetMacs=True)
+    command_times.wrap(net.hosts + net.switches + net.controllers)
+    try:
+        with metrics.phase('start'):
+            net.start()
+        for index, cc_algo in enumerate(args.cc):
+            opts = run_options(args, cc_algo)
+            if index:
+                metrics = RunMetrics({'scenario': args.option, 'cc': cc_algo})
+                info(f"\n*** Resetting the network for {cc_algo}\n")
+                with metrics.phase('reset'):
+                    reset_network(net, args.flush_flows)
+            with metrics.phase('isolation_check'):
+                isolated = check_isolation(net, opts)
+            if not isolated:
+                info(f"*** Run {cc_algo} did not start from a clean network, see {opts.outdir}/isolation.json\n")
+                metrics.invalidate('not_isolated')
+            run_experiment(net, opts, scenario, metrics)
+
+            metrics.commands = command_times.take()
+            metrics.check_limits()
+            metrics.write(opts.outdir)
+            phases = ', '.join(f"{phase['phase']} {phase['seconds']:.1f}s" for phase in metrics.phases)
+            info(f"*** Run {cc_algo}: {phases}\n")
+            if metrics.problems:
+                info(f"*** Run {cc_algo} is INVALID ({', '.join(metrics.problems)}), see {opts.outdir}/run_metrics.json\n")
+
+        # Drop into CLI for any extra commands or debugging
+        if not args.no_cli:
+            CLI(net)
+    finally:
+        net.stop()
 
 
 if __name__ == '__main__':
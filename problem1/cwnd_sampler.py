@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+import argparse
+import os
+import signal
+import socket
+import struct
+import threading
+import time
+
+from netlink_dump import dump, fixed_rate
+
+# sock_diag constants from linux/netlink.h, linux/sock_diag.h, linux/inet_diag.h
+NETLINK_SOCK_DIAG = 4
+SOCK_DIAG_BY_FAMILY = 20
+NLM_F_REQUEST = 0x001
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+INET_DIAG_INFO = 2
+TCP_ESTABLISHED = 1
+
+_NLMSG_HEADER = struct.Struct('=IHHII')
+_INET_DIAG_REQ = struct.Struct('=BBBxI')
+_RTATTR = struct.Struct('=HH')
+INET_DIAG_MSG_LEN = 72
+
+# Offsets into struct tcp_info (linux/tcp.h); older kernels return a shorter
+# struct, in which case the missing fields read as zero.
+TCP_INFO_FIELDS = [
+    ('snd_mss', 16, 'I'),
+    ('srtt_us', 68, 'I'),
+    ('ssthresh', 76, 'I'),
+    ('cwnd', 80, 'I'),
+    ('retrans', 100, 'I'),
+    ('pacing_rate', 104, 'Q'),
+    ('delivery_rate', 160, 'Q'),
+]
+
+FILE_MAGIC = b'CWND0001'
+RECORD = struct.Struct('<dHHIIIIIQQ')
+
+
+def diag_request(seq):
+    # inet_diag_req_v2 with a zeroed inet_diag_sockid: dump every IPv4 TCP
+    # socket in ESTABLISHED and attach its tcp_info.
+    body = _INET_DIAG_REQ.pack(socket.AF_INET, socket.IPPROTO_TCP, 1 << (INET_DIAG_INFO - 1),
+                               1 << TCP_ESTABLISHED) + bytes(48)
+    return _NLMSG_HEADER.pack(_NLMSG_HEADER.size + len(body), SOCK_DIAG_BY_FAMILY,
+                              NLM_F_REQUEST | NLM_F_DUMP, seq, 0) + body
+
+
+def parse_tcp_info(data, start, length):
+    values = {}
+    for name, offset, fmt in TCP_INFO_FIELDS:
+        size = struct.calcsize(fmt)
+        if offset + size <= length:
+            values[name] = struct.unpack_from('=' + fmt, data, start + offset)[0]
+        else:
+            values[name] = 0
+    return values
+
+
+def parse_diag_messages(data):
+    # Decodes one recv() worth of replies into (sport, dport, tcp_info)
+    # tuples, and reports whether the dump's NLMSG_DONE was among them.
+    samples = []
+    pos = 0
+    while pos + _NLMSG_HEADER.size <= len(data):
+        length, msg_type, _, _, _ = _NLMSG_HEADER.unpack_from(data, pos)
+        if msg_type == NLMSG_DONE or length < _NLMSG_HEADER.size:
+            return samples, True
+        if msg_type == NLMSG_ERROR:
+            raise OSError("sock_diag request failed")
+        msg = pos + _NLMSG_HEADER.size
+        sport, dport = struct.unpack_from('>HH', data, msg + 4)
+        attr = msg + INET_DIAG_MSG_LEN
+        end = pos + length
+        while attr + _RTATTR.size <= end:
+            attr_len, attr_type = _RTATTR.unpack_from(data, attr)
+            if attr_len < _RTATTR.size:
+                break
+            if attr_type == INET_DIAG_INFO:
+                samples.append((sport, dport, parse_tcp_info(data, attr + _RTATTR.size, attr_len - _RTATTR.size)))
+            attr += (attr_len + 3) & ~3
+        pos += (length + 3) & ~3
+    return samples, False
+
+
+def sample_once(sock, seq, ports):
+    # iperf3's control connection goes to the server port as well; it is
+    # told apart from the data streams, and dropped, when the samples are
+    # drawn (plot_graphs.py), since only iperf3's exit log lists the streams.
+    return [s for s in dump(sock, diag_request(seq), parse_diag_messages) if not ports or s[1] in ports]
+
+
+def run_sampler(output, ports, interval, duration=None, stop=None):
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_SOCK_DIAG)
+    with open(output, 'wb') as f:
+        f.write(FILE_MAGIC)
+        for seq in fixed_rate(interval, duration, stop):
+            now = time.time()
+            for sport, dport, info in sample_once(sock, seq, ports):
+                f.write(RECORD.pack(now, sport, dport, info['cwnd'], info['ssthresh'], info['srtt_us'],
+                                    info['snd_mss'], info['retrans'], info['pacing_rate'],
+                                    info['delivery_rate']))
+    sock.close()
+
+
+def load_samples(path):
+    import numpy as np
+
+    dtype = np.dtype([
+        ('ts', '<f8'), ('sport', '<u2'), ('dport', '<u2'), ('cwnd', '<u4'), ('ssthresh', '<u4'),
+        ('srtt_us', '<u4'), ('snd_mss', '<u4'), ('retrans', '<u4'),
+        ('pacing_rate', '<u8'), ('delivery_rate', '<u8'),
+    ])
+    with open(path, 'rb') as f:
+        if f.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            raise ValueError(f"{path} is not a cwnd sample file")
+        data = f.read()
+    usable = len(data) - len(data) % dtype.itemsize
+    return np.frombuffer(data[:usable], dtype=dtype)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sample kernel tcp_info of established TCP sockets via sock_diag")
+    parser.add_argument('--output', required=True,
+                        help='Binary time series to write.')
+    parser.add_argument('--ports', type=int, nargs='*', default=[],
+                        help='Only record sockets whose destination port is in this list.')
+    parser.add_argument('--interval_ms', type=float, default=20.0,
+                        help='Sampling period in milliseconds.')
+    parser.add_argument('--duration', type=float, default=None,
+                        help='Stop after this many seconds (default: until SIGINT/SIGTERM).')
+    args = parser.parse_args()
+
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    run_sampler(args.output, set(args.ports), args.interval_ms / 1000.0, args.duration, stop)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import numpy as np
+
+# Points kept per series: two per pixel column of the 10 inch wide figures
+# at matplotlib's 100 dpi, i.e. a minimum and a maximum per column.
+DEFAULT_POINTS = 2000
+METHODS = ['minmax', 'lttb', 'none']
+
+
+def sorted_by_x(x, y):
+    if len(x) > 1 and np.any(np.diff(x) < 0):
+        order = np.argsort(x, kind='stable')
+        return x[order], y[order]
+    return x, y
+
+
+def minmax(x, y, points=DEFAULT_POINTS):
+    # Keeps the lowest and highest point of every pixel column (in their
+    # original order) plus both ends, so spikes and window drops survive
+    # at the resolution the figure is drawn at.
+    x, y = sorted_by_x(np.asarray(x), np.asarray(y))
+    n = len(x)
+    columns = max(1, points // 2)
+    if n <= points or x[-1] == x[0]:
+        return x, y
+
+    edges = x[0] + (x[-1] - x[0]) * np.arange(columns) / columns
+    starts = np.unique(np.searchsorted(x, edges))
+    ends = np.r_[starts[1:], n]
+    lows = [start + int(np.argmin(y[start:end])) for start, end in zip(starts, ends)]
+    highs = [start + int(np.argmax(y[start:end])) for start, end in zip(starts, ends)]
+
+    keep = np.unique(np.concatenate([lows, highs, [0, n - 1]]))
+    return x[keep], y[keep]
+
+
+def lttb(x, y, points=DEFAULT_POINTS):
+    # Largest-Triangle-Three-Buckets: one point per bucket, the one forming
+    # the largest triangle with the point kept before it and the mean of
+    # the next bucket. Smoother than minmax, but a spike only survives if
+    # it dominates its bucket.
+    x, y = sorted_by_x(np.asarray(x), np.asarray(y))
+    n = len(x)
+    if n <= points or points < 3:
+        return x, y
+
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    xf = x.astype(np.float64)
+    yf = y.astype(np.float64)
+    x_sums = np.r_[0.0, np.cumsum(xf)]
+    y_sums = np.r_[0.0, np.cumsum(yf)]
+    keep = np.empty(points, dtype=np.int64)
+    keep[0] = 0
+    keep[-1] = n - 1
+    a = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_lo, next_hi = hi, edges[i + 2]
+            avg_x = (x_sums[next_hi] - x_sums[next_lo]) / (next_hi - next_lo)
+            avg_y = (y_sums[next_hi] - y_sums[next_lo]) / (next_hi - next_lo)
+        else:
+            avg_x, avg_y = xf[-1], yf[-1]
+        area = np.abs((xf[a] - avg_x) * (yf[lo:hi] - yf[a]) - (xf[a] - xf[lo:hi]) * (avg_y - yf[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return x[keep], y[keep]
+
+
+def decimate(x, y, points=DEFAULT_POINTS, method='minmax'):
+    if method == 'minmax':
+        return minmax(x, y, points)
+    if method == 'lttb':
+        return lttb(x, y, points)
+    return np.asarray(x), np.asarray(y)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+
+import numpy as np
+
+# One row per stream per reporting interval. Receiver-side logs (the
+# server's) carry no TCP sender state, which then reads as -1.
+INTERVAL_DTYPE = np.dtype([
+    ('interval', '<u4'), ('socket', '<i4'), ('start', '<f8'), ('end', '<f8'),
+    ('bytes', '<u8'), ('bits_per_second', '<f8'), ('retransmits', '<i8'),
+    ('snd_cwnd', '<i8'), ('snd_wnd', '<i8'), ('rtt_us', '<i8'), ('rttvar_us', '<i8'),
+    ('pmtu', '<i4'), ('omitted', '?'), ('sender', '?'),
+])
+
+# dtype field -> key in iperf3's per-stream interval object, value when absent
+STREAM_KEYS = [
+    ('socket', 'socket', -1), ('start', 'start', 0.0), ('end', 'end', 0.0), ('bytes', 'bytes', 0),
+    ('bits_per_second', 'bits_per_second', 0.0), ('retransmits', 'retransmits', -1),
+    ('snd_cwnd', 'snd_cwnd', -1), ('snd_wnd', 'snd_wnd', -1), ('rtt_us', 'rtt', -1),
+    ('rttvar_us', 'rttvar', -1), ('pmtu', 'pmtu', -1), ('omitted', 'omitted', False),
+    ('sender', 'sender', False),
+]
+
+
+def read_documents(path):
+    # A server that handled several tests appends one JSON object per test
+    with open(path) as f:
+        text = f.read()
+    decoder = json.JSONDecoder()
+    documents = []
+    pos = 0
+    while True:
+        while pos < len(text) and text[pos].isspace():
+            pos += 1
+        if pos >= len(text):
+            return documents
+        document, pos = decoder.raw_decode(text, pos)
+        documents.append(document)
+
+
+def stream_intervals(document, first_interval=0):
+    streams = [(first_interval + i, stream) for i, interval in enumerate(document.get('intervals', []))
+               for stream in interval['streams']]
+    intervals = np.empty(len(streams), dtype=INTERVAL_DTYPE)
+    intervals['interval'] = [i for i, _ in streams]
+    for field, key, missing in STREAM_KEYS:
+        intervals[field] = [stream.get(key, missing) for _, stream in streams]
+    return intervals
+
+
+def run_info(document):
+    start = document.get('start', {})
+    end = document.get('end', {})
+    connected = start.get('connected') or [{}]
+    test = start.get('test_start', {})
+    return {
+        'timesecs': start.get('timestamp', {}).get('timesecs'),
+        'local_host': connected[0].get('local_host'),
+        'remote_host': connected[0].get('remote_host'),
+        'remote_port': connected[0].get('remote_port'),
+        'num_streams': test.get('num_streams'),
+        'duration': test.get('duration'),
+        'congestion': end.get('sender_tcp_congestion') or end.get('receiver_tcp_congestion'),
+        'sent_bps': end.get('sum_sent', {}).get('bits_per_second'),
+        'received_bps': end.get('sum_received', {}).get('bits_per_second'),
+        'retransmits': end.get('sum_sent', {}).get('retransmits'),
+        'error': document.get('error'),
+    }
+
+
+def stream_ports(path):
+    # (local port, remote port) of every data stream of every test in the
+    # log. The control connection shares the server port but is not listed.
+    ports = set()
+    for document in read_documents(path):
+        for stream in document.get('start', {}).get('connected', []):
+            ports.add((stream.get('local_port'), stream.get('remote_port')))
+    return ports
+
+
+def load_iperf_json(path):
+    # Returns the per-stream interval rows of every test in the log and one
+    # info dict per test; interval numbers keep counting across tests.
+    documents = read_documents(path)
+    parts = []
+    infos = []
+    first_interval = 0
+    for document in documents:
+        parts.append(stream_intervals(document, first_interval))
+        infos.append(run_info(document))
+        first_interval += len(document.get('intervals', []))
+    if not parts:
+        return np.empty(0, dtype=INTERVAL_DTYPE), infos
+    return np.concatenate(parts), infos
+
+
+def rate_series(intervals):
+    # Summed over streams: interval end times and Mbit/s. On a receiver log
+    # this is goodput, on a sender log the rate handed to the socket.
+    if len(intervals) == 0:
+        return np.empty(0), np.empty(0)
+    count = int(intervals['interval'].max()) + 1
+    ends = np.zeros(count)
+    ends[intervals['interval']] = intervals['end']
+    seconds = np.zeros(count)
+    seconds[intervals['interval']] = intervals['end'] - intervals['start']
+    bits = np.bincount(intervals['interval'], weights=intervals['bytes'] * 8.0, minlength=count)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return ends, np.where(seconds > 0, bits / seconds / 1e6, 0.0)
+
+
+def stream_series(intervals, field):
+    # socket -> (interval end times, values) for per-stream state such as snd_cwnd
+    series = {}
+    for socket in np.unique(intervals['socket']):
+        rows = intervals[intervals['socket'] == socket]
+        series[int(socket)] = (rows['end'], rows[field])
+    return series
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise iperf3 --json logs written by ccComparisons.py")
+    parser.add_argument('logs', nargs='+', help='iperf3 JSON logs, e.g. /tmp/h1_5001.json.')
+    args = parser.parse_args()
+
+    for path in args.logs:
+        intervals, infos = load_iperf_json(path)
+        for info in infos:
+            if info['error']:
+                print(f"{path}: iperf3 error: {info['error']}")
+        times, rates = rate_series(intervals)
+        sender = bool(len(intervals)) and bool(intervals['sender'].all())
+        line = f"{path}: {len(intervals)} stream intervals, {'sender' if sender else 'receiver'}"
+        if len(rates):
+            line += f", mean {rates.mean():.2f} Mbit/s"
+        if sender:
+            line += f", {int(intervals['retransmits'].sum())} retransmits, max cwnd {int(intervals['snd_cwnd'].max())} B"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
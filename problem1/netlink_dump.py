@@ -0,0 +1,35 @@
+import threading
+import time
+
+RECV_SIZE = 1 << 16
+
+
+def dump(sock, request, parse):
+    # Sends one netlink dump request and gathers what parse() makes of each
+    # recv() worth of replies; parse returns (samples, saw NLMSG_DONE).
+    sock.send(request)
+    samples = []
+    done = False
+    while not done:
+        batch, done = parse(sock.recv(RECV_SIZE))
+        samples.extend(batch)
+    return samples
+
+
+def fixed_rate(interval, duration=None, stop=None):
+    # Yields 1, 2, ... every `interval` seconds until stop is set or duration
+    # has passed. Fixed-rate schedule: a slow sample delays itself, not all
+    # later ones.
+    stop = stop or threading.Event()
+    start = time.monotonic()
+    next_sample = start
+    seq = 0
+    while not stop.is_set() and (duration is None or time.monotonic() - start < duration):
+        seq += 1
+        yield seq
+        next_sample += interval
+        delay = next_sample - time.monotonic()
+        if delay > 0:
+            stop.wait(delay)
+        else:
+            next_sample = time.monotonic()
@@ -0,0 +1,458 @@
+import glob
+import gzip
+import mmap
+import os
+import re
+import struct
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import repeat
+
+import numpy as np
+
+PCAP_MAGIC_USEC = 0xa1b2c3d4
+PCAP_MAGIC_NSEC = 0xa1b23c4d
+PCAPNG_BLOCK_SHB = 0x0a0d0d0a
+PCAPNG_BLOCK_IDB = 0x00000001
+PCAPNG_BLOCK_EPB = 0x00000006
+PCAPNG_BYTE_ORDER_MAGIC = 0x1a2b3c4d
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_LINUX_SLL2 = 276
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_VLAN = 0x8100
+IPPROTO_TCP = 6
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_PSH = 0x08
+TCP_ACK = 0x10
+
+# Bump whenever the decoded columns change so cached extractions are rebuilt
+EXTRACTOR_VERSION = 3
+
+# Records decoded per vectorized batch; bounds the index temporaries so peak
+# memory is dominated by the output columns.
+CHUNK_RECORDS = 1 << 20
+
+# Equal-length records the pcap index walk steps through before it starts
+# guessing, and how many records it guesses per vectorized step at first and
+# at most.
+RUN_MIN = 16
+RUN_GUESS = 256
+RUN_MAX = 1 << 16
+
+# One row per TCP/IPv4 segment. ip_len is the on-the-wire IP total length,
+# so truncated (header-only) captures still give correct byte counts.
+PACKET_DTYPE = np.dtype([
+    ('ts', np.float64),
+    ('src_ip', np.uint32),
+    ('dst_ip', np.uint32),
+    ('src_port', np.uint16),
+    ('dst_port', np.uint16),
+    ('seq', np.uint32),
+    ('ack', np.uint32),
+    ('window', np.uint16),
+    ('flags', np.uint8),
+    ('ip_len', np.uint16),
+    ('payload_len', np.uint16),
+    ('sack_blocks', np.uint8),
+])
+
+
+class PcapFormatError(ValueError):
+    pass
+
+
+class RecordIndex:
+    # Byte offset, captured length, timestamp and link type of every record,
+    # found in a single walk over the record headers.
+
+    def __init__(self, offsets, caplens, timestamps, linktypes):
+        self.offsets = offsets
+        self.caplens = caplens
+        self.timestamps = timestamps
+        self.linktypes = linktypes
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def slice(self, start, stop):
+        return RecordIndex(self.offsets[start:stop], self.caplens[start:stop],
+                           self.timestamps[start:stop], self.linktypes[start:stop])
+
+
+def _index_pcap(buf, endian, ts_units, linktype):
+    # The walk is sequential, but records often come in long runs of one
+    # length (snaplen-cut data segments, bare ACKs, flood SYNs). Once the
+    # header-by-header walk has seen RUN_MIN equal lengths in a row it
+    # guesses that the run goes on, checks the caplen of every guessed
+    # record in one vectorized comparison and keeps the prefix that matched,
+    # doubling the guess while it holds.
+    caplen_at = struct.Struct(endian + 'I').unpack_from
+    raw = np.frombuffer(buf, dtype=np.uint8)
+    word = _be32 if endian == '>' else _le32
+    caplen_type = np.dtype(endian + 'u4')
+    runs = []
+    stepped = array('q')
+    last = -1
+    repeats = 0
+    pos = 24
+    end = len(buf)
+    while pos + 16 <= end:
+        caplen = caplen_at(buf, pos + 8)[0]
+        stride = 16 + caplen
+        if pos + stride > end:
+            break
+        stepped.append(pos + 16)
+        pos += stride
+        if caplen != last:
+            last = caplen
+            repeats = 0
+            continue
+        repeats += 1
+        if repeats < RUN_MIN:
+            continue
+
+        runs.append(np.frombuffer(stepped, dtype=np.int64))
+        stepped = array('q')
+        guess = RUN_GUESS
+        while True:
+            count = min(guess, (end - pos) // stride)
+            if not count:
+                break
+            # The caplen fields of the guessed records, as a strided view
+            guessed = np.ndarray(count, dtype=caplen_type, buffer=buf, offset=pos + 8, strides=stride)
+            same = guessed == caplen
+            matched = count if same.all() else int(same.argmin())
+            runs.append(pos + 16 + stride * np.arange(matched, dtype=np.int64))
+            pos += matched * stride
+            if matched < count:
+                break
+            guess = min(guess * 2, RUN_MAX)
+        repeats = 0
+    runs.append(np.frombuffer(stepped, dtype=np.int64))
+
+    offsets = np.concatenate(runs)
+    # Integer ticks divided once, as in the streaming reader, so timestamps
+    # match tshark's decimal rendering exactly. Microsecond tick counts stay
+    # below 2**53 and convert to doubles exactly; nanosecond ones do not, so
+    # those are divided as Python integers to round only once.
+    ticks = word(raw, offsets - 16).astype(np.int64) * ts_units + word(raw, offsets - 12)
+    if ts_units <= 10 ** 6:
+        timestamps = ticks / ts_units
+    else:
+        timestamps = np.array([t / ts_units for t in ticks.tolist()], dtype=np.float64)
+    linktypes = np.full(len(offsets), linktype, dtype=np.uint16)
+    return RecordIndex(offsets, word(raw, offsets - 8), timestamps, linktypes)
+
+
+def _idb_options(buf, start, end, endian):
+    ts_units = 10 ** 6
+    ts_offset = 0
+    pos = start
+    while pos + 4 <= end:
+        code, length = struct.unpack_from(endian + 'HH', buf, pos)
+        if code == 0:
+            break
+        if code == 9 and length >= 1:
+            resol = buf[pos + 4]
+            ts_units = 2 ** (resol & 0x7f) if resol & 0x80 else 10 ** resol
+        elif code == 14 and length >= 8:
+            ts_offset = struct.unpack_from(endian + 'q', buf, pos + 4)[0]
+        pos += 4 + ((length + 3) & ~3)
+    return ts_units, ts_offset
+
+
+def _index_pcapng(buf):
+    offsets = array('q')
+    caplens = array('I')
+    timestamps = array('d')
+    linktypes = array('H')
+    endian = '<'
+    interfaces = []
+    pos = 0
+    end = len(buf)
+    while pos + 12 <= end:
+        block_type = struct.unpack_from('<I', buf, pos)[0]
+        if block_type == PCAPNG_BLOCK_SHB:
+            magic = struct.unpack_from('<I', buf, pos + 8)[0]
+            endian = '<' if magic == PCAPNG_BYTE_ORDER_MAGIC else '>'
+            interfaces = []
+        else:
+            block_type = struct.unpack_from(endian + 'I', buf, pos)[0]
+        block_len = struct.unpack_from(endian + 'I', buf, pos + 4)[0]
+        if block_len < 12 or pos + block_len > end:
+            break
+        if block_type == PCAPNG_BLOCK_IDB:
+            linktype = struct.unpack_from(endian + 'H', buf, pos + 8)[0]
+            interfaces.append((linktype,) + _idb_options(buf, pos + 16, pos + block_len - 4, endian))
+        elif block_type == PCAPNG_BLOCK_EPB:
+            if_id, ts_high, ts_low, caplen = struct.unpack_from(endian + 'IIII', buf, pos + 8)
+            if if_id < len(interfaces):
+                linktype, ts_units, ts_offset = interfaces[if_id]
+                offsets.append(pos + 28)
+                caplens.append(caplen)
+                timestamps.append(ts_offset + ((ts_high << 32) | ts_low) / ts_units)
+                linktypes.append(linktype)
+        pos += block_len
+
+    return RecordIndex(
+        np.frombuffer(offsets, dtype=np.int64),
+        np.frombuffer(caplens, dtype=np.uint32),
+        np.frombuffer(timestamps, dtype=np.float64),
+        np.frombuffer(linktypes, dtype=np.uint16),
+    )
+
+
+def index_records(buf):
+    if len(buf) < 4:
+        return RecordIndex(np.empty(0, np.int64), np.empty(0, np.uint32),
+                           np.empty(0, np.float64), np.empty(0, np.uint16))
+    if struct.unpack_from('<I', buf, 0)[0] == PCAPNG_BLOCK_SHB:
+        return _index_pcapng(buf)
+    for endian in ('<', '>'):
+        magic = struct.unpack_from(endian + 'I', buf, 0)[0]
+        if magic in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+            break
+    else:
+        raise PcapFormatError("Unrecognised capture file magic")
+    if len(buf) < 24:
+        raise PcapFormatError("Truncated pcap global header")
+    linktype = struct.unpack_from(endian + 'I', buf, 20)[0] & 0x0fffffff
+    ts_units = 10 ** 9 if magic == PCAP_MAGIC_NSEC else 10 ** 6
+    return _index_pcap(buf, endian, ts_units, linktype)
+
+
+def _be16(raw, pos):
+    return (raw[pos].astype(np.uint16) << 8) | raw[pos + 1]
+
+
+def _be32(raw, pos):
+    return (_be16(raw, pos).astype(np.uint32) << 16) | _be16(raw, pos + 2)
+
+
+def _le16(raw, pos):
+    return (raw[pos + 1].astype(np.uint16) << 8) | raw[pos]
+
+
+def _le32(raw, pos):
+    return (_le16(raw, pos + 2).astype(np.uint32) << 16) | _le16(raw, pos)
+
+
+def _ipv4_offsets(raw, index):
+    # Offset of the IPv4 header inside each record, or -1 if there is none.
+    offsets = index.offsets
+    caplens = index.caplens.astype(np.int64)
+    ip = np.full(len(offsets), -1, dtype=np.int64)
+
+    for linktype in np.unique(index.linktypes):
+        sel = np.flatnonzero(index.linktypes == linktype)
+        base = offsets[sel]
+        length = caplens[sel]
+        if linktype == LINKTYPE_ETHERNET:
+            ok = length >= 14
+            ethertype = np.where(ok, _be16(raw, np.where(ok, base + 12, 0)), 0)
+            vlan = (ethertype == ETHERTYPE_VLAN) & (length >= 18)
+            inner = np.where(vlan, _be16(raw, np.where(vlan, base + 16, 0)), 0)
+            ip[sel] = np.where(ethertype == ETHERTYPE_IPV4, 14,
+                               np.where(vlan & (inner == ETHERTYPE_IPV4), 18, -1))
+        elif linktype == LINKTYPE_LINUX_SLL:
+            ok = length >= 16
+            protocol = np.where(ok, _be16(raw, np.where(ok, base + 14, 0)), 0)
+            ip[sel] = np.where(protocol == ETHERTYPE_IPV4, 16, -1)
+        elif linktype == LINKTYPE_LINUX_SLL2:
+            ok = length >= 20
+            protocol = np.where(ok, _be16(raw, np.where(ok, base, 0)), 0)
+            ip[sel] = np.where(protocol == ETHERTYPE_IPV4, 20, -1)
+        elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4):
+            ok = length >= 1
+            version = np.where(ok, raw[np.where(ok, base, 0)] >> 4, 0)
+            ip[sel] = np.where(version == 4, 0, -1)
+        elif linktype == LINKTYPE_NULL:
+            ok = length >= 4
+            family = np.where(ok, raw[np.where(ok, base, 0)] | raw[np.where(ok, base + 3, 0)], 0)
+            ip[sel] = np.where(family == 2, 4, -1)
+    return ip
+
+
+def decode_tcp_columns(buf, index):
+    raw = np.frombuffer(buf, dtype=np.uint8)
+    ip_rel = _ipv4_offsets(raw, index)
+    caplens = index.caplens.astype(np.int64)
+
+    keep = np.flatnonzero((ip_rel >= 0) & (caplens >= ip_rel + 20))
+    ip = index.offsets[keep] + ip_rel[keep]
+    ver_ihl = raw[ip]
+    ihl = (ver_ihl & 0x0f).astype(np.int64) * 4
+    ok = ((ver_ihl >> 4) == 4) & (ihl >= 20) & (raw[ip + 9] == IPPROTO_TCP)
+    ok &= (_be16(raw, ip + 6) & 0x1fff) == 0
+    ok &= caplens[keep] >= ip_rel[keep] + ihl + 20
+
+    keep = keep[ok]
+    ip = ip[ok]
+    tcp = ip + ihl[ok]
+    total_len = _be16(raw, ip + 2)
+    header_len = ihl[ok] + (raw[tcp + 12] >> 4).astype(np.int64) * 4
+
+    packets = np.empty(len(keep), dtype=PACKET_DTYPE)
+    packets['ts'] = index.timestamps[keep]
+    packets['src_ip'] = _be32(raw, ip + 12)
+    packets['dst_ip'] = _be32(raw, ip + 16)
+    packets['src_port'] = _be16(raw, tcp)
+    packets['dst_port'] = _be16(raw, tcp + 2)
+    packets['seq'] = _be32(raw, tcp + 4)
+    packets['ack'] = _be32(raw, tcp + 8)
+    packets['flags'] = raw[tcp + 13]
+    packets['window'] = _be16(raw, tcp + 14)
+    packets['ip_len'] = total_len
+    packets['payload_len'] = np.clip(total_len.astype(np.int64) - header_len, 0, None)
+    record_ends = index.offsets[keep] + caplens[keep]
+    packets['sack_blocks'] = sack_block_counts(raw, tcp, record_ends)
+    return packets, tcp, record_ends
+
+
+def sack_block_counts(raw, tcp_offsets, record_ends):
+    # Walks the options of all segments in lockstep, one option per step, and
+    # records the block count of any SACK option. Like syn_window_scales the
+    # walk stops at the end of the captured bytes.
+    blocks = np.zeros(len(tcp_offsets), dtype=np.uint8)
+    end = np.minimum(tcp_offsets + (raw[tcp_offsets + 12] >> 4).astype(np.int64) * 4, record_ends)
+    pos = tcp_offsets + 20
+    active = np.flatnonzero(pos < end)
+    pos = pos[active]
+    end = end[active]
+    while len(active):
+        kind = raw[pos]
+        has_length = pos + 1 < end
+        length = np.where(kind == 1, 1, np.where(has_length, raw[np.where(has_length, pos + 1, pos)], 0))
+        valid = (kind == 1) | ((kind != 0) & has_length & (length >= 2))
+        sack = valid & (kind == 5)
+        blocks[active[sack]] = (length[sack] - 2) // 8
+        pos = pos + length
+        more = valid & (pos < end)
+        active = active[more]
+        pos = pos[more]
+        end = end[more]
+    return blocks
+
+
+def syn_window_scales(buf, packets, tcp_offsets, record_ends):
+    # Window scale option of every SYN segment, keyed by (src_ip, src_port).
+    # Only handshake packets are walked, so this stays off the per-packet path.
+    # The walk stops at the end of the captured bytes, which with a short
+    # snaplen may come before the end of the options.
+    scales = {}
+    for i in np.flatnonzero(packets['flags'] & TCP_SYN):
+        start = int(tcp_offsets[i])
+        end = min(start + ((buf[start + 12] >> 4) * 4), int(record_ends[i]))
+        pos = start + 20
+        while pos < end:
+            kind = buf[pos]
+            if kind == 0:
+                break
+            if kind == 1:
+                pos += 1
+                continue
+            if pos + 1 >= end:
+                break
+            length = buf[pos + 1]
+            if kind == 3 and length == 3 and pos + 2 < end:
+                scales[(int(packets['src_ip'][i]), int(packets['src_port'][i]))] = min(buf[pos + 2], 14)
+            if length < 2:
+                break
+            pos += length
+    return scales
+
+
+@contextmanager
+def mapped_capture(pcap_file):
+    if pcap_file.endswith('.gz'):
+        # Compressed rotation parts cannot be mapped; they are header-only
+        # captures, so reading one into memory is affordable.
+        with gzip.open(pcap_file, 'rb') as f:
+            yield f.read()
+        return
+    with open(pcap_file, 'rb') as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # mmap refuses empty files
+            yield b''
+            return
+        try:
+            yield buf
+        finally:
+            buf.close()
+
+
+def _decode_chunk(buf, index, with_window_scales):
+    packets, tcp_offsets, record_ends = decode_tcp_columns(buf, index)
+    scales = syn_window_scales(buf, packets, tcp_offsets, record_ends) if with_window_scales else {}
+    return packets, scales
+
+
+def _decode_file_chunk(pcap_file, index, with_window_scales):
+    with mapped_capture(pcap_file) as buf:
+        return _decode_chunk(buf, index, with_window_scales)
+
+
+def read_tcp_columns(pcap_file, with_window_scales=False, workers=1):
+    # Record boundaries can only be found by walking the headers in order, so
+    # the index is built here and the record-aligned chunks are decoded by the
+    # pool. Rows are independent, so merging is a plain ordered concatenate.
+    with mapped_capture(pcap_file) as buf:
+        index = index_records(buf)
+        chunks = [index.slice(start, start + CHUNK_RECORDS) for start in range(0, len(index), CHUNK_RECORDS)]
+        if workers > 1 and len(chunks) > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+                decoded = list(pool.map(_decode_file_chunk, repeat(pcap_file), chunks, repeat(with_window_scales)))
+        else:
+            decoded = [_decode_chunk(buf, chunk, with_window_scales) for chunk in chunks]
+
+    packets = np.concatenate([p for p, _ in decoded]) if decoded else np.empty(0, dtype=PACKET_DTYPE)
+    if with_window_scales:
+        scales = {}
+        for _, chunk_scales in decoded:
+            scales.update(chunk_scales)
+        return packets, scales
+    return packets
+
+
+def capture_parts(pcap_file):
+    # The files a capture was written to, oldest first. A plain capture is
+    # itself; a rotated one is the numbered tcpdump -C/-W files
+    # (<name>00, <name>01, ...) or dumpcap ring files (<stem>_00001_<time><ext>),
+    # either of which may have been gzipped after the capture stopped.
+    for candidate in (pcap_file, pcap_file + '.gz'):
+        if os.path.exists(candidate):
+            return [candidate]
+    stem, ext = os.path.splitext(pcap_file)
+    tcpdump_part = re.compile(re.escape(os.path.basename(pcap_file)) + r'\d+(\.gz)?$')
+    dumpcap_part = re.compile(re.escape(os.path.basename(stem)) + r'_\d{5}_\d{14}' + re.escape(ext) + r'(\.gz)?$')
+    parts = [path for path in glob.glob(glob.escape(stem) + '*')
+             if tcpdump_part.match(os.path.basename(path)) or dumpcap_part.match(os.path.basename(path))]
+    if not parts:
+        raise FileNotFoundError(f"No capture file or rotated parts found for {pcap_file}")
+    # Ring buffers reuse the lowest numbers once they wrap, so order by age
+    return sorted(parts, key=lambda path: (os.path.getmtime(path), path))
+
+
+def ip_to_str(ip):
+    ip = int(ip)
+    return f"{ip >> 24}.{(ip >> 16) & 0xff}.{(ip >> 8) & 0xff}.{ip & 0xff}"
+
+
+def host_name(ip):
+    # Mininet hands out 10.0.0.N to hN
+    ip = int(ip)
+    if ip >> 8 == 0x0a0000:
+        return f"h{ip & 0xff}"
+    return ip_to_str(ip)
@@ -0,0 +1,438 @@
+#!/usr/bin/env python
+
+import argparse
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+from binning import RatePyramid, BASE_WIDTH
+from capture_cache import load_capture_columns, DEFAULT_CACHE_MAX_BYTES
+from cwnd_sampler import load_samples
+from decimate import decimate, DEFAULT_POINTS, METHODS
+from iperf_json import load_iperf_json, rate_series, stream_ports, stream_series
+from pcap_columns import capture_parts, host_name, ip_to_str, TCP_ACK
+from qdisc_sampler import load_samples as load_qdisc_samples
+
+SEQ_MASK = 0xffffffff
+TC_H_ROOT = 0xffffffff
+PLOT_DEFAULTS = {'points': DEFAULT_POINTS, 'method': 'minmax'}
+# Bumped when a change here alters the graphs, so recorded renders go stale
+RENDER_VERSION = 1
+MANIFEST_NAME = '.render_manifest.json'
+
+
+def capture_name(pcap_file):
+    name = os.path.basename(pcap_file)
+    if name.endswith('.gz'):
+        name = name[:-3]
+    return os.path.splitext(name)[0]
+
+
+def client_packets(packets, server_ports):
+    return np.isin(packets['dst_port'], server_ports)
+
+
+def sender_hosts(packets, server_ports):
+    to_server = client_packets(packets, server_ports) & (packets['payload_len'] > 0)
+    return np.unique(packets['src_ip'][to_server])
+
+
+def host_rates(pyramid, metric, interval):
+    rates = {}
+    for ip in np.unique(pyramid.flows['src_ip']):
+        times, per_flow = pyramid.series(interval, metric, pyramid.flows['src_ip'] == ip)
+        rates[host_name(ip)] = per_flow.sum(axis=0)
+    return times, rates
+
+
+def busiest_flow(packets, server_ports, src_ip):
+    sel = client_packets(packets, server_ports) & (packets['src_ip'] == src_ip)
+    flows = packets[sel][['src_port', 'dst_ip', 'dst_port']]
+    keys, inverse = np.unique(flows, return_inverse=True)
+    totals = np.bincount(inverse.ravel(), weights=packets['payload_len'][sel], minlength=len(keys))
+    src_port, dst_ip, dst_port = keys[np.argmax(totals)].tolist()
+    return src_ip, src_port, dst_ip, dst_port
+
+
+def window_series(packets, scales, flow):
+    src_ip, src_port, dst_ip, dst_port = flow
+    fwd = ((packets['src_ip'] == src_ip) & (packets['src_port'] == src_port) &
+           (packets['dst_ip'] == dst_ip) & (packets['dst_port'] == dst_port))
+    rev = ((packets['src_ip'] == dst_ip) & (packets['src_port'] == dst_port) &
+           (packets['dst_ip'] == src_ip) & (packets['dst_port'] == src_port))
+    sel = np.flatnonzero(fwd | rev)
+    flow_packets = packets[sel]
+    is_fwd = fwd[sel]
+
+    isn = np.int64(flow_packets['seq'][is_fwd][0])
+    seq_end = ((flow_packets['seq'].astype(np.int64) - isn) & SEQ_MASK) + flow_packets['payload_len']
+    acked = ((flow_packets['ack'].astype(np.int64) - isn) & SEQ_MASK)
+    is_ack = ~is_fwd & ((flow_packets['flags'] & TCP_ACK) != 0)
+
+    # Highest sequence sent minus highest cumulative ACK seen, both carried
+    # forward in capture order.
+    snd_nxt = np.maximum.accumulate(np.where(is_fwd, seq_end, 0))
+    snd_una = np.maximum.accumulate(np.where(is_ack, acked, 0))
+    outstanding = np.clip(snd_nxt - snd_una, 0, None)
+
+    # The scale only applies when both ends offered it in their SYNs
+    shift = 0
+    if (src_ip, src_port) in scales and (dst_ip, dst_port) in scales:
+        shift = scales[(dst_ip, dst_port)]
+    window = flow_packets['window'][is_ack].astype(np.int64) << shift
+
+    ts = flow_packets['ts'] - packets['ts'].min()
+    return ts[is_ack], window, outstanding[is_ack]
+
+
+def plot_series(ax, x, y, plot_options, **kwargs):
+    # Series are cut down to the figure's resolution before matplotlib sees them
+    options = dict(PLOT_DEFAULTS, **(plot_options or {}))
+    ax.plot(*decimate(x, y, options['points'], options['method']), **kwargs)
+
+
+def plot_rates(name, metric, times, rates, outdir, plot_options=None):
+    plt.figure(figsize=(10, 6))
+    ax = plt.gca()
+    for host, rate in sorted(rates.items()):
+        plot_series(ax, times, rate, plot_options, label=host)
+    if len(rates) > 1:
+        plot_series(ax, times, np.sum(list(rates.values()), axis=0), plot_options,
+                    color='black', linestyle='--', label='Total')
+    plt.xlabel('Time (s)')
+    plt.ylabel(f'{metric.capitalize()} (Mbit/s)')
+    plt.title(f'{metric.capitalize()}: {name}')
+    plt.legend()
+    plt.grid(True)
+    path = os.path.join(outdir, f'{name}_{metric}.pdf')
+    plt.savefig(path)
+    plt.close()
+    return path
+
+
+def plot_window(name, suffix, flow, series, outdir, plot_options=None):
+    ts, window, outstanding = series
+    src_ip, src_port, dst_ip, dst_port = flow
+    plt.figure(figsize=(10, 6))
+    ax = plt.gca()
+    plot_series(ax, ts, window, plot_options, label='Receive window (B)')
+    plot_series(ax, ts, outstanding, plot_options, label='Unacked (outstanding) bytes (B)')
+    plt.xlabel('Time (s)')
+    plt.ylabel('Bytes')
+    plt.title(f'Window scaling for {ip_to_str(src_ip)}:{src_port} -> {ip_to_str(dst_ip)}:{dst_port}')
+    plt.legend()
+    plt.grid(True)
+    path = os.path.join(outdir, f'{name}_tcpWindowSize{suffix}.pdf')
+    plt.savefig(path)
+    plt.close()
+    return path
+
+
+def client_logs(sample_file):
+    # The iperf3 client logs of the sampled host, <host>_<port>.json beside
+    # its <host>_cwnd.bin
+    directory = os.path.dirname(os.path.abspath(sample_file))
+    host = os.path.basename(sample_file)[:-len('_cwnd.bin')]
+    return sorted(glob.glob(os.path.join(glob.escape(directory), glob.escape(host) + '_*.json')))
+
+
+def data_stream_samples(samples, sample_file):
+    # The sampler records every socket towards the server ports, iperf3's
+    # control connection included; which of them carried data is only known
+    # from the client logs written when iperf3 exits. Without logs every
+    # socket is kept.
+    streams = set()
+    for log in client_logs(sample_file):
+        try:
+            streams |= stream_ports(log)
+        except (OSError, ValueError):
+            continue
+    if not streams:
+        return samples
+    keys = (samples['sport'].astype(np.uint32) << 16) | samples['dport']
+    wanted = np.array([(sport << 16) | dport for sport, dport in streams if sport and dport], dtype=np.uint32)
+    return samples[np.isin(keys, wanted)]
+
+
+def render_cwnd_samples(sample_file, outdir, plot_options=None):
+    # Sampler output sits in the run directory, so its name disambiguates
+    # h1_cwnd.bin files of different runs.
+    run = os.path.basename(os.path.dirname(os.path.abspath(sample_file)))
+    name = f'{run}_{capture_name(sample_file)}'
+    samples = data_stream_samples(load_samples(sample_file), sample_file)
+    if len(samples) == 0:
+        print(f"[{name}] no tcp_info samples")
+        return []
+
+    t0 = samples['ts'].min()
+    fig, (ax_cwnd, ax_rtt) = plt.subplots(2, 1, figsize=(10, 8), sharex=True)
+    for sport in np.unique(samples['sport']):
+        flow = samples[samples['sport'] == sport]
+        plot_series(ax_cwnd, flow['ts'] - t0, flow['cwnd'], plot_options, linewidth=0.8, label=f':{sport}')
+        plot_series(ax_rtt, flow['ts'] - t0, flow['srtt_us'] / 1000.0, plot_options, linewidth=0.8)
+    ax_cwnd.set_ylabel('cwnd (segments)')
+    ax_cwnd.set_title(f'Sender congestion window: {name}')
+    ax_cwnd.grid(True)
+    ax_rtt.set_xlabel('Time (s)')
+    ax_rtt.set_ylabel('Smoothed RTT (ms)')
+    ax_rtt.grid(True)
+    path = os.path.join(outdir, f'{name}.pdf')
+    fig.savefig(path)
+    plt.close(fig)
+    print(f"[{name}] {len(samples)} samples")
+    return [path]
+
+
+def render_qdisc_samples(sample_file, outdir, plot_options=None):
+    # The root qdisc of each interface holds the whole queue (TCLink's htb
+    # counts what its netem/leaf children hold); with the link rate from the
+    # sampler header the backlog reads as queueing delay.
+    run = os.path.basename(os.path.dirname(os.path.abspath(sample_file)))
+    name = f'{run}_{capture_name(sample_file)}'
+    samples, interfaces = load_qdisc_samples(sample_file)
+    samples = samples[samples['parent'] == TC_H_ROOT]
+    if len(samples) == 0:
+        print(f"[{name}] no qdisc samples")
+        return []
+
+    t0 = samples['ts'].min()
+    fig, (ax_backlog, ax_delay, ax_drops) = plt.subplots(3, 1, figsize=(10, 10), sharex=True)
+    for ifindex, interface in sorted(interfaces.items()):
+        rows = samples[samples['ifindex'] == ifindex]
+        if len(rows) < 2:
+            continue
+        ts = rows['ts'] - t0
+        label = interface['name']
+        plot_series(ax_backlog, ts, rows['qlen'], plot_options, linewidth=0.8, label=label)
+        if interface['rate_mbit']:
+            delay_ms = rows['backlog'] * 8.0 / (interface['rate_mbit'] * 1e3)
+            plot_series(ax_delay, ts, delay_ms, plot_options, linewidth=0.8, label=label)
+        # Counters are cumulative; per-sample differences give rates
+        dt = np.diff(rows['ts'])
+        dt[dt <= 0] = np.nan
+        plot_series(ax_drops, ts[1:], np.diff(rows['drops'].astype(np.int64)) / dt, plot_options,
+                    linewidth=0.8, label=f'{label} drops')
+        plot_series(ax_drops, ts[1:], np.diff(rows['overlimits'].astype(np.int64)) / dt, plot_options,
+                    linewidth=0.8, linestyle='--', label=f'{label} overlimits')
+    ax_backlog.set_ylabel('Backlog (packets)')
+    ax_backlog.set_title(f'Bottleneck queue: {name}')
+    ax_backlog.legend()
+    ax_delay.set_ylabel('Queueing delay (ms)')
+    ax_drops.set_ylabel('Events/s')
+    ax_drops.set_xlabel('Time (s)')
+    ax_drops.legend()
+    for ax in (ax_backlog, ax_delay, ax_drops):
+        ax.grid(True)
+    path = os.path.join(outdir, f'{name}.pdf')
+    fig.savefig(path)
+    plt.close(fig)
+    print(f"[{name}] {len(samples)} root qdisc samples, max backlog {int(samples['qlen'].max())} packets")
+    return [path]
+
+
+def render_iperf_log(log_file, outdir, plot_options=None):
+    # Like the sampler output, iperf3 logs are named per host and port
+    # inside a run directory.
+    run = os.path.basename(os.path.dirname(os.path.abspath(log_file)))
+    name = f'{run}_{capture_name(log_file)}'
+    intervals, _ = load_iperf_json(log_file)
+    if len(intervals) == 0:
+        print(f"[{name}] no iperf3 intervals")
+        return []
+
+    times, rates = rate_series(intervals)
+    sender = bool(intervals['sender'].all())
+    if not sender:
+        path = plot_rates(name, 'goodput', times, {'iperf3 receiver': rates}, outdir, plot_options)
+        print(f"[{name}] {len(intervals)} receiver intervals")
+        return [path]
+
+    fig, (ax_rate, ax_cwnd, ax_rtt) = plt.subplots(3, 1, figsize=(10, 10), sharex=True)
+    plot_series(ax_rate, times, rates, plot_options, color='black')
+    ax_rate.set_ylabel('Sent (Mbit/s)')
+    ax_rate.set_title(f'iperf3 sender: {name}')
+    for ts, cwnd in stream_series(intervals, 'snd_cwnd').values():
+        plot_series(ax_cwnd, ts, cwnd / 1024.0, plot_options, linewidth=0.8)
+    for ts, rtt in stream_series(intervals, 'rtt_us').values():
+        plot_series(ax_rtt, ts, rtt / 1000.0, plot_options, linewidth=0.8)
+    ax_cwnd.set_ylabel('snd_cwnd (KiB)')
+    ax_rtt.set_ylabel('RTT (ms)')
+    ax_rtt.set_xlabel('Time (s)')
+    for ax in (ax_rate, ax_cwnd, ax_rtt):
+        ax.grid(True)
+    path = os.path.join(outdir, f'{name}.pdf')
+    fig.savefig(path)
+    plt.close(fig)
+    print(f"[{name}] {len(intervals)} sender intervals, {int(intervals['retransmits'].sum())} retransmits")
+    return [path]
+
+
+def render_capture(pcap_file, outdir, server_ports, interval, cache_options, plot_options=None):
+    name = capture_name(pcap_file)
+    packets, scales = load_capture_columns(pcap_file, **cache_options)
+    if len(packets) == 0:
+        print(f"[{name}] no TCP packets found")
+        return []
+
+    # Sender traffic only; goodput in the pyramid counts each payload byte
+    # once (see seq_tracker), so retransmissions and duplicates drop out.
+    to_server = client_packets(packets, server_ports) & np.isin(packets['src_ip'], sender_hosts(packets, server_ports))
+    pyramid = RatePyramid.build(packets[to_server])
+    times, rates = host_rates(pyramid, 'ip_len', interval)
+    paths = [plot_rates(name, 'throughput', times, rates, outdir, plot_options)]
+    times, rates = host_rates(pyramid, 'payload', interval)
+    paths.append(plot_rates(name, 'goodput', times, rates, outdir, plot_options))
+
+    senders = sender_hosts(packets, server_ports)
+    for ip in senders:
+        flow = busiest_flow(packets, server_ports, ip)
+        suffix = host_name(ip) if len(senders) > 1 else ''
+        paths.append(plot_window(name, suffix, flow, window_series(packets, scales, flow), outdir, plot_options))
+    print(f"[{name}] {len(packets)} TCP packets, {len(senders)} sender host(s)")
+    return paths
+
+
+def render_file(path, outdir, server_ports, interval, cache_options, plot_options):
+    if path.endswith('_cwnd.bin'):
+        return render_cwnd_samples(path, outdir, plot_options)
+    if path.endswith('_qdisc.bin'):
+        return render_qdisc_samples(path, outdir, plot_options)
+    if path.endswith('.json'):
+        return render_iperf_log(path, outdir, plot_options)
+    return render_capture(path, outdir, server_ports, interval, cache_options, plot_options)
+
+
+def render_job(path, outdir, server_ports, interval, cache_options, plot_options):
+    # Runs in a pool worker; a failure costs this file's graphs, not the batch
+    try:
+        return path, render_file(path, outdir, server_ports, interval, cache_options, plot_options)
+    except Exception as err:
+        print(f"[{capture_name(path)}] rendering failed: {err!r}")
+        return path, None
+
+
+def manifest_path(path, outdir):
+    # Manifest paths are relative to the output directory, so the manifest
+    # still holds when the tree is moved or checked out elsewhere.
+    return os.path.relpath(path, outdir)
+
+
+def source_state(path, settings, outdir):
+    # What a file's graphs depend on: its bytes on disk (every rotated part
+    # of a capture, the client logs that tcp_info samples are filtered by)
+    # and the settings they were drawn with.
+    if path.endswith('_cwnd.bin'):
+        parts = [path] + client_logs(path)
+    elif path.endswith(('_qdisc.bin', '.json')):
+        parts = [path]
+    else:
+        parts = capture_parts(path)
+    files = []
+    for part in parts:
+        st = os.stat(part)
+        files.append([manifest_path(part, outdir), st.st_size, st.st_mtime_ns])
+    return {'files': files, 'settings': settings}
+
+
+def load_manifest(outdir):
+    try:
+        with open(os.path.join(outdir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(outdir, manifest):
+    path = os.path.join(outdir, MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def up_to_date(entry, state, outdir):
+    return (entry is not None and entry['source'] == state and
+            all(os.path.exists(os.path.join(outdir, output)) for output in entry['outputs']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Goodput, throughput and window graphs from iperf3 captures")
+    parser.add_argument('pcap_files', nargs='+',
+                        help='Captures (e.g. /tmp/a_capture_bbr.pcap, which also picks up its rotated '
+                             'parts), tcp_info samples (h1_cwnd.bin), qdisc samples (s2-s3_qdisc.bin) '
+                             'or iperf3 logs (h1_5001.json) written by ccComparisons.py.')
+    parser.add_argument('--outdir', default='graphs',
+                        help='Directory the PDF graphs are written to.')
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help=f'Bin width in seconds for the goodput/throughput graphs (a multiple of {BASE_WIDTH}).')
+    parser.add_argument('--server_ports', type=int, nargs='+', default=[5001, 5002, 5003],
+                        help='iperf3 server ports; packets towards them are treated as sender traffic.')
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+                        help='Always decode the capture and do not write the .pcap_cache entry.')
+    parser.add_argument('--rebuild-cache', action='store_true',
+                        help='Decode the capture again and overwrite its cache entry.')
+    parser.add_argument('--cache_max_mb', type=int, default=DEFAULT_CACHE_MAX_BYTES >> 20,
+                        help='Size cap of each .pcap_cache directory; least recently used entries are evicted.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Processes used to decode record-aligned chunks of each capture; '
+                             'split between the --jobs renders running at once.')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+                        help='Input files rendered in parallel, one process each.')
+    parser.add_argument('--points', type=int, default=DEFAULT_POINTS,
+                        help='Points each plotted series is reduced to before drawing.')
+    parser.add_argument('--decimation', choices=METHODS, default='minmax',
+                        help='minmax keeps the extremes of every pixel column (spikes and window drops), '
+                             'lttb picks one visually representative point per bucket, none plots every point.')
+    parser.add_argument('--force', action='store_true',
+                        help='Render every input, even when its graphs are up to date.')
+    args = parser.parse_args()
+
+    plot_options = {'points': args.points, 'method': args.decimation}
+    settings = dict(plot_options, version=RENDER_VERSION, interval=args.interval,
+                    server_ports=sorted(args.server_ports))
+    os.makedirs(args.outdir, exist_ok=True)
+    manifest = load_manifest(args.outdir)
+
+    # Only inputs whose data or settings changed since their graphs were
+    # drawn are rendered again.
+    pending = []
+    states = {}
+    for path in dict.fromkeys(args.pcap_files):
+        states[path] = source_state(path, settings, args.outdir)
+        if args.force or not up_to_date(manifest.get(manifest_path(path, args.outdir)), states[path], args.outdir):
+            pending.append(path)
+    print(f"Rendering {len(pending)} of {len(states)} input(s), {len(states) - len(pending)} up to date")
+    if not pending:
+        return
+
+    jobs = max(1, min(args.jobs, len(pending)))
+    cache_options = {
+        'use_cache': args.use_cache,
+        'rebuild': args.rebuild_cache,
+        'max_bytes': args.cache_max_mb << 20,
+        'workers': max(1, args.workers // jobs),
+    }
+    job_args = (args.outdir, args.server_ports, args.interval, cache_options, plot_options)
+    if jobs == 1:
+        results = [render_job(path, *job_args) for path in pending]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(render_job, pending, *map(repeat, job_args)))
+
+    for path, outputs in results:
+        if outputs is not None:
+            manifest[manifest_path(path, args.outdir)] = {
+                'source': states[path],
+                'outputs': [manifest_path(output, args.outdir) for output in outputs],
+            }
+    save_manifest(args.outdir, manifest)
+
+
+if __name__ == '__main__':
+    main()
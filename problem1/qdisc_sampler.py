@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import os
+import signal
+import socket
+import struct
+import threading
+import time
+
+from netlink_dump import dump, fixed_rate
+
+# rtnetlink constants from linux/netlink.h, linux/rtnetlink.h, linux/pkt_sched.h, linux/gen_stats.h
+NETLINK_ROUTE = 0
+RTM_NEWQDISC = 36
+RTM_GETQDISC = 38
+NLM_F_REQUEST = 0x001
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLA_TYPE_MASK = 0x3fff
+TCA_KIND = 1
+TCA_STATS2 = 7
+TCA_STATS_BASIC = 1
+TCA_STATS_QUEUE = 3
+
+_NLMSG_HEADER = struct.Struct('=IHHII')
+_TCMSG = struct.Struct('=BxxxiIII')
+_RTATTR = struct.Struct('=HH')
+_STATS_BASIC = struct.Struct('=QI')
+_STATS_QUEUE = struct.Struct('=IIIII')
+
+FILE_MAGIC = b'QDSC0001'
+# ts, ifindex, kind, handle, parent, bytes, packets, qlen, backlog, drops, requeues, overlimits;
+# everything after parent is the kernel's running counter or current queue state.
+RECORD = struct.Struct('<dI8sIIQIIIIII')
+
+
+def dump_request(seq, ifindex=0):
+    body = _TCMSG.pack(socket.AF_UNSPEC, ifindex, 0, 0, 0)
+    return _NLMSG_HEADER.pack(_NLMSG_HEADER.size + len(body), RTM_GETQDISC,
+                              NLM_F_REQUEST | NLM_F_DUMP, seq, 0) + body
+
+
+def parse_stats2(data, pos, end, stats):
+    while pos + _RTATTR.size <= end:
+        attr_len, attr_type = _RTATTR.unpack_from(data, pos)
+        if attr_len < _RTATTR.size:
+            break
+        attr_type &= NLA_TYPE_MASK
+        if attr_type == TCA_STATS_BASIC and attr_len >= _RTATTR.size + _STATS_BASIC.size:
+            stats['bytes'], stats['packets'] = _STATS_BASIC.unpack_from(data, pos + _RTATTR.size)
+        elif attr_type == TCA_STATS_QUEUE and attr_len >= _RTATTR.size + _STATS_QUEUE.size:
+            (stats['qlen'], stats['backlog'], stats['drops'], stats['requeues'],
+             stats['overlimits']) = _STATS_QUEUE.unpack_from(data, pos + _RTATTR.size)
+        pos += (attr_len + 3) & ~3
+
+
+def parse_qdisc_messages(data, ifindexes):
+    # Decodes one recv() worth of RTM_NEWQDISC replies into stats dicts for
+    # the wanted interfaces, and reports whether NLMSG_DONE was among them.
+    samples = []
+    pos = 0
+    while pos + _NLMSG_HEADER.size <= len(data):
+        length, msg_type, _, _, _ = _NLMSG_HEADER.unpack_from(data, pos)
+        if msg_type == NLMSG_DONE or length < _NLMSG_HEADER.size:
+            return samples, True
+        if msg_type == NLMSG_ERROR:
+            raise OSError("RTM_GETQDISC request failed")
+        end = pos + length
+        if msg_type == RTM_NEWQDISC:
+            _, ifindex, handle, parent, _ = _TCMSG.unpack_from(data, pos + _NLMSG_HEADER.size)
+            if ifindex in ifindexes:
+                stats = {'ifindex': ifindex, 'handle': handle, 'parent': parent, 'kind': b'',
+                         'bytes': 0, 'packets': 0, 'qlen': 0, 'backlog': 0, 'drops': 0,
+                         'requeues': 0, 'overlimits': 0}
+                attr = pos + _NLMSG_HEADER.size + _TCMSG.size
+                while attr + _RTATTR.size <= end:
+                    attr_len, attr_type = _RTATTR.unpack_from(data, attr)
+                    if attr_len < _RTATTR.size:
+                        break
+                    attr_type &= NLA_TYPE_MASK
+                    if attr_type == TCA_KIND:
+                        stats['kind'] = bytes(data[attr + _RTATTR.size:attr + attr_len]).rstrip(b'\0')
+                    elif attr_type == TCA_STATS2:
+                        parse_stats2(data, attr + _RTATTR.size, attr + attr_len, stats)
+                    attr += (attr_len + 3) & ~3
+                samples.append(stats)
+        pos += (length + 3) & ~3
+    return samples, False
+
+
+def sample_once(sock, seq, ifindexes):
+    # The kernel dumps every qdisc on the host; the rest are skipped while parsing
+    request = dump_request(seq, next(iter(ifindexes)) if len(ifindexes) == 1 else 0)
+    return dump(sock, request, lambda data: parse_qdisc_messages(data, ifindexes))
+
+
+def parse_interface(text):
+    # 's2-eth3' or 's2-eth3:50', the latter with the link rate in Mbit/s
+    name, _, rate = text.partition(':')
+    return name, float(rate) if rate else None
+
+
+def run_sampler(output, interfaces, interval, duration=None, stop=None):
+    # interfaces: name -> link rate in Mbit/s (or None), kept in the file
+    # header so backlog can later be turned into queueing delay.
+    ifindexes = {socket.if_nametoindex(name): name for name in interfaces}
+    header = json.dumps({'interfaces': {str(index): {'name': name, 'rate_mbit': interfaces[name]}
+                                        for index, name in ifindexes.items()}}).encode()
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+    with open(output, 'wb') as f:
+        f.write(FILE_MAGIC + struct.pack('<I', len(header)) + header)
+        for seq in fixed_rate(interval, duration, stop):
+            now = time.time()
+            for s in sample_once(sock, seq, ifindexes):
+                f.write(RECORD.pack(now, s['ifindex'], s['kind'][:8], s['handle'], s['parent'], s['bytes'],
+                                    s['packets'], s['qlen'], s['backlog'], s['drops'], s['requeues'],
+                                    s['overlimits']))
+    sock.close()
+
+
+def load_samples(path):
+    # Returns the records and ifindex -> {'name', 'rate_mbit'} of the sampled interfaces
+    import numpy as np
+
+    dtype = np.dtype([
+        ('ts', '<f8'), ('ifindex', '<u4'), ('kind', 'S8'), ('handle', '<u4'), ('parent', '<u4'),
+        ('bytes', '<u8'), ('packets', '<u4'), ('qlen', '<u4'), ('backlog', '<u4'), ('drops', '<u4'),
+        ('requeues', '<u4'), ('overlimits', '<u4'),
+    ])
+    with open(path, 'rb') as f:
+        if f.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            raise ValueError(f"{path} is not a qdisc sample file")
+        header_len = struct.unpack('<I', f.read(4))[0]
+        header = json.loads(f.read(header_len))
+        data = f.read()
+    usable = len(data) - len(data) % dtype.itemsize
+    interfaces = {int(index): value for index, value in header['interfaces'].items()}
+    return np.frombuffer(data[:usable], dtype=dtype), interfaces
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sample qdisc backlog, drop and overlimit counters via rtnetlink")
+    parser.add_argument('--output', required=True,
+                        help='Binary time series to write.')
+    parser.add_argument('--interfaces', nargs='+', required=True,
+                        help="Interfaces whose qdiscs are sampled, as 'name' or 'name:rate_mbit'.")
+    parser.add_argument('--interval_ms', type=float, default=5.0,
+                        help='Sampling period in milliseconds.')
+    parser.add_argument('--duration', type=float, default=None,
+                        help='Stop after this many seconds (default: until SIGINT/SIGTERM).')
+    args = parser.parse_args()
+
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    interfaces = dict(parse_interface(text) for text in args.interfaces)
+    run_sampler(args.output, interfaces, args.interval_ms / 1000.0, args.duration, stop)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# A run is flagged invalid when, averaged over its traffic phase, one CPU
+# of the emulation host was this busy (or this much in softirq): the
+# switches, qdiscs and veth pairs all run there, so the bottleneck may
+# have been the host rather than the congestion-control algorithm.
+CPU_BUSY_LIMIT = 0.9
+SOFTIRQ_LIMIT = 0.5
+CPU_SAMPLE_INTERVAL = 1.0
+
+TCPDUMP_STATS = {
+    'captured': re.compile(r'(\d+) packets? captured'),
+    'received': re.compile(r'(\d+) packets? received by filter'),
+    'dropped': re.compile(r'(\d+) packets? dropped by kernel'),
+    'dropped_by_interface': re.compile(r'(\d+) packets? dropped by interface'),
+}
+DUMPCAP_STATS = re.compile(r"Packets received/dropped on interface '[^']*': (\d+)/(\d+)")
+
+
+def read_cpu_times():
+    # cpu id -> (busy, softirq, total) jiffies; guest time is already in user
+    times = {}
+    with open('/proc/stat') as f:
+        for line in f:
+            if not line.startswith('cpu') or line.startswith('cpu '):
+                continue
+            name, *fields = line.split()
+            user, nice, system, idle, iowait, irq, softirq, steal = (int(v) for v in fields[:8])
+            total = user + nice + system + idle + iowait + irq + softirq + steal
+            times[name] = (total - idle - iowait, softirq, total)
+    return times
+
+
+class CpuSampler:
+    # Samples per-CPU busy and softirq shares of the whole host in a
+    # background thread; Mininet hosts share its kernel, so this is where
+    # every emulated packet is switched, shaped and delivered.
+
+    def __init__(self, interval=CPU_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples = []
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.first = None
+        self.last = None
+
+    def start(self):
+        self.first = self.last = read_cpu_times()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        now = read_cpu_times()
+        busy, softirq = shares(self.last, now)
+        if busy:
+            self.samples.append((max(busy.values()), max(softirq.values())))
+        self.last = now
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+        self.sample()
+        busy, softirq = shares(self.first, self.last)
+        if not busy:
+            return None
+        return {
+            'cpus': len(busy),
+            'busy_mean': sum(busy.values()) / len(busy),
+            'busy_max_cpu': max(busy.values()),
+            'softirq_mean': sum(softirq.values()) / len(softirq),
+            'softirq_max_cpu': max(softirq.values()),
+            'busy_peak': max((sample[0] for sample in self.samples), default=0.0),
+            'softirq_peak': max((sample[1] for sample in self.samples), default=0.0),
+        }
+
+
+def shares(before, after):
+    busy = {}
+    softirq = {}
+    for cpu, (busy_after, softirq_after, total_after) in after.items():
+        if cpu not in before:
+            continue
+        busy_before, softirq_before, total_before = before[cpu]
+        total = total_after - total_before
+        if total > 0:
+            busy[cpu] = (busy_after - busy_before) / total
+            softirq[cpu] = (softirq_after - softirq_before) / total
+    return busy, softirq
+
+
+def read_capture_stats(log_file):
+    # What tcpdump or dumpcap printed to stderr when it was stopped
+    try:
+        with open(log_file) as f:
+            text = f.read()
+    except OSError:
+        return None
+    match = DUMPCAP_STATS.search(text)
+    if match:
+        return {'received': int(match.group(1)), 'dropped': int(match.group(2))}
+    stats = {}
+    for key, pattern in TCPDUMP_STATS.items():
+        match = pattern.search(text)
+        if match:
+            stats[key] = int(match.group(1))
+    return stats or None
+
+
+class CommandTimes:
+    # Wall-clock time of every Node.cmd call, per command name. cmdPrint,
+    # dpctl and the TCIntf/Intf helpers all go through cmd, so wrapping it
+    # on each node covers them.
+
+    def __init__(self):
+        self.commands = {}
+
+    def wrap(self, nodes):
+        for node in nodes:
+            node.cmd = self.timed(node.cmd)
+
+    def timed(self, cmd):
+        def timed_cmd(*args, **kwargs):
+            start = time.monotonic()
+            try:
+                return cmd(*args, **kwargs)
+            finally:
+                self.record(' '.join(str(arg) for arg in args), time.monotonic() - start)
+        return timed_cmd
+
+    def record(self, command, seconds):
+        words = command.split()
+        name = os.path.basename(words[0]) if words else ''
+        count, total, longest = self.commands.get(name, (0, 0.0, 0.0))
+        self.commands[name] = (count + 1, total + seconds, max(longest, seconds))
+
+    def take(self):
+        # Hands over what was recorded since the last call
+        commands, self.commands = self.commands, {}
+        return {name: {'count': count, 'seconds': total, 'max_seconds': longest}
+                for name, (count, total, longest) in sorted(commands.items())}
+
+
+class RunMetrics:
+    # Where one experiment run spent its time and whether the emulation
+    # host kept up, written as <outdir>/run_metrics.json and as a Prometheus
+    # textfile-collector file, run_metrics.prom.
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.origin = time.monotonic()
+        self.phases = []
+        self.commands = {}
+        self.cpu = None
+        self.capture = None
+        self.problems = []
+        self.sampler = None
+
+    @contextmanager
+    def phase(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases.append({'phase': name, 'start': start - self.origin,
+                                'seconds': time.monotonic() - start})
+
+    def start_cpu_sampling(self, interval=CPU_SAMPLE_INTERVAL):
+        self.sampler = CpuSampler(interval)
+        self.sampler.start()
+
+    def stop_cpu_sampling(self):
+        if self.sampler is not None:
+            self.cpu = self.sampler.stop()
+            self.sampler = None
+
+    def invalidate(self, problem):
+        self.problems.append(problem)
+
+    def check_limits(self):
+        if self.capture and (self.capture.get('dropped') or self.capture.get('dropped_by_interface')):
+            self.invalidate('capture_drops')
+        if self.cpu and self.cpu['busy_max_cpu'] >= CPU_BUSY_LIMIT:
+            self.invalidate('cpu_saturated')
+        if self.cpu and self.cpu['softirq_max_cpu'] >= SOFTIRQ_LIMIT:
+            self.invalidate('softirq_saturated')
+
+    def summary(self):
+        return {
+            'labels': self.labels,
+            'valid': not self.problems,
+            'problems': self.problems,
+            'phases': self.phases,
+            'commands': self.commands,
+            'cpu': self.cpu,
+            'capture': self.capture,
+        }
+
+    def prometheus(self):
+        labels = ','.join(f'{key}="{value}"' for key, value in self.labels.items())
+        lines = []
+
+        def metric(name, kind, text, values):
+            lines.append(f'# HELP {name} {text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for extra, value in values:
+                lines.append(f'{name}{{{labels}{extra}}} {value:g}')
+
+        phase_seconds = {}
+        for phase in self.phases:
+            phase_seconds[phase['phase']] = phase_seconds.get(phase['phase'], 0.0) + phase['seconds']
+        metric('experiment_phase_seconds', 'gauge', 'Wall-clock seconds spent in each phase of the run.',
+               [(f',phase="{name}"', seconds) for name, seconds in phase_seconds.items()])
+        metric('experiment_commands_total', 'counter', 'Node.cmd calls per command.',
+               [(f',command="{name}"', c['count']) for name, c in self.commands.items()])
+        metric('experiment_command_seconds_total', 'counter', 'Wall-clock seconds spent in Node.cmd per command.',
+               [(f',command="{name}"', c['seconds']) for name, c in self.commands.items()])
+        if self.cpu:
+            metric('experiment_cpu_busy_ratio', 'gauge', 'Busy share of the host CPUs during the traffic phase.',
+                   [(',cpu="mean"', self.cpu['busy_mean']), (',cpu="max"', self.cpu['busy_max_cpu'])])
+            metric('experiment_cpu_softirq_ratio', 'gauge', 'Softirq share of the host CPUs during the traffic phase.',
+                   [(',cpu="mean"', self.cpu['softirq_mean']), (',cpu="max"', self.cpu['softirq_max_cpu'])])
+        if self.capture:
+            metric('experiment_capture_packets', 'gauge', 'Packet counts reported by the capture on exit.',
+                   [(f',kind="{key}"', value) for key, value in self.capture.items()])
+        metric('experiment_run_valid', 'gauge', '1 if nothing suggests the emulation host limited the run.',
+               [('', 0 if self.problems else 1)])
+        if self.problems:
+            metric('experiment_run_problem', 'gauge', 'Reasons the run was flagged invalid.',
+                   [(f',problem="{problem}"', 1) for problem in self.problems])
+        return '\n'.join(lines) + '\n'
+
+    def write(self, outdir):
+        with open(os.path.join(outdir, 'run_metrics.json'), 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+        # Written aside and renamed so a node_exporter scrape never sees half a file
+        path = os.path.join(outdir, 'run_metrics.prom')
+        with open(path + '.tmp', 'w') as f:
+            f.write(self.prometheus())
+        os.replace(path + '.tmp', path)
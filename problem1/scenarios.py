@@ -0,0 +1,124 @@
+import json
+
+# Switch-to-switch links a scenario can parametrise, as 'sA-sB'
+SWITCH_LINKS = ['s1-s2', 's2-s3', 's3-s4']
+
+# Every flow is an iperf3 client towards `server`; fields left out take these values
+FLOW_DEFAULTS = {
+    'server': 'h7',
+    'start': 0.0,
+    'duration': 150.0,
+    'rate': '10M',
+    'streams': 10,
+}
+
+UNIT_MBIT = {'K': 1e-3, 'M': 1.0, 'G': 1e3}
+
+# A scenario holds:
+#   links        TCLink parameters (bw in Mbit/s, loss in %, delay as '5ms')
+#                of the switch-to-switch links when the network is built
+#   flows        iperf3 clients: host, port and optionally the FLOW_DEFAULTS fields
+#   events       changes applied at an offset from the first client: 'status'
+#                ('up'/'down') and/or link parameters on one link
+#   capture_interface  'any', or omitted for the server's default interface
+# Link state changed by an event is restored once the scenario is over.
+SCENARIOS = {
+    'a': {
+        'links': {},
+        'flows': [{'host': 'h1', 'port': 5001}],
+    },
+    'b': {
+        'links': {},
+        'flows': [
+            {'host': 'h1', 'port': 5001, 'start': 0, 'duration': 150},
+            {'host': 'h3', 'port': 5002, 'start': 15, 'duration': 120},
+            {'host': 'h4', 'port': 5003, 'start': 30, 'duration': 90},
+        ],
+    },
+    'c.1': {
+        'links': {'s1-s2': {'bw': 100}, 's2-s3': {'bw': 50}, 's3-s4': {'bw': 100}},
+        'flows': [{'host': 'h3', 'port': 5001}],
+        'events': [{'at': 0, 'link': 's1-s2', 'status': 'down'}],
+        'capture_interface': 'any',
+    },
+    'c.2a': {
+        'links': {'s1-s2': {'bw': 100}, 's2-s3': {'bw': 50}, 's3-s4': {'bw': 100}},
+        'flows': [{'host': 'h1', 'port': 5001}, {'host': 'h2', 'port': 5002}],
+        'capture_interface': 'any',
+    },
+    'c.2b': {
+        'links': {'s1-s2': {'bw': 100}, 's2-s3': {'bw': 50}, 's3-s4': {'bw': 100}},
+        'flows': [{'host': 'h1', 'port': 5001}, {'host': 'h3', 'port': 5002}],
+        'capture_interface': 'any',
+    },
+    'c.2c': {
+        'links': {'s1-s2': {'bw': 100}, 's2-s3': {'bw': 50}, 's3-s4': {'bw': 100}},
+        'flows': [{'host': 'h1', 'port': 5001}, {'host': 'h3', 'port': 5002}, {'host': 'h4', 'port': 5003}],
+        'capture_interface': 'any',
+    },
+}
+
+# (d) repeats (c) over a lossy bottleneck; the loss itself comes from --loss
+for _name in ['1', '2a', '2b', '2c']:
+    SCENARIOS[f'd.{_name}'] = dict(SCENARIOS[f'c.{_name}'])
+
+
+def parse_rate_mbit(rate):
+    rate = str(rate)
+    if rate[-1:].upper() in UNIT_MBIT:
+        return float(rate[:-1]) * UNIT_MBIT[rate[-1].upper()]
+    return float(rate) / 1e6
+
+
+def flow_spec(flow):
+    return dict(FLOW_DEFAULTS, **flow)
+
+
+def flow_ports(scenario):
+    return sorted({int(flow['port']) for flow in map(flow_spec, scenario['flows'])})
+
+
+def sender_hosts(scenario):
+    return list(dict.fromkeys(flow['host'] for flow in map(flow_spec, scenario['flows'])))
+
+
+def server_host(scenario):
+    # The capture runs on the server host, so one scenario has one server
+    servers = list(dict.fromkeys(flow['server'] for flow in map(flow_spec, scenario['flows'])))
+    if len(servers) != 1:
+        raise ValueError(f"every flow of a scenario must use the same server, got {', '.join(servers)}")
+    return servers[0]
+
+
+def port_filter(ports):
+    return 'tcp and (' + ' or '.join(f'port {port}' for port in ports) + ')'
+
+
+def demand_mbit(scenario):
+    # iperf3 applies -b to each of the -P streams
+    return sum(parse_rate_mbit(flow['rate']) * flow['streams'] for flow in map(flow_spec, scenario['flows']))
+
+
+def load_scenarios(path=None):
+    # A scenario file is a JSON object of name -> scenario, added to (or
+    # replacing) the built-in ones.
+    scenarios = dict(SCENARIOS)
+    if path:
+        with open(path) as f:
+            scenarios.update(json.load(f))
+    return scenarios
+
+
+def parse_link_params(text):
+    # 's2-s3:bw=20,loss=1,delay=5ms' -> ('s2-s3', {'bw': 20.0, 'loss': 1.0, 'delay': '5ms'})
+    link, _, params = text.partition(':')
+    if link not in SWITCH_LINKS or not params:
+        raise ValueError(f"expected one of {', '.join(SWITCH_LINKS)} followed by ':name=value,...', got {text!r}")
+    parsed = {}
+    for item in params.split(','):
+        name, _, value = item.partition('=')
+        try:
+            parsed[name] = float(value)
+        except ValueError:
+            parsed[name] = value
+    return link, parsed
@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+
+import argparse
+import os
+import time
+from bisect import bisect_right
+
+import numpy as np
+
+from pcap_columns import ip_to_str, TCP_ACK, TCP_FIN, TCP_RST, TCP_SYN
+
+SEQ_MASK = 0xffffffff
+SEQ_HALF = 1 << 31
+
+# What each segment contributed to its flow, as seen at the capture point
+NO_DATA = 0
+NEW_DATA = 1
+RETRANSMISSION = 2
+OUT_OF_ORDER = 3
+SPURIOUS = 4
+SEGMENT_KINDS = {NO_DATA: 'no_data', NEW_DATA: 'new', RETRANSMISSION: 'retransmission',
+                 OUT_OF_ORDER: 'out_of_order', SPURIOUS: 'spurious'}
+
+# A hole filled within this long of its creation was reordered on the way
+# rather than retransmitted (Wireshark uses the same 3 ms).
+OUT_OF_ORDER_WINDOW = 0.003
+
+# new_bytes counts payload bytes the capture point had not seen before in
+# that flow, so summing it gives goodput whatever the segment's kind.
+SEGMENT_DTYPE = np.dtype([
+    ('kind', np.uint8),
+    ('new_bytes', np.uint32),
+    ('dup_ack', np.bool_),
+])
+
+FLOW_DTYPE = np.dtype([
+    ('src_ip', np.uint32), ('src_port', np.uint16), ('dst_ip', np.uint32), ('dst_port', np.uint16),
+    ('segments', np.int64), ('payload_bytes', np.int64), ('new_bytes', np.int64),
+    ('new', np.int64), ('retransmission', np.int64), ('out_of_order', np.int64), ('spurious', np.int64),
+    ('dup_acks', np.int64), ('sack_segments', np.int64), ('sack_blocks', np.int64),
+])
+
+
+def flow_ids(packets):
+    # Unique directional 4-tuples, sorted, and each packet's index into them.
+    # Each endpoint packs into one int64 (ip << 16 | port); sorting those is
+    # far cheaper than np.unique over the structured columns.
+    src = (packets['src_ip'].astype(np.int64) << 16) | packets['src_port']
+    dst = (packets['dst_ip'].astype(np.int64) << 16) | packets['dst_port']
+    src_keys, src_index = np.unique(src, return_inverse=True)
+    dst_keys, dst_index = np.unique(dst, return_inverse=True)
+    pairs, ids = np.unique(src_index.ravel() * len(dst_keys) + dst_index.ravel(), return_inverse=True)
+    src_keys = src_keys[pairs // len(dst_keys)]
+    dst_keys = dst_keys[pairs % len(dst_keys)]
+    flows = np.empty(len(pairs), dtype=[('src_ip', np.uint32), ('src_port', np.uint16),
+                                        ('dst_ip', np.uint32), ('dst_port', np.uint16)])
+    flows['src_ip'] = src_keys >> 16
+    flows['src_port'] = src_keys & 0xffff
+    flows['dst_ip'] = dst_keys >> 16
+    flows['dst_port'] = dst_keys & 0xffff
+    return flows, ids.ravel()
+
+
+def flow_starts(sorted_ids):
+    first = np.ones(len(sorted_ids), dtype=bool)
+    first[1:] = sorted_ids[1:] != sorted_ids[:-1]
+    return first
+
+
+def unwrap(values, first):
+    # 32-bit sequence/ACK numbers as int64 offsets from each flow's first
+    # value. Steps between neighbours are read as signed, so the result keeps
+    # counting through wraparound and goes negative for data sent before it.
+    values = values.astype(np.int64)
+    step = np.zeros(len(values), dtype=np.int64)
+    step[1:] = (values[1:] - values[:-1]) & SEQ_MASK
+    step[step >= SEQ_HALF] -= 1 << 32
+    step[first] = 0
+    total = np.cumsum(step)
+    start = np.maximum.accumulate(np.where(first, np.arange(len(values)), 0))
+    return total - total[start]
+
+
+def previous_max(values, first, floor):
+    # Per-flow running maximum of the values before each element (`floor` at
+    # a flow's first). Each flow is lifted above all earlier ones so one
+    # maximum.accumulate serves every flow.
+    group = np.cumsum(first) - 1
+    span = int(values.max()) - floor + 1
+    running = np.maximum.accumulate(values - floor + group * span)
+    previous = np.empty_like(running)
+    previous[1:] = running[:-1] - group[1:] * span + floor
+    previous[first] = floor
+    return previous
+
+
+def signed32(values):
+    values = np.asarray(values, dtype=np.int64) & SEQ_MASK
+    return np.where(values >= SEQ_HALF, values - (1 << 32), values)
+
+
+def peer_acked(packets, flows, ids, order, base_seq, at):
+    # Highest cumulative ACK the reverse flow had sent before each packet in
+    # `at` (indices into packets), in the forward flow's unwrapped sequence
+    # space; None where nothing had been acknowledged yet.
+    lookup = {tuple(flow): i for i, flow in enumerate(flows.tolist())}
+    reverse = np.array([lookup.get((dst, dport, src, sport), -1) for src, sport, dst, dport in flows.tolist()],
+                       dtype=np.int64)
+
+    acks = order[(packets['flags'][order] & TCP_ACK) != 0]
+    if len(acks) == 0:
+        return np.full(len(at), None, dtype=object)
+    ack_ids = ids[acks].astype(np.int64)
+    first = flow_starts(ack_ids)
+    acked = unwrap(packets['ack'][acks], first)
+    # Shift each flow's ACKs into the sequence space of the flow they acknowledge
+    forward = reverse[ack_ids]
+    first_ack = packets['ack'][acks][np.maximum.accumulate(np.where(first, np.arange(len(acks)), 0))]
+    acked += np.where(forward >= 0, signed32(first_ack.astype(np.int64) - base_seq[np.maximum(forward, 0)]), 0)
+    floor = int(acked.min()) - 1
+    high = np.maximum(previous_max(acked, first, floor), acked)
+
+    n = len(packets)
+    keys = ack_ids * n + acks
+    wanted = reverse[ids[at]]
+    pos = np.searchsorted(keys, wanted * n + at) - 1
+    found = (wanted >= 0) & (pos >= 0) & (ack_ids[np.maximum(pos, 0)] == wanted)
+    return np.where(found, high[np.maximum(pos, 0)], None)
+
+
+def track_segments(packets):
+    # Classifies every segment of a capture (packets in capture order) and
+    # counts the payload bytes it delivered for the first time. New data and
+    # gaps are found for all flows at once from a running maximum of seq+len;
+    # only segments at or below that maximum, which are rare, walk the
+    # per-flow list of holes the gaps left.
+    segments = np.zeros(len(packets), dtype=SEGMENT_DTYPE)
+    if len(packets) == 0:
+        return segments
+    flows, ids = flow_ids(packets)
+    order = np.argsort(ids, kind='stable')
+    sorted_ids = ids[order]
+    first = flow_starts(sorted_ids)
+    flow_first = order[first]
+    base_seq = np.zeros(len(flows), dtype=np.int64)
+    base_seq[sorted_ids[first]] = packets['seq'][flow_first]
+
+    start = unwrap(packets['seq'][order], first)
+    payload = packets['payload_len'][order].astype(np.int64)
+    end = start + payload
+    data = payload > 0
+    floor = int(start.min()) - 1
+    high = previous_max(np.where(data, end, floor), first, floor)
+
+    nothing_before = high == floor
+    new = data & (nothing_before | (start >= high))
+    gap = new & ~nothing_before & (start > high)
+    below = data & ~new
+
+    kind = np.where(new, NEW_DATA, NO_DATA).astype(np.uint8)
+    new_bytes = np.where(new, payload, 0)
+
+    events = np.flatnonzero(gap | below)
+    if len(events):
+        timestamps = packets['ts'][order[events]]
+        acked = np.full(len(events), None, dtype=object)
+        fully_below = below[events] & (end[events] <= high[events])
+        if fully_below.any():
+            acked[fully_below] = peer_acked(packets, flows, ids, order, base_seq, order[events[fully_below]])
+
+        flow = -1
+        hole_starts, hole_ends, hole_times = [], [], []
+        for i, event in enumerate(events.tolist()):
+            if sorted_ids[event] != flow:
+                flow = sorted_ids[event]
+                hole_starts, hole_ends, hole_times = [], [], []
+            s, e, h = int(start[event]), int(end[event]), int(high[event])
+            if gap[event]:
+                hole_starts.append(h)
+                hole_ends.append(s)
+                hole_times.append(timestamps[i])
+                continue
+
+            # Cut [s, min(e, h)) out of the holes it overlaps
+            filled = 0
+            oldest = None
+            j = bisect_right(hole_ends, s)
+            while j < len(hole_starts) and hole_starts[j] < min(e, h):
+                a, b, created = hole_starts[j], hole_ends[j], hole_times[j]
+                lo, hi = max(a, s), min(b, e, h)
+                filled += hi - lo
+                oldest = created if oldest is None else min(oldest, created)
+                pieces = [(a, lo), (hi, b)]
+                pieces = [(x, y) for x, y in pieces if y > x]
+                hole_starts[j:j + 1] = [x for x, _ in pieces]
+                hole_ends[j:j + 1] = [y for _, y in pieces]
+                hole_times[j:j + 1] = [created] * len(pieces)
+                j += len(pieces)
+
+            new_bytes[event] = filled + max(0, e - h)
+            if filled:
+                reordered = timestamps[i] - oldest <= OUT_OF_ORDER_WINDOW
+                kind[event] = OUT_OF_ORDER if reordered else RETRANSMISSION
+            elif e <= h and acked[i] is not None and e <= acked[i]:
+                kind[event] = SPURIOUS
+            else:
+                kind[event] = RETRANSMISSION
+
+    # Duplicate ACK: a pure ACK repeating the previous ACK number and window
+    # of the same direction
+    flags = packets['flags'][order]
+    pure_ack = (flags & TCP_ACK != 0) & (flags & (TCP_SYN | TCP_FIN | TCP_RST) == 0) & ~data
+    ack = packets['ack'][order]
+    window = packets['window'][order]
+    dup_ack = np.zeros(len(order), dtype=bool)
+    dup_ack[1:] = pure_ack[1:] & (ack[1:] == ack[:-1]) & (window[1:] == window[:-1]) & ((flags[:-1] & TCP_ACK) != 0)
+    dup_ack &= ~first
+
+    segments['kind'][order] = kind
+    segments['new_bytes'][order] = new_bytes
+    segments['dup_ack'][order] = dup_ack
+    return segments
+
+
+def flow_report(packets, segments):
+    flows, ids = flow_ids(packets)
+    report = np.zeros(len(flows), dtype=FLOW_DTYPE)
+    for name in ('src_ip', 'src_port', 'dst_ip', 'dst_port'):
+        report[name] = flows[name]
+    count = len(flows)
+    report['segments'] = np.bincount(ids, minlength=count)
+    report['payload_bytes'] = np.bincount(ids, weights=packets['payload_len'], minlength=count)
+    report['new_bytes'] = np.bincount(ids, weights=segments['new_bytes'], minlength=count)
+    for kind, name in SEGMENT_KINDS.items():
+        if kind != NO_DATA:
+            report[name] = np.bincount(ids, weights=segments['kind'] == kind, minlength=count)
+    report['dup_acks'] = np.bincount(ids, weights=segments['dup_ack'], minlength=count)
+    report['sack_segments'] = np.bincount(ids, weights=packets['sack_blocks'] > 0, minlength=count)
+    report['sack_blocks'] = np.bincount(ids, weights=packets['sack_blocks'], minlength=count)
+    return report
+
+
+def main():
+    from capture_cache import load_capture_columns
+
+    parser = argparse.ArgumentParser(description="Per-flow retransmission, reordering and goodput from a capture")
+    parser.add_argument('pcap_files', nargs='+', help='Captures written by ccComparisons.py.')
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+                        help='Always decode the capture and do not write the .pcap_cache entry.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Processes used to decode record-aligned chunks of each capture.')
+    args = parser.parse_args()
+
+    for pcap_file in args.pcap_files:
+        packets, _ = load_capture_columns(pcap_file, use_cache=args.use_cache, workers=args.workers)
+        started = time.perf_counter()
+        segments = track_segments(packets)
+        elapsed = time.perf_counter() - started
+        print(f"{pcap_file}: {len(packets)} segments tracked in {elapsed:.3f}s")
+        report = flow_report(packets, segments)
+        for row in report[report['payload_bytes'] > 0]:
+            retransmitted = row['payload_bytes'] - row['new_bytes']
+            print(f"  {ip_to_str(row['src_ip'])}:{row['src_port']} -> {ip_to_str(row['dst_ip'])}:{row['dst_port']}"
+                  f"  new {row['new']}, retx {row['retransmission']}, ooo {row['out_of_order']}, "
+                  f"spurious {row['spurious']}, {retransmitted} B resent, goodput {row['new_bytes']} B")
+        acks = report[report['dup_acks'] + report['sack_segments'] > 0]
+        for row in acks:
+            print(f"  {ip_to_str(row['src_ip'])}:{row['src_port']} -> {ip_to_str(row['dst_ip'])}:{row['dst_port']}"
+                  f"  dup ACKs {row['dup_acks']}, SACK segments {row['sack_segments']} "
+                  f"({row['sack_blocks']} blocks)")
+
+
+if __name__ == '__main__':
+    main()
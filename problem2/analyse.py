@@ -1,92 +1,138 @@
-import pyshark
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import repeat
+
+import numpy as np
 import matplotlib.pyplot as plt
 
-def get_key(src_ip, dst_ip, src_port, dst_port):
-    sp = int(src_port)
-    dp = int(dst_port)
-    
-    if (src_ip < dst_ip) or (src_ip == dst_ip and sp < dp):
-        return (src_ip, dst_ip, sp, dp)
-    else:
-        return (dst_ip, src_ip, dp, sp)
+from capture_cache import build_columns, load_summary, DEFAULT_CACHE_MAX_BYTES
+from conn_table import ConnectionTable, ConnectionSummary, BUCKET_WIDTH, CLOSE_OPEN, EXPIRE_AFTER
+from pcap_reader import iter_tcp_segments, TCP_FIN, TCP_SYN, TCP_RST, TCP_ACK
+
+def iter_pyshark_packets(pcap_file):
+    import pyshark
 
-def parse_pcap(pcap_file):
     capture = pyshark.FileCapture(pcap_file, display_filter='tcp')
-    connections = {}
-    base_time = None
-
-    for packet in capture:
-        try:
-            src_ip = packet.ip.src
-            dst_ip = packet.ip.dst
-            src_port = packet.tcp.srcport
-            dst_port = packet.tcp.dstport
-            timestamp = float(packet.sniff_timestamp)
-            if base_time is None:
-                base_time = timestamp
-            timestamp -= base_time
-
-            syn_flag = int(packet.tcp.flags_syn)
-            ack_flag = int(packet.tcp.flags_ack)
-            fin_flag = int(packet.tcp.flags_fin)
-            rst_flag = int(packet.tcp.flags_reset)
-            
-            seq_num = int(packet.tcp.seq)
-            ack_num = int(packet.tcp.ack) if 'ack' in packet.tcp.field_names else None
-            
-            conn_key = get_key(src_ip, dst_ip, src_port, dst_port)
-            if conn_key not in connections:
-                connections[conn_key] = {
-                    'start_time': None,
-                    'fin_seq': None,
-                    'fin_ack_needed': None,
-                    'end_time': None,
-                    'closed': False
-                }
-            conn = connections[conn_key]
-            
-            if syn_flag == 1 and ack_flag == 0 and conn['start_time'] is None:
-                conn['start_time'] = timestamp
-            
-            if rst_flag == 1 and not conn['closed']:
-                if conn['start_time'] is None:
-                    conn['start_time'] = timestamp
-                conn['end_time'] = timestamp
-                conn['closed'] = True
-            
-            if fin_flag == 1 and not conn['closed']:
-                conn['fin_seq'] = seq_num
-                conn['fin_ack_needed'] = seq_num + 1
-            
-            if ack_flag == 1 and not conn['closed'] and conn['fin_ack_needed'] is not None:
-                if ack_num == conn['fin_ack_needed']:
-                    if conn['start_time'] is None:
-                        conn['start_time'] = timestamp
-                    conn['end_time'] = timestamp
-                    conn['closed'] = True
-        except AttributeError:
-            continue
-    
-    capture.close()
-    
-    results = []
-    for key, conn in connections.items():
-        if conn['start_time'] is not None:
-            if conn['end_time'] is not None:
-                duration = conn['end_time'] - conn['start_time']
-            else:
-                duration = 100.0
-            results.append((conn['start_time'], duration))
-    
-    results.sort(key=lambda x: x[0])
-    return results
+    try:
+        for packet in capture:
+            try:
+                flags = 0
+                if int(packet.tcp.flags_fin):
+                    flags |= TCP_FIN
+                if int(packet.tcp.flags_syn):
+                    flags |= TCP_SYN
+                if int(packet.tcp.flags_reset):
+                    flags |= TCP_RST
+                if int(packet.tcp.flags_ack):
+                    flags |= TCP_ACK
+                ack_num = int(packet.tcp.ack) if 'ack' in packet.tcp.field_names else None
+                yield (float(packet.sniff_timestamp), packet.ip.src, packet.ip.dst,
+                       packet.tcp.srcport, packet.tcp.dstport, flags, int(packet.tcp.seq), ack_num,
+                       int(packet.tcp.len))
+            except AttributeError:
+                continue
+    finally:
+        capture.close()
+
+def iter_native_packets(pcap_file):
+    for segment in iter_tcp_segments(pcap_file):
+        ack_num = segment.ack if segment.flags & TCP_ACK else None
+        yield (segment.timestamp, segment.src_ip, segment.dst_ip,
+               segment.src_port, segment.dst_port, segment.flags, segment.seq, ack_num,
+               segment.payload_len)
+
+def iter_columns(columns):
+    ack_nums = [ack if flags & TCP_ACK else None
+                for ack, flags in zip(columns['ack'].tolist(), columns['flags'].tolist())]
+    return zip(columns['timestamp'].tolist(), columns['src_ip'].tolist(), columns['dst_ip'].tolist(),
+               columns['src_port'].tolist(), columns['dst_port'].tolist(), columns['flags'].tolist(),
+               columns['seq'].tolist(), ack_nums, columns['payload_len'].tolist())
+
+def track_connections(packets, base_time=None, expire_after=EXPIRE_AFTER, capture_end=None):
+    table = ConnectionTable(expire_after)
+    timestamp = 0.0
+
+    for timestamp, src_ip, dst_ip, src_port, dst_port, flags, seq_num, ack_num, payload_len in packets:
+        if base_time is None:
+            base_time = timestamp
+        timestamp -= base_time
+        table.update(timestamp, src_ip, dst_ip, src_port, dst_port, flags, seq_num, ack_num, payload_len)
+
+    return table.finish(timestamp if capture_end is None else capture_end)
+
+def shard_ids(columns, shards):
+    # Both directions of a connection hash to the same shard, so every
+    # shard owns complete connections and its state needs no merging.
+    a = (columns['src_ip'].astype(np.uint64) << np.uint64(16)) | columns['src_port']
+    b = (columns['dst_ip'].astype(np.uint64) << np.uint64(16)) | columns['dst_port']
+    lo = np.minimum(a, b)
+    hi = np.maximum(a, b)
+    mixed = (lo * np.uint64(0x9e3779b97f4a7c15)) ^ (hi * np.uint64(0xc2b2ae3d27d4eb4f))
+    return (mixed >> np.uint64(32)) % np.uint64(shards)
+
+def parse_shard(columns, base_time, capture_end, expire_after):
+    return track_connections(iter_columns(columns), base_time, expire_after, capture_end)
+
+def parse_sharded(columns, workers, expire_after=EXPIRE_AFTER):
+    if len(columns['timestamp']) == 0:
+        return ConnectionSummary.merge([])
+    base_time = float(columns['timestamp'][0])
+    capture_end = float(columns['timestamp'][-1]) - base_time
+    ids = shard_ids(columns, workers)
+    shards = []
+    for shard in range(workers):
+        sel = np.flatnonzero(ids == shard)
+        shards.append({name: values[sel] for name, values in columns.items()})
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Every shard finishes at the capture's last timestamp, not its own
+        summaries = pool.map(parse_shard, shards, repeat(base_time), repeat(capture_end), repeat(expire_after))
+        return ConnectionSummary.merge(summaries)
 
-def plot_results(results):
-    start_times = [r[0] for r in results]
-    durations   = [r[1] for r in results]
+def track_columns(columns, workers=1, expire_after=EXPIRE_AFTER):
+    # Decoding is split across the workers by byte range, tracking by connection
+    if workers > 1:
+        return parse_sharded(columns, workers, expire_after)
+    return track_connections(iter_columns(columns), expire_after=expire_after)
+
+def parse_pcap(pcap_file, backend='native', cache_options=None, workers=1, expire_after=EXPIRE_AFTER):
+    use_cache = cache_options is not None and cache_options.get('use_cache', True)
+    if backend == 'pyshark':
+        summary = track_connections(iter_pyshark_packets(pcap_file), expire_after=expire_after)
+    elif use_cache:
+        track = partial(track_columns, workers=workers, expire_after=expire_after)
+        summary = load_summary(pcap_file, track, expire_after, BUCKET_WIDTH, workers=workers, **cache_options)
+    elif workers > 1:
+        summary = track_columns(build_columns(pcap_file, workers), workers, expire_after)
+    else:
+        summary = track_connections(iter_native_packets(pcap_file), expire_after=expire_after)
+
+    summary.records.sort(order='start_time')
+    return summary
+
+def pixel_points(x, y, width=1000, height=600):
+    # One marker per occupied pixel of the 10x6 inch figure at 100 dpi: a
+    # flood's millions of connections draw the same picture from far fewer.
+    if len(x) <= width:
+        return x, y
+    span_x = max(x.max() - x.min(), 1e-9)
+    span_y = max(y.max() - y.min(), 1e-9)
+    px = ((x - x.min()) * ((width - 1) / span_x)).astype(np.int64)
+    py = ((y - y.min()) * ((height - 1) / span_y)).astype(np.int64)
+    _, first = np.unique(px * height + py, return_index=True)
+    return x[first], y[first]
+
+def plot_results(summary):
+    records = summary.records
+    still_open = records['close_reason'] == CLOSE_OPEN
     
     plt.figure(figsize=(10, 6))
-    plt.scatter(start_times, durations, color='blue', alpha=0.7, label='Connections')
+    plt.scatter(*pixel_points(records['start_time'][~still_open], records['duration'][~still_open]),
+                color='blue', alpha=0.7, label='Connections')
+    if still_open.any():
+        plt.scatter(*pixel_points(records['start_time'][still_open], records['duration'][still_open]),
+                    color='orange', marker='^', alpha=0.7, label='Still open at capture end')
     
     plt.axvline(x=20,  color='red', linestyle='--', label='Attack Start (20s)')
     plt.axvline(x=120, color='green', linestyle='--', label='Attack End (120s)')
@@ -98,10 +144,62 @@ def plot_results(results):
     plt.grid(True)
     plt.savefig('plot.png')
 
+def plot_half_open(summary):
+    times, counts = summary.half_open_series()
+
+    plt.figure(figsize=(10, 6))
+    plt.step(times, counts, where='post', color='purple', label='Half-open connections')
+
+    plt.axvline(x=20,  color='red', linestyle='--', label='Attack Start (20s)')
+    plt.axvline(x=120, color='green', linestyle='--', label='Attack End (120s)')
+
+    plt.xlabel('Time (seconds)')
+    plt.ylabel('Half-open connections')
+    plt.title(f"Half-open connections ({summary.counters.get('expired_half_open', 0)} expired unanswered)")
+    plt.legend()
+    plt.grid(True)
+    plt.savefig('half_open.png')
+
+def report(summary):
+    records = summary.records
+    rtt = records['handshake_rtt'][~np.isnan(records['handshake_rtt'])]
+    reasons = np.bincount(records['close_reason'], minlength=3)
+    print(f"Connections: {len(records)} (fin {reasons[1]}, rst {reasons[2]}, open {reasons[0]}), "
+          f"expired half-open {summary.counters.get('expired_half_open', 0)}, "
+          f"half-open at end {summary.counters.get('half_open_at_end', 0)}")
+    if len(rtt):
+        print(f"Handshake time: p50 {np.percentile(rtt, 50) * 1000:.2f} ms, "
+              f"p99 {np.percentile(rtt, 99) * 1000:.2f} ms")
+
 def main():
-    pcap_file = 'synflood.pcap'
-    results = parse_pcap(pcap_file)
-    plot_results(results)
+    parser = argparse.ArgumentParser(description="SYN flood connection duration analysis")
+    parser.add_argument('pcap_file', nargs='?', default='synflood.pcap',
+                        help='Capture to analyse (pcap or pcapng).')
+    parser.add_argument('--backend', choices=['native', 'pyshark'], default='native',
+                        help='Packet decoder: the built-in struct reader or tshark via pyshark.')
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+                        help='Decode and track the capture every time instead of using .segment_cache.')
+    parser.add_argument('--rebuild-cache', action='store_true',
+                        help='Decode and track the capture again and overwrite its cache entries.')
+    parser.add_argument('--cache_max_mb', type=int, default=DEFAULT_CACHE_MAX_BYTES >> 20,
+                        help='Size cap of the .segment_cache directory; least recently used entries are evicted.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Processes to decode the capture (by byte range) and track connections '
+                             '(by connection 4-tuple) with.')
+    parser.add_argument('--expire_after', type=float, default=EXPIRE_AFTER,
+                        help='Seconds after which an unanswered handshake is dropped into the counters.')
+    args = parser.parse_args()
+
+    cache_options = {
+        'use_cache': args.use_cache,
+        'rebuild': args.rebuild_cache,
+        'max_bytes': args.cache_max_mb << 20,
+    }
+    summary = parse_pcap(args.pcap_file, backend=args.backend, cache_options=cache_options,
+                         workers=args.workers, expire_after=args.expire_after)
+    report(summary)
+    plot_results(summary)
+    plot_half_open(summary)
 
 if __name__ == '__main__':
     main()
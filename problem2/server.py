@@ -1,14 +1,21 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
 import socket
+import time
 
 HOST = '172.21.124.53'
 PORT = 12345
 
-def start_server():
+ACCEPTED, COMPLETED, FAILED = range(3)
+
+def start_server(host=HOST, port=PORT, backlog=5):
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)    
-    server_socket.bind((HOST, PORT))
-    server_socket.listen(5)
+    server_socket.bind((host, port))
+    server_socket.listen(backlog)
     
-    print(f"[*] Server listening on {HOST}:{PORT}")
+    print(f"[*] Server listening on {host}:{port}")
     
     while True:
         conn, addr = server_socket.accept()
@@ -27,5 +34,120 @@ def start_server():
         
         conn.close()
 
+def read_sysctl(name):
+    try:
+        with open(os.path.join('/proc/sys', name.replace('.', '/'))) as f:
+            return f.read().strip()
+    except OSError:
+        return 'unavailable'
+
+def report_tcp_settings(backlog):
+    somaxconn = read_sysctl('net.core.somaxconn')
+    print(f"[*] net.ipv4.tcp_syncookies={read_sysctl('net.ipv4.tcp_syncookies')} "
+          f"net.ipv4.tcp_max_syn_backlog={read_sysctl('net.ipv4.tcp_max_syn_backlog')} "
+          f"net.core.somaxconn={somaxconn}")
+    if somaxconn.isdigit() and backlog > int(somaxconn):
+        print(f"[!] listen backlog {backlog} is capped by net.core.somaxconn={somaxconn}")
+
+def listening_socket(host, port, backlog):
+    # Every worker binds its own socket; SO_REUSEPORT lets the kernel spread
+    # incoming connections across them instead of one shared accept queue.
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+class WorkerCounters:
+    def __init__(self, shared, worker):
+        self.shared = shared
+        self.base = 3 * worker
+
+    def __getitem__(self, kind):
+        return self.shared[self.base + kind]
+
+    def __setitem__(self, kind, value):
+        self.shared[self.base + kind] = value
+
+async def handle_client(reader, writer, counters, timeout):
+    try:
+        data = await asyncio.wait_for(reader.read(1024), timeout)
+        if not data:
+            raise ConnectionError("no data received")
+        writer.write("Hello from server!".encode('utf-8'))
+        await asyncio.wait_for(writer.drain(), timeout)
+        counters[COMPLETED] += 1
+    except (OSError, ConnectionError, asyncio.TimeoutError):
+        counters[FAILED] += 1
+    finally:
+        writer.close()
+
+async def serve_async(sock, counters, timeout):
+    def on_connect(reader, writer):
+        counters[ACCEPTED] += 1
+        return handle_client(reader, writer, counters, timeout)
+
+    server = await asyncio.start_server(on_connect, sock=sock)
+    async with server:
+        await server.serve_forever()
+
+def async_worker(host, port, backlog, counters, timeout):
+    sock = listening_socket(host, port, backlog)
+    try:
+        asyncio.run(serve_async(sock, counters, timeout))
+    except KeyboardInterrupt:
+        pass
+
+def start_async_server(host=HOST, port=PORT, backlog=4096, workers=1, timeout=5.0):
+    report_tcp_settings(backlog)
+    # One row of counters per worker so no lock is needed; the reporter sums them.
+    counters = multiprocessing.Array('q', 3 * workers, lock=False)
+    procs = [multiprocessing.Process(target=async_worker, daemon=True,
+                                     args=(host, port, backlog, WorkerCounters(counters, i), timeout))
+             for i in range(workers)]
+    for proc in procs:
+        proc.start()
+    print(f"[*] Server listening on {host}:{port} ({workers} worker(s), backlog {backlog})")
+
+    previous = [0, 0, 0]
+    try:
+        while True:
+            time.sleep(1)
+            current = [sum(counters[kind::3]) for kind in range(3)]
+            delta = [c - p for c, p in zip(current, previous)]
+            previous = current
+            print(f"[{time.strftime('%H:%M:%S')}] accepted/s={delta[ACCEPTED]} completed/s={delta[COMPLETED]} "
+                  f"failed/s={delta[FAILED]} total accepted={current[ACCEPTED]}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.join()
+
+def main():
+    parser = argparse.ArgumentParser(description="Target server for the SYN flood experiment")
+    parser.add_argument('--host', default=HOST,
+                        help='Address to listen on.')
+    parser.add_argument('--port', type=int, default=PORT,
+                        help='Port to listen on.')
+    parser.add_argument('--mode', choices=['simple', 'async'], default='simple',
+                        help="'simple' serves one client at a time; 'async' runs asyncio workers "
+                             "sharing the port through SO_REUSEPORT.")
+    parser.add_argument('--backlog', type=int, default=None,
+                        help='listen() backlog (default: 5 in simple mode, 4096 in async mode).')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Worker processes in async mode.')
+    parser.add_argument('--timeout', type=float, default=5.0,
+                        help='Seconds a client may take to send its request in async mode.')
+    args = parser.parse_args()
+
+    if args.mode == 'async':
+        start_async_server(args.host, args.port, args.backlog or 4096, args.workers, args.timeout)
+    else:
+        start_server(args.host, args.port, args.backlog or 5)
+
 if __name__ == "__main__":
-    start_server()
+    main()
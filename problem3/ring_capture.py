@@ -0,0 +1,170 @@
+import ctypes
+import mmap
+import select
+import socket
+import struct
+from datetime import datetime
+
+# linux/if_packet.h, linux/if_ether.h, linux/filter.h
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_STATISTICS = 6
+PACKET_VERSION = 10
+TPACKET_V3 = 2
+SO_ATTACH_FILTER = 26
+ETH_P_IP = 0x0800
+PACKET_OUTGOING = 4
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+
+# Bytes handed to the ring per packet: the largest IPv4 plus TCP header.
+# Payload never leaves the kernel; lengths come from the IP header.
+SNAPLEN = 120
+BLOCK_SIZE = 1 << 20
+BLOCK_COUNT = 32
+FRAME_SIZE = 2048
+# A block is handed over after this many ms even if not full, so a slow
+# connection is still seen promptly.
+BLOCK_TIMEOUT_MS = 10
+POLL_MS = 100
+
+# struct tpacket_block_desc: block_status, num_pkts, offset_to_first_pkt
+BLOCK_HEADER = struct.Struct('=8xIII')
+# struct tpacket3_hdr: tp_next_offset, tp_sec, tp_nsec, tp_snaplen, tp_len,
+# tp_status, tp_mac, tp_net; struct sockaddr_ll follows at 48, sll_pkttype at 10
+PACKET_HEADER = struct.Struct('=IIIIIIHH')
+PKTTYPE_OFFSET = 48 + 10
+IP_HEADER = struct.Struct('!BxH5xB2xII')
+TCP_HEADER = struct.Struct('!HHIIBBH')
+
+
+def tcp_port_filter(port, snaplen=SNAPLEN):
+    # Classic BPF for "tcp port <port>" on an AF_PACKET SOCK_DGRAM socket,
+    # which sees packets from the IP header on. Accepted packets are cut to
+    # snaplen; fragments after the first carry no ports and are dropped.
+    return [
+        (0x30, 0, 0, 9),            # ldb [9]             protocol
+        (0x15, 0, 8, 6),            # jeq #6              else drop
+        (0x28, 0, 0, 6),            # ldh [6]             flags/fragment offset
+        (0x45, 6, 0, 0x1fff),       # jset #0x1fff        drop
+        (0xb1, 0, 0, 0),            # ldxb 4*([0]&0xf)    IP header length
+        (0x48, 0, 0, 0),            # ldh [x+0]           source port
+        (0x15, 2, 0, port),         # jeq #port           accept
+        (0x48, 0, 0, 2),            # ldh [x+2]           destination port
+        (0x15, 0, 1, port),         # jeq #port           else drop
+        (0x06, 0, 0, snaplen),      # ret #snaplen
+        (0x06, 0, 0, 0),            # ret #0
+    ]
+
+
+def attach_filter(sock, instructions):
+    program = (ctypes.c_uint8 * (8 * len(instructions)))()
+    for i, instruction in enumerate(instructions):
+        struct.pack_into('=HBBI', program, 8 * i, *instruction)
+    fprog = struct.pack('@HP', len(instructions), ctypes.addressof(program))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+
+
+def sack_blocks(options):
+    pos = 0
+    while pos < len(options):
+        kind = options[pos]
+        if kind == 0:
+            break
+        if kind == 1:
+            pos += 1
+            continue
+        if pos + 1 >= len(options) or options[pos + 1] < 2:
+            break
+        if kind == 5:
+            return (options[pos + 1] - 2) // 8
+        pos += options[pos + 1]
+    return 0
+
+
+class RingCapture:
+    # TCP headers for one port, read straight out of a TPACKET_V3 ring that
+    # the kernel fills in blocks. The socket starts with protocol 0 so it
+    # receives nothing until the filter is attached and the ring mapped;
+    # once the constructor returns, every later packet is captured.
+
+    def __init__(self, interface, port, block_size=BLOCK_SIZE, block_count=BLOCK_COUNT):
+        self.interface = interface
+        self.block_size = block_size
+        self.block_count = block_count
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_DGRAM, 0)
+        try:
+            attach_filter(self.sock, tcp_port_filter(port))
+            self.sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+            frames = block_size * block_count // FRAME_SIZE
+            request = struct.pack('=7I', block_size, block_count, FRAME_SIZE, frames, BLOCK_TIMEOUT_MS, 0, 0)
+            self.sock.setsockopt(SOL_PACKET, PACKET_RX_RING, request)
+            self.ring = mmap.mmap(self.sock.fileno(), block_size * block_count, mmap.MAP_SHARED,
+                                  mmap.PROT_READ | mmap.PROT_WRITE)
+            self.sock.bind((interface, ETH_P_IP))
+        except OSError:
+            self.sock.close()
+            raise
+        self.poller = select.poll()
+        self.poller.register(self.sock.fileno(), select.POLLIN | select.POLLERR)
+        self.block = 0
+        self.packets = 0
+        self.drops = 0
+
+    def read_block(self):
+        # Decodes the next block if the kernel has handed it over and gives
+        # it back; returns the records of its packets, or None.
+        ring = self.ring
+        base = self.block * self.block_size
+        status, count, offset = BLOCK_HEADER.unpack_from(ring, base)
+        if not status & TP_STATUS_USER:
+            return None
+        records = []
+        pos = base + offset
+        skip_outgoing = self.interface == 'lo'
+        for _ in range(count):
+            next_offset, sec, nsec, snaplen, length, _, _, net = PACKET_HEADER.unpack_from(ring, pos)
+            # Loopback packets show up once leaving and once arriving
+            if not (skip_outgoing and ring[pos + PKTTYPE_OFFSET] == PACKET_OUTGOING):
+                records.append(self.decode(ring, pos + net, snaplen, sec + nsec / 1e9))
+            pos += next_offset
+        struct.pack_into('=I', ring, base + 8, TP_STATUS_KERNEL)
+        self.block = (self.block + 1) % self.block_count
+        self.packets += len(records)
+        return records
+
+    @staticmethod
+    def decode(ring, ip, snaplen, timestamp):
+        ver_ihl, ip_len, protocol, src, dst = IP_HEADER.unpack_from(ring, ip)
+        tcp = ip + (ver_ihl & 0x0f) * 4
+        sport, dport, seq, ack, data_offset, flags, window = TCP_HEADER.unpack_from(ring, tcp)
+        header_len = (data_offset >> 4) * 4
+        options_end = min(tcp + header_len, ip + snaplen)
+        sack = sack_blocks(ring[tcp + 20:options_end]) if options_end > tcp + 20 else 0
+        payload = max(0, ip_len - (tcp - ip) - header_len)
+        segment = (src, sport, dst, dport, seq, ack, flags, window, payload, sack)
+        return datetime.fromtimestamp(timestamp), ip_len, segment
+
+    def run(self, on_records, stop_event):
+        # Hands each block's records to on_records until stop_event is set,
+        # then drains whatever blocks the kernel has already retired.
+        while True:
+            stopping = stop_event.is_set()
+            records = self.read_block()
+            if records is not None:
+                if records:
+                    on_records(records)
+                continue
+            if stopping:
+                return
+            self.poller.poll(POLL_MS)
+
+    def statistics(self):
+        # Reading PACKET_STATISTICS resets the kernel's counters
+        packets, drops, _ = struct.unpack('=III', self.sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, 12))
+        self.drops += drops
+        return self.packets, self.drops
+
+    def close(self):
+        self.ring.close()
+        self.sock.close()
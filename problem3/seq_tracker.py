@@ -0,0 +1,138 @@
+from bisect import bisect_right
+
+SEQ_MASK = 0xffffffff
+SEQ_HALF = 1 << 31
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_ACK = 0x10
+
+# Same kinds and reordering window as problem1/seq_tracker.py, which does
+# this for whole captures at once; this one follows a live capture.
+NO_DATA = 0
+NEW_DATA = 1
+RETRANSMISSION = 2
+OUT_OF_ORDER = 3
+SPURIOUS = 4
+SEGMENT_KINDS = {NO_DATA: 'no_data', NEW_DATA: 'new', RETRANSMISSION: 'retransmission',
+                 OUT_OF_ORDER: 'out_of_order', SPURIOUS: 'spurious'}
+OUT_OF_ORDER_WINDOW = 0.003
+
+
+def signed32(value):
+    value &= SEQ_MASK
+    return value - (1 << 32) if value >= SEQ_HALF else value
+
+
+class FlowSequence:
+    # One direction of a connection. Sequence numbers are unwrapped against
+    # the previous one, so `high` (end of the highest data seen) keeps
+    # growing through wraparound; holes are the ranges below it never seen.
+
+    def __init__(self, seq):
+        self.raw = seq
+        self.position = 0
+        self.high = None
+        self.hole_starts = []
+        self.hole_ends = []
+        self.hole_times = []
+        self.acked = None
+        self.last_ack = None
+        self.last_window = None
+
+    def unwrap(self, seq):
+        self.position += signed32(seq - self.raw)
+        self.raw = seq
+        return self.position
+
+    def relative(self, seq):
+        # Position of an ACK number in this flow's space, without moving it
+        return self.position + signed32(seq - self.raw)
+
+    def data(self, timestamp, seq, length):
+        start = self.unwrap(seq)
+        end = start + length
+        high = self.high
+        if high is None or start >= high:
+            if high is not None and start > high:
+                self.hole_starts.append(high)
+                self.hole_ends.append(start)
+                self.hole_times.append(timestamp)
+            self.high = end
+            return NEW_DATA, length
+
+        filled = 0
+        oldest = None
+        top = min(end, high)
+        j = bisect_right(self.hole_ends, start)
+        while j < len(self.hole_starts) and self.hole_starts[j] < top:
+            a, b, created = self.hole_starts[j], self.hole_ends[j], self.hole_times[j]
+            lo, hi = max(a, start), min(b, top)
+            filled += hi - lo
+            oldest = created if oldest is None else min(oldest, created)
+            pieces = [(x, y) for x, y in ((a, lo), (hi, b)) if y > x]
+            self.hole_starts[j:j + 1] = [x for x, _ in pieces]
+            self.hole_ends[j:j + 1] = [y for _, y in pieces]
+            self.hole_times[j:j + 1] = [created] * len(pieces)
+            j += len(pieces)
+
+        above = max(0, end - high)
+        self.high = max(high, end)
+        if filled:
+            kind = OUT_OF_ORDER if timestamp - oldest <= OUT_OF_ORDER_WINDOW else RETRANSMISSION
+        elif not above and self.acked is not None and end <= self.acked:
+            kind = SPURIOUS
+        else:
+            kind = RETRANSMISSION
+        return kind, filled + above
+
+
+class SequenceTracker:
+    # Classifies segments as they arrive and keeps running totals. Flows are
+    # keyed by the directional 4-tuple in whatever form the caller has
+    # addresses in.
+
+    def __init__(self):
+        self.flows = {}
+        self.totals = {'data_segments': 0, 'new_bytes': 0, 'dup_acks': 0, 'sack_segments': 0, 'sack_blocks': 0}
+        for name in SEGMENT_KINDS.values():
+            self.totals[name] = 0
+
+    def update(self, timestamp, src, sport, dst, dport, seq, ack, flags, window, payload_len, sack_blocks=0):
+        flow = self.flows.get((src, sport, dst, dport))
+        if flow is None:
+            flow = self.flows[(src, sport, dst, dport)] = FlowSequence(seq)
+        totals = self.totals
+
+        if payload_len:
+            kind, new_bytes = flow.data(timestamp, seq, payload_len)
+            totals['data_segments'] += 1
+            totals['new_bytes'] += new_bytes
+        else:
+            flow.unwrap(seq)
+            kind = NO_DATA
+        totals[SEGMENT_KINDS[kind]] += 1
+
+        if flags & TCP_ACK:
+            # An ACK can arrive before anything of the flow it acknowledges
+            # (e.g. a capture started mid-connection); that flow then starts
+            # out anchored at the ACK number, so a later resend of the data
+            # it covers still reads as spurious.
+            reverse = self.flows.get((dst, dport, src, sport))
+            if reverse is None:
+                reverse = self.flows[(dst, dport, src, sport)] = FlowSequence(ack)
+            acked = reverse.relative(ack)
+            if reverse.acked is None or acked > reverse.acked:
+                reverse.acked = acked
+            pure = not payload_len and not flags & (TCP_SYN | TCP_FIN | TCP_RST)
+            if pure and ack == flow.last_ack and window == flow.last_window:
+                totals['dup_acks'] += 1
+            flow.last_ack = ack
+            flow.last_window = window
+        else:
+            flow.last_ack = None
+        if sack_blocks:
+            totals['sack_segments'] += 1
+            totals['sack_blocks'] += sack_blocks
+        return kind
@@ -1,19 +1,102 @@
 import socket
 import argparse
+import bisect
+import struct
 import time
 import threading
-import pyshark
 from datetime import datetime
 
-packet_store = []
+from ring_capture import RingCapture
+from seq_tracker import SequenceTracker
 
-def packet_capture(capture_instance):
+try:
+    import pyshark
+except ImportError:
+    # Only server mode with --capture pyshark needs tshark
+    pyshark = None
+
+# Raw sequence numbers and no expert analysis: CaptureStats tracks the
+# sequence space itself, which keeps tshark's per-packet work small.
+TSHARK_PREFS = {
+    'tcp.analyze_sequence_numbers': 'FALSE',
+    'tcp.relative_sequence_numbers': 'FALSE',
+}
+
+class CaptureStats:
+    # Running totals updated as each packet arrives, so nothing captured is
+    # kept around after it has been counted. Retransmissions and goodput come
+    # from our own sequence tracking, so tshark's stateful TCP analysis can
+    # stay off.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start_time = None
+        self.end_time = None
+        self.ip_bytes_total = 0
+        self.tcp_payload_total = 0
+        self.largest_payload = 0
+        self.tcp_segment_count = 0
+        self.sequences = SequenceTracker()
+
+    def update(self, pkt):
+        ip_bytes = int(pkt.ip.len) if hasattr(pkt, 'ip') else 0
+        segment = None
+        if hasattr(pkt, 'tcp') and hasattr(pkt, 'ip'):
+            tcp = pkt.tcp
+            segment = (pkt.ip.src, int(tcp.srcport), pkt.ip.dst, int(tcp.dstport),
+                       int(getattr(tcp, 'seq_raw', None) or getattr(tcp, 'seq', 0)),
+                       # tshark leaves the ACK number out when the ACK flag is not set (a SYN)
+                       int(getattr(tcp, 'ack_raw', None) or getattr(tcp, 'ack', 0)),
+                       int(tcp.flags, 16), int(tcp.window_size_value),
+                       int(tcp.len) if hasattr(tcp, 'len') else 0,
+                       int(getattr(tcp, 'options_sack_count', 0)))
+        self.record(pkt.sniff_time, ip_bytes, segment)
+
+    def record(self, sniff_time, ip_bytes, segment):
+        # segment: (src, sport, dst, dport, seq, ack, flags, window, payload_len, sack_blocks) or None
+        with self.lock:
+            self.count(sniff_time, ip_bytes, segment)
+
+    def record_batch(self, records):
+        # (sniff_time, ip_bytes, segment) for a whole ring block, under one lock
+        with self.lock:
+            for sniff_time, ip_bytes, segment in records:
+                self.count(sniff_time, ip_bytes, segment)
+
+    def count(self, sniff_time, ip_bytes, segment):
+        if self.start_time is None:
+            self.start_time = sniff_time
+        self.end_time = sniff_time
+        self.ip_bytes_total += ip_bytes
+        if segment is not None:
+            src, sport, dst, dport, seq, ack, flags, window, payload, sack_blocks = segment
+            self.tcp_segment_count += 1
+            self.tcp_payload_total += payload
+            if payload > self.largest_payload:
+                self.largest_payload = payload
+            self.sequences.update(sniff_time.timestamp(), src, sport, dst, dport, seq, ack, flags, window,
+                                  payload, sack_blocks)
+
+capture_stats = CaptureStats()
+
+def packet_capture(capture_instance, stats):
     try:
         for pkt in capture_instance.sniff_continuously():
-            packet_store.append(pkt)
+            try:
+                stats.update(pkt)
+            except Exception as error:
+                print("Error processing packet:", error)
     except Exception as error:
         print("Exception in capture thread:", error)
 
+def report_progress(stats, interval, stop_event):
+    while not stop_event.wait(interval):
+        if stats.start_time is None:
+            continue
+        metrics = evaluate_capture(stats)
+        print(f"[{metrics['capture_duration']:.1f}s] throughput {metrics['raw_throughput']:.2f} B/s, "
+              f"goodput {metrics['goodput']:.2f} B/s, loss {metrics['packet_loss_rate']:.2f}%")
+
 def set_socket_options(sock, nagle_status, delayed_ack_status):
     if nagle_status == 'disabled':
         try:
@@ -34,53 +117,61 @@ def set_socket_options(sock, nagle_status, delayed_ack_status):
     else:
         print("Delayed ACK remains enabled (default)")
 
-def evaluate_capture(packets):
-    if not packets:
-        print("No packets were captured")
-        return None
-
-    start_time = packets[0].sniff_time
-    end_time = packets[-1].sniff_time
-    duration = (end_time - start_time).total_seconds()
-    ip_bytes_total = 0
-    tcp_payload_total = 0
-    largest_payload = 0
-    lost_segment_count = 0
-    tcp_segment_count = 0
-
-    for pkt in packets:
-        try:
-            if hasattr(pkt, 'ip'):
-                ip_bytes_total += int(pkt.ip.len)
-            if hasattr(pkt, 'tcp'):
-                tcp_segment_count += 1
-                payload = int(pkt.tcp.len) if hasattr(pkt.tcp, 'len') else 0
-                tcp_payload_total += payload
-                if payload > largest_payload:
-                    largest_payload = payload
-                if hasattr(pkt.tcp, 'analysis_lost_segment'):
-                    lost_segment_count += 1
-        except Exception as error:
-            print("Error processing packet:", error)
-            continue
+def evaluate_capture(stats):
+    with stats.lock:
+        if stats.start_time is None:
+            print("No packets were captured")
+            return None
 
+        duration = (stats.end_time - stats.start_time).total_seconds()
+        ip_bytes_total = stats.ip_bytes_total
+        largest_payload = stats.largest_payload
+        totals = dict(stats.sequences.totals)
+
+    # Goodput counts each payload byte once; the loss rate is estimated from
+    # the data segments that had to be sent again.
+    resent = totals['retransmission'] + totals['spurious']
     overall_throughput = ip_bytes_total / duration if duration > 0 else 0
-    effective_goodput = tcp_payload_total / duration if duration > 0 else 0
-    loss_rate = (lost_segment_count / tcp_segment_count) * 100 if tcp_segment_count > 0 else 0
+    effective_goodput = totals['new_bytes'] / duration if duration > 0 else 0
+    loss_rate = (resent / totals['data_segments']) * 100 if totals['data_segments'] > 0 else 0
 
     return {
         'capture_duration': duration,
         'raw_throughput': overall_throughput,
         'goodput': effective_goodput,
         'max_payload': largest_payload,
-        'packet_loss_rate': loss_rate
+        'packet_loss_rate': loss_rate,
+        'retransmissions': totals['retransmission'],
+        'out_of_order': totals['out_of_order'],
+        'spurious_retransmissions': totals['spurious'],
+        'dup_acks': totals['dup_acks'],
+        'sack_segments': totals['sack_segments'],
     }
 
-def start_server(port, nagle_status, delayed_ack_status):
-    capture_instance = pyshark.LiveCapture(interface='lo', bpf_filter=f'tcp port {port}')
-    capture_thread = threading.Thread(target=packet_capture, args=(capture_instance,), daemon=True)
+def start_server(port, nagle_status, delayed_ack_status, report_interval=5.0, capture_backend='ring'):
+    stop_capture = threading.Event()
+    ring = None
+    if capture_backend == 'ring':
+        # Headers are read from a kernel ring buffer in this process; the
+        # ring is in place before we listen, so the handshake is captured.
+        try:
+            ring = RingCapture('lo', port)
+        except PermissionError:
+            raise SystemExit("The ring capture needs root (CAP_NET_RAW); run as root or use --capture pyshark")
+        capture_thread = threading.Thread(target=ring.run, args=(capture_stats.record_batch, stop_capture), daemon=True)
+    else:
+        if pyshark is None:
+            raise SystemExit("--capture pyshark needs pyshark (and tshark)")
+        capture_instance = pyshark.LiveCapture(interface='lo', bpf_filter=f'tcp port {port}',
+                                               override_prefs=TSHARK_PREFS)
+        capture_thread = threading.Thread(target=packet_capture, args=(capture_instance, capture_stats), daemon=True)
     capture_thread.start()
-    print(f"Initiated packet capture on 'lo' for TCP port {port}")
+    print(f"Initiated {capture_backend} packet capture on 'lo' for TCP port {port}")
+
+    stop_reporting = threading.Event()
+    if report_interval > 0:
+        reporter = threading.Thread(target=report_progress, args=(capture_stats, report_interval, stop_reporting), daemon=True)
+        reporter.start()
 
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -105,16 +196,25 @@ def start_server(port, nagle_status, delayed_ack_status):
     server_socket.close()
 
     time.sleep(1)
+    stop_capture.set()
     capture_thread.join(timeout=2)
+    stop_reporting.set()
+    if ring is not None:
+        packets, drops = ring.statistics()
+        print(f"Ring capture: {packets} packets, {drops} dropped by the kernel")
+        ring.close()
 
-    metrics = evaluate_capture(packet_store)
+    metrics = evaluate_capture(capture_stats)
     print(f"Total bytes received: {bytes_received} bytes")
     print(f"Raw throughput (including headers): {metrics['raw_throughput']:.2f} bytes/second")
-    print(f"Goodput (TCP payload only): {metrics['goodput']:.2f} bytes/second")
+    print(f"Goodput (TCP payload, each byte once): {metrics['goodput']:.2f} bytes/second")
     print(f"Largest TCP payload size: {metrics['max_payload']} bytes")
-    print(f"Approximate packet loss rate: {metrics['packet_loss_rate']:.2f}%")
+    print(f"Approximate packet loss rate: {metrics['packet_loss_rate']:.2f}% "
+          f"({metrics['retransmissions']} retransmitted, {metrics['spurious_retransmissions']} spurious, "
+          f"{metrics['out_of_order']} out of order)")
+    print(f"Duplicate ACKs: {metrics['dup_acks']}, segments with SACK blocks: {metrics['sack_segments']}")
 
-def start_client(host, port, nagle_status, delayed_ack_status):
+def start_client(host, port, nagle_status, delayed_ack_status, write_size=40, write_interval=1.0, total_size=4096):
     client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     set_socket_options(client_socket, nagle_status, delayed_ack_status)
 
@@ -125,8 +225,8 @@ def start_client(host, port, nagle_status, delayed_ack_status):
         print("Connection failed:", error)
         return
 
-    message = b'A' * 4096
-    chunk_size = 40
+    message = b'A' * total_size
+    chunk_size = write_size
     total_chunks = len(message) // chunk_size
     for i in range(total_chunks):
         segment = message[i * chunk_size:(i + 1) * chunk_size]
@@ -135,30 +235,177 @@ def start_client(host, port, nagle_status, delayed_ack_status):
         except Exception as error:
             print("Error sending data:", error)
             break
-        time.sleep(1)
+        time.sleep(write_interval)
     remaining_bytes = len(message) % chunk_size
     if remaining_bytes:
         client_socket.sendall(message[total_chunks * chunk_size:])
     client_socket.close()
 
+MATRIX_CONFIGS = [
+    ("enabled", "enabled"),
+    ("enabled", "disabled"),
+    ("disabled", "enabled"),
+    ("disabled", "disabled"),
+]
+
+# struct tcp_info offsets (linux/tcp.h)
+TCPI_SEGS_IN = 140
+TCPI_DATA_SEGS_OUT = 156
+
+def tcp_info_counters(sock):
+    info = sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, 256)
+    if len(info) < TCPI_DATA_SEGS_OUT + 4:
+        return None, None
+    segs_in = struct.unpack_from('I', info, TCPI_SEGS_IN)[0]
+    data_segs_out = struct.unpack_from('I', info, TCPI_DATA_SEGS_OUT)[0]
+    return data_segs_out, segs_in
+
+def matrix_receiver(server_socket, nagle_status, delayed_ack_status, total_size, arrivals):
+    connection, _ = server_socket.accept()
+    set_socket_options(connection, nagle_status, delayed_ack_status)
+    received = 0
+    while received < total_size:
+        chunk = connection.recv(65536)
+        now = time.perf_counter()
+        if not chunk:
+            break
+        received += len(chunk)
+        arrivals.append((received, now))
+        # TCP_QUICKACK is cleared by the kernel after use, so it has to be
+        # re-armed after every read to keep delayed ACKs off.
+        if delayed_ack_status == 'disabled' and hasattr(socket, 'TCP_QUICKACK'):
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+    connection.close()
+
+def matrix_sender(port, nagle_status, delayed_ack_status, write_size, write_interval, total_size, result):
+    client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    set_socket_options(client_socket, nagle_status, delayed_ack_status)
+    client_socket.connect(('127.0.0.1', port))
+    writes = []
+    sent = 0
+    start = time.perf_counter()
+    while sent < total_size:
+        size = min(write_size, total_size - sent)
+        writes.append((sent + size, time.perf_counter()))
+        client_socket.sendall(b'A' * size)
+        sent += size
+        if sent < total_size:
+            time.sleep(write_interval)
+    result['elapsed'] = time.perf_counter() - start
+    # Let the last segments and their ACKs land before reading the counters
+    time.sleep(0.25)
+    result['data_segs_out'], result['segs_in'] = tcp_info_counters(client_socket)
+    result['writes'] = writes
+    client_socket.close()
+
+def write_latencies(writes, arrivals):
+    # A write is delivered by the first read whose running byte count
+    # reaches the write's last byte.
+    received = [count for count, _ in arrivals]
+    latencies = []
+    for end, written_at in writes:
+        i = bisect.bisect_left(received, end)
+        if i < len(arrivals):
+            latencies.append(arrivals[i][1] - written_at)
+    return latencies
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))]
+
+def latency_histogram(latencies):
+    # Power-of-two buckets in microseconds
+    buckets = {}
+    for latency in latencies:
+        bucket = max(0, int(latency * 1e6)).bit_length()
+        buckets[bucket] = buckets.get(bucket, 0) + 1
+    lines = []
+    peak = max(buckets.values()) if buckets else 1
+    for bucket in sorted(buckets):
+        low = 0 if bucket == 0 else 1 << (bucket - 1)
+        lines.append(f"    {low:>8}-{(1 << bucket) - 1:<8}us {buckets[bucket]:>6} {'#' * max(1, buckets[bucket] * 40 // peak)}")
+    return lines
+
+def run_matrix(base_port, write_size, write_interval, total_size):
+    runs = []
+    for i, (nagle_status, delayed_ack_status) in enumerate(MATRIX_CONFIGS):
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server_socket.bind(('127.0.0.1', base_port + i))
+        server_socket.listen(1)
+        arrivals = []
+        result = {}
+        threads = [
+            threading.Thread(target=matrix_receiver, daemon=True,
+                             args=(server_socket, nagle_status, delayed_ack_status, total_size, arrivals)),
+            threading.Thread(target=matrix_sender, daemon=True,
+                             args=(base_port + i, nagle_status, delayed_ack_status, write_size,
+                                   write_interval, total_size, result)),
+        ]
+        runs.append((nagle_status, delayed_ack_status, server_socket, threads, arrivals, result))
+
+    print(f"Running {len(runs)} configurations on 127.0.0.1:{base_port}-{base_port + len(runs) - 1} "
+          f"({total_size} bytes in {write_size}-byte writes every {write_interval}s)")
+    for run in runs:
+        for thread in run[3]:
+            thread.start()
+    for run in runs:
+        for thread in run[3]:
+            thread.join()
+        run[2].close()
+
+    for nagle_status, delayed_ack_status, _, _, arrivals, result in runs:
+        writes = result.get('writes', [])
+        latencies = sorted(write_latencies(writes, arrivals))
+        print(f"\nNagle = {nagle_status}, Delayed-ACK = {delayed_ack_status}")
+        print(f"  writes: {len(writes)}, reads: {len(arrivals)}, elapsed: {result.get('elapsed', 0):.2f}s")
+        if latencies:
+            print(f"  write->read latency: p50 {percentile(latencies, 50) * 1000:.3f} ms, "
+                  f"p99 {percentile(latencies, 99) * 1000:.3f} ms, max {latencies[-1] * 1000:.3f} ms")
+            for line in latency_histogram(latencies):
+                print(line)
+        if result.get('data_segs_out') is not None and writes:
+            print(f"  data segments per write: {result['data_segs_out'] / len(writes):.3f}, "
+                  f"segments received by sender (ACKs) per write: {result['segs_in'] / len(writes):.3f}")
+        if result.get('elapsed'):
+            print(f"  goodput: {total_size / result['elapsed']:.2f} bytes/second")
+
 def main():
     parser = argparse.ArgumentParser(description="TCP connection test utility")
-    parser.add_argument("--mode", choices=["server", "client"], required=True,
-                        help="Run in 'server' or 'client' mode.")
+    parser.add_argument("--mode", choices=["server", "client", "matrix"], required=True,
+                        help="Run in 'server' or 'client' mode, or 'matrix' to run all four "
+                             "Nagle/delayed-ACK combinations concurrently over loopback.")
     parser.add_argument("--host", default="172.21.124.53",
                         help="Server hostname (used in client mode).")
     parser.add_argument("--port", type=int, default=12345,
                         help="Port number for connection.")
-    parser.add_argument("--nagle", choices=["enabled", "disabled"], required=True,
-                        help="Enable or disable Nagle's algorithm.")
-    parser.add_argument("--delayed_ack", choices=["enabled", "disabled"], required=True,
-                        help="Enable or disable delayed ACK behavior.")
+    parser.add_argument("--nagle", choices=["enabled", "disabled"],
+                        help="Enable or disable Nagle's algorithm (server and client mode).")
+    parser.add_argument("--delayed_ack", choices=["enabled", "disabled"],
+                        help="Enable or disable delayed ACK behavior (server and client mode).")
+    parser.add_argument("--write_size", type=int, default=40,
+                        help="Bytes per write in client and matrix mode.")
+    parser.add_argument("--write_interval", type=float, default=1.0,
+                        help="Seconds between writes in client and matrix mode.")
+    parser.add_argument("--total_size", type=int, default=4096,
+                        help="Total bytes to send in client and matrix mode.")
+    parser.add_argument("--report_interval", type=float, default=5.0,
+                        help="Seconds between running throughput/goodput/loss reports (0 disables).")
+    parser.add_argument("--capture", choices=["ring", "pyshark"], default="ring",
+                        help="Server mode packet capture: an in-process TPACKET_V3 ring (needs root) "
+                             "or tshark through pyshark.")
     args = parser.parse_args()
+    if args.mode != "matrix" and (args.nagle is None or args.delayed_ack is None):
+        parser.error("--nagle and --delayed_ack are required in server and client mode")
     
-    if args.mode == "server":
-        start_server(args.port, args.nagle, args.delayed_ack)
+    if args.mode == "matrix":
+        run_matrix(args.port, args.write_size, args.write_interval, args.total_size)
+    elif args.mode == "server":
+        start_server(args.port, args.nagle, args.delayed_ack, args.report_interval, args.capture)
     else:
-        start_client(args.host, args.port, args.nagle, args.delayed_ack)
+        start_client(args.host, args.port, args.nagle, args.delayed_ack,
+                     args.write_size, args.write_interval, args.total_size)
 
 if __name__ == "__main__":
     main()
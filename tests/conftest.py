@@ -0,0 +1,34 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROBLEM_DIRS = {os.path.join(ROOT, name) for name in ('problem1', 'problem2', 'problem3')}
+
+
+def forget_problem_modules():
+    for name, module in list(sys.modules.items()):
+        if os.path.dirname(getattr(module, '__file__', None) or '') in PROBLEM_DIRS:
+            del sys.modules[name]
+
+
+@pytest.fixture
+def load():
+    # The problem directories are separate sets of scripts: their modules
+    # import siblings by bare name, and names repeat across directories
+    # (capture_cache, seq_tracker). load('problem2', 'pcap_reader') imports
+    # from one directory with it first on the path, after forgetting what an
+    # earlier call imported; modules already handed out keep working.
+    saved_path = list(sys.path)
+
+    def load(directory, *names):
+        forget_problem_modules()
+        sys.path.insert(0, os.path.join(ROOT, directory))
+        modules = [importlib.import_module(name) for name in names]
+        return modules[0] if len(modules) == 1 else modules
+
+    yield load
+    sys.path[:] = saved_path
+    forget_problem_modules()
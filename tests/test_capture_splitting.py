@@ -0,0 +1,206 @@
+import gzip
+import random
+import struct
+
+import numpy as np
+import pytest
+
+PCAP_MAGIC_USEC = 0xa1b2c3d4
+PCAP_MAGIC_NSEC = 0xa1b23c4d
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+ETHERNET_IPV4 = bytes(12) + b'\x08\x00'
+ETHERNET_ARP = bytes(12) + b'\x08\x06'
+SNAPLEN = 96
+START = 1_700_000_000
+
+
+def tcp_packet(i, payload_len, flags=0x18):
+    ip = struct.pack('>BBHHHBBHII', 0x45, 0, 40 + payload_len, i & 0xffff, 0x4000, 64, 6, 0,
+                     0x0a000001 + i % 5, 0x0a000002)
+    tcp = struct.pack('>HHIIBBHHH', 5000 + i % 11, 80, (i * 1448) & 0xffffffff, i * 7, 0x50, flags, 1000, 0, 0)
+    return ip + tcp + bytes(payload_len)
+
+
+def frames(count, seed=0):
+    # (frame, original length): runs of snaplen-cut data segments and of bare
+    # ACKs, as in a bulk transfer, broken up by odd lengths and non-IP frames
+    rng = random.Random(seed)
+    out = []
+    i = 0
+    while len(out) < count:
+        kind = rng.choice(['data', 'acks', 'mixed'])
+        for _ in range(rng.choice([3, 20, 300, 1500])):
+            if kind == 'data':
+                frame = ETHERNET_IPV4 + tcp_packet(i, 1448)
+            elif kind == 'acks':
+                frame = ETHERNET_IPV4 + tcp_packet(i, 0, 0x10)
+            elif rng.random() < 0.1:
+                frame = ETHERNET_ARP + bytes(28)
+            else:
+                frame = ETHERNET_IPV4 + tcp_packet(i, rng.randrange(0, 60))
+            out.append((frame[:SNAPLEN], len(frame)))
+            i += 1
+    return out[:count]
+
+
+def ticks(i, units):
+    return START * units + i * 1234
+
+
+def pcap_bytes(records, endian='<', nsec=False):
+    units = 10 ** 9 if nsec else 10 ** 6
+    out = [struct.pack(endian + 'IHHiIII', PCAP_MAGIC_NSEC if nsec else PCAP_MAGIC_USEC, 2, 4, 0, 0, SNAPLEN,
+                       LINKTYPE_ETHERNET)]
+    for i, (frame, length) in enumerate(records):
+        t = ticks(i, units)
+        out.append(struct.pack(endian + 'IIII', t // units, t % units, len(frame), length) + frame)
+    return b''.join(out)
+
+
+def pcapng_block(endian, block_type, body):
+    body += bytes(-len(body) % 4)
+    length = 12 + len(body)
+    return struct.pack(endian + 'II', block_type, length) + body + struct.pack(endian + 'I', length)
+
+
+def pcapng_bytes(sections):
+    # sections: (endian, [(linktype, if_tsresol or None)], records); records
+    # alternate between the section's interfaces
+    out = []
+    n = 0
+    for endian, interfaces, records in sections:
+        out.append(pcapng_block(endian, 0x0a0d0d0a, struct.pack(endian + 'IHHq', 0x1a2b3c4d, 1, 0, -1)))
+        for linktype, resol in interfaces:
+            options = b''
+            if resol is not None:
+                options = struct.pack(endian + 'HHB3x', 9, 1, resol) + struct.pack(endian + 'HH', 0, 0)
+            out.append(pcapng_block(endian, 1, struct.pack(endian + 'HHI', linktype, 0, SNAPLEN) + options))
+        for i, (frame, length) in enumerate(records):
+            if_id = i % len(interfaces)
+            linktype, resol = interfaces[if_id]
+            if linktype == LINKTYPE_RAW:
+                frame = frame[len(ETHERNET_IPV4):]
+                length -= len(ETHERNET_IPV4)
+            t = ticks(n, 10 ** (resol or 6))
+            out.append(pcapng_block(endian, 6, struct.pack(endian + 'IIIII', if_id, t >> 32, t & 0xffffffff,
+                                                           len(frame), length) + frame))
+            n += 1
+    return b''.join(out)
+
+
+def multi_section():
+    return pcapng_bytes([
+        ('<', [(LINKTYPE_ETHERNET, None), (LINKTYPE_RAW, 9)], frames(2000, 1)),
+        ('>', [(LINKTYPE_ETHERNET, 9)], frames(1500, 2)),
+        ('<', [(LINKTYPE_RAW, None), (LINKTYPE_ETHERNET, 6)], frames(1000, 3)),
+    ])
+
+
+CAPTURES = {
+    'pcap': lambda: pcap_bytes(frames(4000)),
+    'pcap_big_endian': lambda: pcap_bytes(frames(4000), '>'),
+    'pcap_nsec': lambda: pcap_bytes(frames(4000), nsec=True),
+    'pcap_truncated_header': lambda: pcap_bytes(frames(4000))[:-(16 + SNAPLEN) - 7],
+    'pcap_truncated_body': lambda: pcap_bytes(frames(4000))[:-30],
+    'pcapng_sections': multi_section,
+    'pcapng_truncated': lambda: multi_section()[:-50],
+}
+
+
+@pytest.fixture(params=sorted(CAPTURES))
+def capture(request, tmp_path):
+    name = request.param
+    path = tmp_path / ('capture.pcapng' if name.startswith('pcapng') else 'capture.pcap')
+    path.write_bytes(CAPTURES[name]())
+    return str(path)
+
+
+def reference_pcap_walk(data):
+    # One record header at a time, stopping at the first incomplete record
+    endian = '<' if struct.unpack_from('<I', data, 0)[0] in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC) else '>'
+    units = 10 ** 9 if struct.unpack_from(endian + 'I', data, 0)[0] == PCAP_MAGIC_NSEC else 10 ** 6
+    offsets, caplens, timestamps = [], [], []
+    pos = 24
+    while pos + 16 <= len(data):
+        sec, frac, caplen, _ = struct.unpack_from(endian + 'IIII', data, pos)
+        if pos + 16 + caplen > len(data):
+            break
+        offsets.append(pos + 16)
+        caplens.append(caplen)
+        timestamps.append((sec * units + frac) / units)
+        pos += 16 + caplen
+    return offsets, caplens, timestamps
+
+
+@pytest.mark.parametrize('endian', ['<', '>'])
+@pytest.mark.parametrize('nsec', [False, True])
+@pytest.mark.parametrize('cut', [0, 5, 16 + 40, 16 + SNAPLEN + 3])
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_pcap_index_matches_reference_walk(load, endian, nsec, cut, seed):
+    pcap_columns = load('problem1', 'pcap_columns')
+    data = pcap_bytes(frames(5000, seed), endian, nsec)
+    data = data[:len(data) - cut]
+    index = pcap_columns.index_records(data)
+    offsets, caplens, timestamps = reference_pcap_walk(data)
+    np.testing.assert_array_equal(index.offsets, offsets)
+    np.testing.assert_array_equal(index.caplens, caplens)
+    np.testing.assert_array_equal(index.timestamps, timestamps)
+
+
+def test_pcap_index_of_one_long_run(load):
+    # Longer than RUN_MAX, so the guess saturates and the last one runs short
+    pcap_columns = load('problem1', 'pcap_columns')
+    frame = ETHERNET_IPV4 + tcp_packet(0, 0, 0x10)
+    data = pcap_bytes([(frame, len(frame))] * (pcap_columns.RUN_MAX * 2 + 77))
+    offsets, caplens, timestamps = reference_pcap_walk(data)
+    index = pcap_columns.index_records(data)
+    np.testing.assert_array_equal(index.offsets, offsets)
+    np.testing.assert_array_equal(index.caplens, caplens)
+
+
+def test_problem1_columns_same_with_workers(load, capture, monkeypatch):
+    pcap_columns = load('problem1', 'pcap_columns')
+    monkeypatch.setattr(pcap_columns, 'CHUNK_RECORDS', 512)
+    single, single_scales = pcap_columns.read_tcp_columns(capture, with_window_scales=True)
+    sharded, sharded_scales = pcap_columns.read_tcp_columns(capture, with_window_scales=True, workers=3)
+    assert len(single) > 0
+    np.testing.assert_array_equal(single, sharded)
+    assert single_scales == sharded_scales
+
+
+def record_list(records):
+    return [(timestamp, linktype, bytes(data[offset:offset + caplen]))
+            for timestamp, linktype, data, offset, caplen in records]
+
+
+@pytest.mark.parametrize('parts', [2, 3, 7])
+def test_ranges_hold_the_records_in_order(load, capture, parts):
+    pcap_reader = load('problem2', 'pcap_reader')
+    with open(capture, 'rb') as f:
+        whole = record_list(pcap_reader.iter_records(f))
+    ranges = pcap_reader.split_records(capture, parts)
+    assert len(ranges) > 1
+    joined = []
+    for start, stop, state in ranges:
+        with open(capture, 'rb') as f:
+            joined.extend(record_list(pcap_reader.iter_range(f, start, stop, state)))
+    assert joined == whole
+
+
+@pytest.mark.parametrize('workers', [2, 3, 7])
+def test_problem2_columns_same_with_workers(load, capture, workers):
+    capture_cache = load('problem2', 'capture_cache')
+    single = capture_cache.build_columns(capture)
+    sharded = capture_cache.build_columns(capture, workers)
+    assert len(single['timestamp']) > 0
+    for name in capture_cache.COLUMNS:
+        np.testing.assert_array_equal(single[name], sharded[name])
+
+
+def test_compressed_capture_stays_whole(load, tmp_path):
+    pcap_reader = load('problem2', 'pcap_reader')
+    path = tmp_path / 'capture.pcap.gz'
+    with gzip.open(path, 'wb') as f:
+        f.write(pcap_bytes(frames(500)))
+    assert pcap_reader.split_records(str(path), 4) == [(0, None, None)]
@@ -0,0 +1,132 @@
+import random
+
+import numpy as np
+import pytest
+
+A = 0x0a000001
+B = 0x0a000002
+ACK = 0x10
+MSS = 1000
+WRAP_BASE = (1 << 32) - 2500
+
+
+def data(t, seq, length=MSS, port=5000):
+    return (t, A, port, B, 80, seq & 0xffffffff, 1, ACK, 100, length)
+
+
+def ack(t, number, window=100, port=5000):
+    return (t, B, 80, A, port, 1, number & 0xffffffff, ACK, window, 0)
+
+
+# (name, rows, expected kinds); rows are (ts, src, sport, dst, dport, seq,
+# ack, flags, window, payload_len) in capture order
+FLOWS = [
+    ('wraparound', [
+        data(0.000, WRAP_BASE),
+        data(0.001, WRAP_BASE + 1000),
+        data(0.002, WRAP_BASE + 2000),          # crosses 2**32
+        data(0.003, WRAP_BASE + 3000),
+        ack(0.010, WRAP_BASE + 2000),
+        data(0.050, WRAP_BASE + 1000),          # already acknowledged
+        data(0.060, WRAP_BASE + 3000),          # seen but not acknowledged
+    ], ['new', 'new', 'new', 'new', 'no_data', 'spurious', 'retransmission']),
+    ('holes', [
+        data(0.000, 0),
+        data(0.001, 2000),                      # leaves [1000, 2000) open
+        data(0.002, 1000),                      # within the reordering window
+        data(0.100, 4000),                      # leaves [3000, 4000) open
+        data(0.200, 3000),                      # long after the hole opened
+        data(0.300, 4500),                      # half old, half new
+    ], ['new', 'new', 'out_of_order', 'new', 'retransmission', 'retransmission']),
+    ('partial_fill', [
+        data(0.000, 0),
+        data(0.001, 3000),                      # leaves [1000, 3000) open
+        data(0.100, 1500),                      # fills the middle of it
+        data(0.101, 1000, 500),
+        data(0.102, 2500, 500),
+    ], ['new', 'new', 'retransmission', 'retransmission', 'retransmission']),
+    ('early_ack', [
+        ack(0.000, 1100, port=5001),            # capture starts mid-connection
+        data(0.100, 1000, 100, port=5001),
+        data(0.200, 1000, 100, port=5001),
+    ], ['no_data', 'new', 'spurious']),
+    ('dup_acks', [
+        data(0.000, 0),
+        data(0.001, 2000),
+        ack(0.002, 1000),
+        ack(0.003, 1000),
+        ack(0.004, 1000),
+        ack(0.005, 1000, window=200),           # window update, not a duplicate
+        data(0.010, 1000),
+        ack(0.011, 3000),
+    ], ['new', 'new', 'no_data', 'no_data', 'no_data', 'no_data', 'retransmission', 'no_data']),
+]
+
+
+@pytest.fixture
+def trackers(load):
+    seq_tracker, pcap_columns = load('problem1', 'seq_tracker', 'pcap_columns')
+    streaming = load('problem3', 'seq_tracker')
+    return seq_tracker, pcap_columns.PACKET_DTYPE, streaming
+
+
+def vectorized(trackers, rows):
+    seq_tracker, packet_dtype, _ = trackers
+    packets = np.zeros(len(rows), dtype=packet_dtype)
+    for name, column in zip(['ts', 'src_ip', 'src_port', 'dst_ip', 'dst_port', 'seq', 'ack', 'flags', 'window',
+                             'payload_len'], zip(*rows)):
+        packets[name] = column
+    segments = seq_tracker.track_segments(packets)
+    kinds = [seq_tracker.SEGMENT_KINDS[kind] for kind in segments['kind'].tolist()]
+    return kinds, segments['new_bytes'].tolist(), segments['dup_ack'].tolist()
+
+
+def streaming(trackers, rows):
+    module = trackers[2]
+    tracker = module.SequenceTracker()
+    kinds, new_bytes, dup_acks = [], [], []
+    for row in rows:
+        before = dict(tracker.totals)
+        kinds.append(module.SEGMENT_KINDS[tracker.update(*row)])
+        new_bytes.append(tracker.totals['new_bytes'] - before['new_bytes'])
+        dup_acks.append(tracker.totals['dup_acks'] > before['dup_acks'])
+    return kinds, new_bytes, dup_acks
+
+
+@pytest.mark.parametrize('name, rows, expected', FLOWS, ids=[flow[0] for flow in FLOWS])
+def test_hand_built_flows(trackers, name, rows, expected):
+    whole = vectorized(trackers, rows)
+    live = streaming(trackers, rows)
+    assert whole[0] == expected
+    assert live == whole
+
+
+def test_flows_interleaved(trackers):
+    # Each flow on its own ports, all of them mixed in time: keying by the
+    # 4-tuple must keep every classification as it was
+    rows = []
+    for i, (_, flow, _) in enumerate(FLOWS):
+        for t, src, sport, dst, dport, *rest in flow:
+            rows.append((t, src, sport + 10 * i, dst, dport + 10 * i, *rest))
+    rows.sort(key=lambda row: row[0])
+    assert streaming(trackers, rows) == vectorized(trackers, rows)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_random_flows(trackers, seed):
+    # Resends, reordering and ACKs at random around a random (often
+    # wrapping) initial sequence number, on a few flows at once
+    rng = random.Random(seed)
+    rows = []
+    t = 0.0
+    bases = {port: rng.choice([rng.randrange(1 << 32), (1 << 32) - rng.randrange(1, 5000)])
+             for port in (5000, 5001, 5002)}
+    for _ in range(200):
+        t += rng.choice([0.0005, 0.002, 0.01])
+        port = rng.choice(list(bases))
+        base = bases[port]
+        if rng.random() < 0.4:
+            rows.append(ack(t, base + rng.randrange(0, 6000), rng.choice([100, 200]), port=port))
+        else:
+            rows.append(data(t, base + rng.randrange(0, 60) * 100, rng.choice([100, 200, 300]), port=port))
+    assert streaming(trackers, rows) == vectorized(trackers, rows)